@@ -1,8 +1,26 @@
-from .helpers import dynamic_queryset
+from .budgets import QueryBudget, QueryBudgetExceeded
+from .helpers import dynamic_queryset, resolve_dynamic_querysets
 from .mixins import (
     DynamicFieldsMixin,
     DynamicPermissionClassesMixin,
     DynamicQuerySetMixin,
+    DynamicResponseCacheMixin,
     DynamicSerializerClassMixin,
+    DynamicStreamingListMixin,
 )
-from .specs import DynamicAnnotation, DynamicPrefetch, DynamicSelect
+from .pagination import (
+    DynamicCursorPagination,
+    DynamicLimitOffsetPagination,
+    DynamicPageNumberPagination,
+)
+from .planner import CostPlanner
+from .resolvers import BatchedField
+from .responses import DjangoResponseCache, LocalResponseCache
+from .specs import (
+    DynamicAggregate,
+    DynamicAnnotation,
+    DynamicBatchLoad,
+    DynamicPrefetch,
+    DynamicSelect,
+)
+from .trees import FieldTree
@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+from django.db import models
+
+from .batches import get_prefetch_attrs, iter_related
+from .helpers import get_relation_field
+
+AGGREGATE_FUNCTIONS = {
+    "count": models.Count,
+    "exists": models.Count,
+    "sum": models.Sum,
+    "min": models.Min,
+    "max": models.Max,
+}
+
+EMPTY_AGGREGATES = {"count": 0, "exists": False}
+
+
+def get_parent_attrs(spec, prefetches):
+    """
+    The attribute names leading from a root instance to the instances,
+    that the aggregate `spec` is computed for.
+    """
+    if spec.parent_prefetch_path is None:
+        return ()
+    return get_prefetch_attrs(prefetches[spec.parent_prefetch_path], prefetches)
+
+
+def aggregate_values(function, values):
+    """
+    Computes the aggregate of the `values` in the same way as the database does.
+    """
+    values = [value for value in values if value is not None]
+    if function == "count":
+        return len(values)
+    if function == "exists":
+        return bool(values)
+    if not values:
+        return None
+    return {"sum": sum, "min": min, "max": max}[function](values)
+
+
+class AggregateLoad(
+    namedtuple("AggregateLoad", ("path", "attrs", "spec", "prefetched"))
+):
+    """
+    Computes the aggregate of the related collection of the instances
+    at `attrs`, and sets it as the attribute named after the `path`.
+    If the collection is `prefetched` by the same plan, it's computed in memory,
+    otherwise with a single grouped query for all the instances.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self.path.rsplit(".", 1)[-1]
+
+    def load(self, instances, instrument=None):
+        parents = iter_related(instances, self.attrs)
+        if not parents:
+            return
+        if self.prefetched:
+            self.load_prefetched(parents)
+        else:
+            self.load_grouped(parents, instrument)
+
+    def load_prefetched(self, parents):
+        spec = self.spec
+        for parent in parents:
+            setattr(
+                parent,
+                self.name,
+                aggregate_values(
+                    spec.function,
+                    (
+                        getattr(related, spec.field)
+                        for related in getattr(parent, spec.lookup).all()
+                    ),
+                ),
+            )
+
+    def load_grouped(self, parents, instrument):
+        spec = self.spec
+        relation = get_relation_field(type(parents[0]), spec.lookup)
+        assert relation is not None and relation.one_to_many, (
+            f"The aggregated '{spec.lookup}' of {type(parents[0]).__name__} "
+            "has to be a reverse foreign key."
+        )
+        field = relation.field
+        target_attname = field.target_field.attname
+        queryset = (
+            relation.related_model._default_manager.all()
+            if spec.queryset is None
+            else spec.queryset.all()
+        )
+        queryset = (
+            queryset.filter(
+                **{
+                    f"{field.name}__in": {
+                        getattr(parent, target_attname) for parent in parents
+                    }
+                }
+            )
+            .order_by()
+            .values(field.name)
+            .annotate(value=AGGREGATE_FUNCTIONS[spec.function](spec.field))
+        )
+        if instrument is not None:
+            queryset = instrument(queryset, self.path)
+        values = {row[field.name]: row["value"] for row in queryset}
+        default = EMPTY_AGGREGATES.get(spec.function)
+        for parent in parents:
+            value = values.get(getattr(parent, target_attname), default)
+            if spec.function == "exists":
+                value = bool(value)
+            setattr(parent, self.name, value)
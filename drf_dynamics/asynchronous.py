@@ -0,0 +1,75 @@
+import asyncio
+import inspect
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db.models import QuerySet, prefetch_related_objects
+from django.db.models.query import ModelIterable
+
+# The async ORM is only available since Django 4.1.
+HAS_ASYNC_ORM = hasattr(QuerySet, "aiterator")
+
+
+def call_sync(function, *args):
+    """
+    Calls the `function` from the sync code, whether it's a coroutine function.
+    """
+    if asyncio.iscoroutinefunction(function):
+        return async_to_sync(function)(*args)
+    return function(*args)
+
+
+async def call_async(function, *args):
+    """
+    Calls the `function` from the async code, whether it's a coroutine function.
+    The sync functions are expected to build the querysets lazily,
+    so those are called right away.
+    """
+    result = function(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def afetch(queryset):
+    """
+    Fetches the instances of the `queryset` along with its prefetches,
+    the batch loads and the aggregates, which `aiterator` skips.
+    """
+    if not HAS_ASYNC_ORM:
+        return await sync_to_async(list)(queryset)
+    prefetch_lookups = queryset._prefetch_related_lookups
+    instances = [
+        instance async for instance in queryset.prefetch_related(None).aiterator()
+    ]
+    if prefetch_lookups and instances:
+        await sync_to_async(prefetch_related_objects)(instances, *prefetch_lookups)
+    batch_loader = getattr(queryset, "batch_loader", None)
+    if (
+        batch_loader is not None
+        and instances
+        and issubclass(queryset._iterable_class, ModelIterable)
+    ):
+        await sync_to_async(batch_loader.load)(instances)
+    return instances
+
+
+async def acall(function, *args):
+    """
+    Calls the sync `function` on the event loop, unless it needs to query
+    the database, in which case it's called again in a thread.
+    """
+    try:
+        return function(*args)
+    except SynchronousOnlyOperation:
+        return await sync_to_async(function)(*args)
+
+
+async def aserialize(serializer):
+    """
+    Returns the `data` of the `serializer`.
+    It's rendered on the event loop, unless it needs to query the database
+    (e.g. a relation, that isn't prefetched), in which case it's rendered again
+    in a thread.
+    """
+    return await acall(lambda: serializer.data)
@@ -0,0 +1,187 @@
+from collections import namedtuple
+
+from django.db.models import Manager, QuerySet
+from django.db.models.query import ModelIterable
+
+BatchLoad = namedtuple(
+    "BatchLoad", ("path", "attrs", "spec", "fragments", "only_fields")
+)
+BatchLoad.__new__.__defaults__ = (None, None)
+
+
+def get_batch_attrs(spec, prefetches):
+    """
+    The attribute names leading from a root instance to the foreign key
+    of the batch load `spec`, through its parent prefetches.
+    """
+    lookups = [spec.lookup]
+    parent_prefetch_path = spec.parent_prefetch_path
+    while parent_prefetch_path is not None:
+        prefetch = prefetches[parent_prefetch_path]
+        lookup = prefetch.lookup
+        if prefetch.to_attr is not None:
+            lookup = "__".join((*lookup.split("__")[:-1], prefetch.to_attr))
+        lookups.append(lookup)
+        parent_prefetch_path = prefetch.parent_prefetch_path
+    return tuple("__".join(reversed(lookups)).split("__"))
+
+
+def get_prefetch_attrs(prefetch, prefetches):
+    """
+    The attribute names leading from a root instance
+    to the objects fetched by the `prefetch` spec.
+    """
+    attrs = get_batch_attrs(prefetch, prefetches)
+    if prefetch.to_attr is not None:
+        attrs = (*attrs[:-1], prefetch.to_attr)
+    return attrs
+
+
+def merge_only_fields(only_fields):
+    """
+    The union of the `only()` fields of the batch loads sharing a query,
+    or `None`, if any of those needs all the columns.
+    """
+    merged_fields = set()
+    for fields in only_fields:
+        if fields is None:
+            return None
+        merged_fields.update(fields)
+    return merged_fields
+
+
+def iter_related(instances, attrs):
+    """
+    Follows the already fetched `attrs` of the `instances`,
+    yielding the instances at the end.
+    """
+    for attr in attrs:
+        related = []
+        for instance in instances:
+            value = getattr(instance, attr, None)
+            if value is None:
+                continue
+            if isinstance(value, Manager):
+                value = value.all()
+            if isinstance(value, (QuerySet, list)):
+                related.extend(value)
+            else:
+                related.append(value)
+        instances = related
+    return instances
+
+
+class BatchLoader:
+    """
+    Loads the instances, that the foreign keys of the `batch_loads` point to,
+    once all the other queries are run,
+    with a single `in_bulk` query per related model (or custom queryset).
+    Every related row is fetched once and its instance is shared
+    by all the instances pointing to it, no matter the path.
+    The batch loads nested under other ones are loaded in the subsequent rounds.
+    The instances, which representations are in the load's fragment cache,
+    aren't loaded.
+    The `aggregate_loads` are run last, once every instance is loaded.
+    """
+
+    def __init__(self, batch_loads, instrument=None, aggregate_loads=()):
+        self.instrument = instrument
+        self.aggregate_loads = aggregate_loads
+        paths = {batch_load.path for batch_load in batch_loads}
+        rounds = {}
+        for batch_load in batch_loads:
+            depth = sum(batch_load.path.startswith(f"{path}.") for path in paths)
+            rounds.setdefault(depth, []).append(batch_load)
+        self.rounds = [rounds[depth] for depth in sorted(rounds)]
+
+    def load(self, instances):
+        for batch_loads in self.rounds:
+            self.load_round(instances, batch_loads)
+        for aggregate_load in self.aggregate_loads:
+            aggregate_load.load(instances, self.instrument)
+
+    @staticmethod
+    def skip_cached_fragments(fragments, references):
+        """
+        Returns the `references`, which representations aren't cached.
+        The cached ones are looked up at once, and stored on the referencing
+        instances, so the serializer doesn't look those up again.
+        """
+        cached = fragments.get_many(
+            {value for _, field, value in references if field.target_field.primary_key},
+            fragments.get_versions(),
+        )
+        missing_references = []
+        for instance, field, value in references:
+            if field.target_field.primary_key:
+                fragments.set_looked_up(instance, field.name, cached.get(value))
+                if value in cached:
+                    continue
+            missing_references.append((instance, field, value))
+        return missing_references
+
+    def load_round(self, instances, batch_loads):
+        groups = {}
+        for batch_load in batch_loads:
+            *attrs, field_name = batch_load.attrs
+            references = []
+            for instance in iter_related(instances, attrs):
+                field = instance._meta.get_field(field_name)
+                value = getattr(instance, field.attname)
+                if value is not None:
+                    references.append((instance, field, value))
+            if batch_load.fragments is not None and references:
+                references = self.skip_cached_fragments(
+                    batch_load.fragments, references
+                )
+            for instance, field, value in references:
+                queryset = batch_load.spec.queryset
+                key = (
+                    field.related_model if queryset is None else queryset,
+                    field.target_field.name,
+                )
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = ({}, [])
+                group[0][batch_load.path] = batch_load.only_fields
+                group[1].append((instance, field, value))
+
+        for (source, target_field_name), (paths, references) in groups.items():
+            queryset = (
+                source._meta.default_manager.all()
+                if isinstance(source, type)
+                else source.all()
+            )
+            only_fields = merge_only_fields(paths.values())
+            if only_fields is not None:
+                queryset = queryset.only(*only_fields)
+            if self.instrument is not None:
+                queryset = self.instrument(queryset, "+".join(sorted(paths)))
+            related = queryset.in_bulk(
+                {value for _, _, value in references},
+                field_name=target_field_name,
+            )
+            for instance, field, value in references:
+                field.set_cached_value(instance, related.get(value))
+
+    def attach(self, queryset):
+        """
+        Makes the `queryset` run the batch loads once its instances are fetched.
+        """
+        queryset_class = type(queryset)
+        queryset.__class__ = type(
+            queryset_class.__name__,
+            (BatchLoadingQuerySet, queryset_class),
+            {"batch_loader": self},
+        )
+        return queryset
+
+
+class BatchLoadingQuerySet:
+    batch_loader = None
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if not fetched and issubclass(self._iterable_class, ModelIterable):
+            self.batch_loader.load(self._result_cache)
@@ -0,0 +1,113 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .trees import SEGMENT_PATTERN, FieldTree
+
+
+class QueryBudgetExceeded(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "The requested fields exceed the query budget."
+    default_code = "query_budget_exceeded"
+
+
+def get_segment_names(path):
+    return [SEGMENT_PATTERN.match(segment).group("name") for segment in path.split(".")]
+
+
+class QueryBudget:
+    """
+    The limits of the query plans compiled for the requested fields:
+    the `max_cost` of the plan's operations, weighted by their kind,
+    the `max_depth` of the requested paths and the `max_fields` amount of those.
+    Over budget requests are either rejected with `QueryBudgetExceeded`,
+    or, if `degrade` is set, the deepest and the most expensive paths are dropped,
+    until the plan fits the budget.
+    """
+
+    default_weights = {
+        "prefetch": 5,
+        "annotation": 3,
+        "aggregate": 3,
+        "select": 1,
+        "batch": 1,
+    }
+
+    def __init__(
+        self,
+        max_cost=None,
+        max_depth=None,
+        max_fields=None,
+        weights=None,
+        degrade=False,
+    ):
+        self.max_cost = max_cost
+        self.max_depth = max_depth
+        self.max_fields = max_fields
+        self.weights = {**self.default_weights, **(weights or {})}
+        self.degrade = degrade
+
+    def get_cost(self, plan):
+        return sum(self.weights.get(operation.tag, 0) for operation in plan.operations)
+
+    def get_violations(self, plan, requested_fields):
+        violations = []
+        paths = list(requested_fields.paths())
+        if self.max_fields is not None and len(paths) > self.max_fields:
+            violations.append(
+                f"{len(paths)} fields are requested, "
+                f"at most {self.max_fields} are allowed."
+            )
+        depth = max((len(path.split(".")) for path in paths), default=0)
+        if self.max_depth is not None and depth > self.max_depth:
+            violations.append(
+                f"The fields are nested {depth} levels deep, "
+                f"at most {self.max_depth} are allowed."
+            )
+        cost = self.get_cost(plan)
+        if self.max_cost is not None and cost > self.max_cost:
+            violations.append(
+                f"The requested fields cost {cost}, at most {self.max_cost} is allowed."
+            )
+        return violations
+
+    def truncate(self, requested_fields):
+        """
+        Drops the paths deeper than `max_depth`, and the ones past `max_fields`.
+        """
+        paths = list(requested_fields.paths())
+        if self.max_depth is not None:
+            paths = [path for path in paths if len(path.split(".")) <= self.max_depth]
+        if self.max_fields is not None:
+            paths = paths[: self.max_fields]
+        return FieldTree.parse(",".join(paths))
+
+    def get_prune_path(self, plan):
+        """
+        The path to drop from the requested fields, if the `plan` is over budget.
+        """
+        if self.max_cost is None or self.get_cost(plan) <= self.max_cost:
+            return None
+        paths = {
+            operation.path: self.weights.get(operation.tag, 0)
+            for operation in plan.operations
+            if operation.path is not None and self.weights.get(operation.tag, 0) > 0
+        }
+        if not paths:
+            return None
+        return max(paths, key=lambda path: (path.count("."), paths[path], path))
+
+
+def prune_tree(requested_fields, path):
+    """
+    Returns the `requested_fields` without the `path` and everything under it.
+    The fields requested without the nested fields, that the `path` goes through,
+    are dropped too, as those stand for all of their nested fields.
+    """
+    names = path.split(".")
+    kept_paths = []
+    for requested_path in requested_fields.paths():
+        requested_names = get_segment_names(requested_path)
+        depth = min(len(names), len(requested_names))
+        if requested_names[:depth] != names[:depth]:
+            kept_paths.append(requested_path)
+    return FieldTree.parse(",".join(kept_paths))
@@ -0,0 +1,103 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .instrumentation import get_current_recorder
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    """
+    A thread pool of `max_workers` threads, shared by all the querysets.
+    """
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(
+                max_workers, thread_name_prefix="drf_dynamics"
+            )
+        return executor
+
+
+def group_prefetch_lookups(lookups):
+    """
+    Groups the `lookups` by the relation of the root model those start with.
+    The nested prefetches of the plan are set on their parent's queryset,
+    so every group is an independent subtree.
+    """
+    groups = {}
+    for lookup in lookups:
+        prefetch_to = lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+        groups.setdefault(prefetch_to.split("__", 1)[0], []).append(lookup)
+    return list(groups.values())
+
+
+def run_prefetches(instances, lookups, recorder):
+    # Every thread has its own connections,
+    # which are closed once those outlive their `CONN_MAX_AGE`.
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            if recorder is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+            prefetch_related_objects(instances, *lookups)
+    finally:
+        close_old_connections()
+
+
+def prefetch_concurrently(instances, lookups, max_workers):
+    """
+    Runs the independent groups of the prefetch `lookups` of the `instances`
+    on the shared thread pool, and waits for all of those.
+    """
+    for instance in instances:
+        # Created upfront, so the threads don't replace each other's caches.
+        if not hasattr(instance, "_prefetched_objects_cache"):
+            instance._prefetched_objects_cache = {}
+    groups = group_prefetch_lookups(lookups)
+    recorder = get_current_recorder()
+    executor = get_executor(max_workers)
+    futures = [
+        executor.submit(run_prefetches, instances, group, recorder)
+        for group in groups[1:]
+    ]
+    # The first group is run by the calling thread, while it would wait anyway.
+    prefetch_related_objects(instances, *groups[0])
+    for future in futures:
+        future.result()
+
+
+class ConcurrentPrefetchQuerySet:
+    prefetch_workers = None
+
+    def _prefetch_related_objects(self):
+        lookups = self._prefetch_related_lookups
+        # The other connections wouldn't see the changes of the transaction.
+        if (
+            len(self._result_cache) < 1
+            or len(group_prefetch_lookups(lookups)) < 2
+            or transaction.get_connection(self.db).in_atomic_block
+        ):
+            return super()._prefetch_related_objects()
+        prefetch_concurrently(self._result_cache, lookups, self.prefetch_workers)
+        self._prefetch_done = True
+
+
+def attach_concurrent_prefetches(queryset, max_workers):
+    """
+    Makes the `queryset` run its independent prefetches concurrently,
+    on a thread pool of `max_workers` threads.
+    """
+    queryset_class = type(queryset)
+    queryset.__class__ = type(
+        queryset_class.__name__,
+        (ConcurrentPrefetchQuerySet, queryset_class),
+        {"prefetch_workers": max_workers},
+    )
+    return queryset
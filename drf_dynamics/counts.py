@@ -0,0 +1,62 @@
+import hashlib
+
+from django.db import connections
+
+
+def make_count_queryset(queryset, annotation_names):
+    """
+    Strips the queryset of everything, that doesn't affect the amount of rows:
+    the ordering, the selects, the prefetches
+    and the non aggregate annotations out of `annotation_names`.
+    The filters on those annotations stay intact,
+    since the conditions hold the annotation expressions themselves.
+    """
+    queryset = queryset.order_by().select_related(None).prefetch_related(None)
+    query = queryset.query
+    removed = {
+        name
+        for name in annotation_names
+        if name in query.annotations and not query.annotations[name].contains_aggregate
+    }
+    if removed:
+        for name in removed:
+            del query.annotations[name]
+        if query.annotation_select_mask is not None:
+            query.set_annotation_mask(query.annotation_select_mask - removed)
+        query._annotation_select_cache = None
+    return queryset
+
+
+def estimate_count(queryset):
+    """
+    The planner's estimate of the amount of rows of an unfiltered queryset.
+    Only supported on PostgreSQL, returns `None` otherwise,
+    or if the queryset is filtered, or the table wasn't analyzed yet.
+    """
+    query = queryset.query
+    if (
+        query.has_filters()
+        or query.distinct
+        or query.annotations
+        or query.low_mark
+        or query.high_mark is not None
+    ):
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def get_count_cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(repr((queryset.db, sql, params)).encode()).hexdigest()
+    return f"drf_dynamics:count:{digest}"
@@ -0,0 +1,82 @@
+import logging
+import warnings
+from collections import namedtuple
+
+from .helpers import get_relation_field
+
+logger = logging.getLogger("drf_dynamics")
+
+LazyLoad = namedtuple("LazyLoad", ("path", "queries", "spec_kind"))
+
+
+class NPlusOneWarning(UserWarning):
+    pass
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def get_spec_kind(model, path):
+    """
+    Returns the `dynamic_queryset` parameter, that the relation at the dotted `path`
+    belongs to (`"selects"` or `"prefetches"`),
+    or `None` if the path doesn't lead to a relation of the `model`.
+    """
+    relation = None
+    for name in path.split("."):
+        relation = get_relation_field(model, name)
+        if relation is None:
+            return None
+        model = relation.related_model
+    if relation.one_to_many or relation.many_to_many:
+        return "prefetches"
+    return "selects"
+
+
+def find_lazy_loads(recorder, model, prefetches, selects):
+    """
+    Returns a `LazyLoad` for every path of the `recorder`,
+    that had queries run while it was serialized.
+    The `spec_kind` is only set for the relations, which aren't planned yet.
+    """
+    lazy_loads = []
+    for path, metrics in recorder.metrics.items():
+        if not metrics.lazy_queries:
+            continue
+        spec_kind = None
+        if path is not None and path not in prefetches and path not in selects:
+            spec_kind = get_spec_kind(model, path)
+        lazy_loads.append(LazyLoad(path, metrics.lazy_queries, spec_kind))
+    return sorted(lazy_loads, key=lambda lazy_load: lazy_load.path or "")
+
+
+def get_lazy_load_message(lazy_load, view_name):
+    where = "the root" if lazy_load.path is None else f'"{lazy_load.path}"'
+    message = (
+        f"{lazy_load.queries} queries were run lazily "
+        f"while serializing {where} of {view_name}"
+    )
+    if lazy_load.spec_kind is not None:
+        message += (
+            f', add "{lazy_load.path}" to the {lazy_load.spec_kind}'
+            f" of its @dynamic_queryset"
+        )
+    return f"{message}."
+
+
+def report_lazy_loads(lazy_loads, view_name, mode):
+    """
+    Logs, warns about or raises the `lazy_loads`, depending on the `mode`
+    (`"log"`, `"warn"` or `"raise"`).
+    """
+    messages = [get_lazy_load_message(lazy_load, view_name) for lazy_load in lazy_loads]
+    if not messages:
+        return
+    if mode == "raise":
+        raise NPlusOneError(" ".join(messages))
+    for message in messages:
+        if mode == "warn":
+            warnings.warn(message, NPlusOneWarning)
+        else:
+            logger.warning(message)
@@ -0,0 +1,166 @@
+from collections import namedtuple
+
+from .helpers import get_relation_field
+from .responses import (
+    freeze_response_data,
+    get_model_label,
+    get_response_cache_key,
+    register_backend,
+)
+from .specs import DynamicBatchLoad
+
+# The representation of an instance, that was found in the fragment cache.
+CachedFragment = namedtuple("CachedFragment", ("data",))
+# An instance, which representation was looked up, but isn't cached.
+MissingFragment = namedtuple("MissingFragment", ("instance",))
+
+# The representations of the related instances, looked up by the batch loads,
+# by the field names, stored on the referencing instances.
+LOOKED_UP_FRAGMENTS = "_looked_up_fragments"
+
+
+class Fragments:
+    """
+    The cached representations of the instances of a serializer class
+    with the given requested fields.
+    Those are versioned by the models the serializer renders (`labels`),
+    so the saves and deletes of those models invalidate the representations.
+    """
+
+    def __init__(self, serializer_class, requested_fields, labels, backend, timeout):
+        self.serializer_class = serializer_class
+        self.requested_fields = requested_fields
+        self.labels = labels
+        self.backend = backend
+        self.timeout = timeout
+        register_backend(backend)
+
+    def get_versions(self):
+        return self.backend.get_versions(self.labels)
+
+    def get_key(self, pk, versions):
+        return get_response_cache_key(
+            (
+                self.serializer_class.__module__,
+                self.serializer_class.__qualname__,
+                pk,
+                None if self.requested_fields is None else str(self.requested_fields),
+                self.labels,
+                versions,
+            )
+        )
+
+    def get(self, pk, versions):
+        return self.backend.get(self.get_key(pk, versions))
+
+    def get_many(self, pks, versions):
+        """
+        The cached representations of the instances with the `pks`, by their pks,
+        looked up at once.
+        """
+        keys = {self.get_key(pk, versions): pk for pk in pks}
+        return {keys[key]: data for key, data in self.backend.get_many(keys).items()}
+
+    @staticmethod
+    def set_looked_up(instance, field_name, data):
+        """
+        Stores the representation of the related instance of the `instance`,
+        or `None`, if it isn't cached, for the serializer to not look it up again.
+        """
+        instance.__dict__.setdefault(LOOKED_UP_FRAGMENTS, {})[field_name] = data
+
+    def set(self, pk, versions, data):
+        self.backend.set(
+            self.get_key(pk, versions), freeze_response_data(data), self.timeout
+        )
+
+
+def collect_serializer_models(serializer, models):
+    """
+    Collects the models, that the readable fields of the `serializer`
+    and its nested serializers render.
+    """
+    model = getattr(getattr(serializer, "Meta", None), "model", None)
+    if model is not None:
+        models.add(model)
+    for field in serializer._readable_fields:
+        if model is not None and len(field.source_attrs) == 1:
+            relation = get_relation_field(model, field.source_attrs[0])
+            if relation is not None:
+                models.add(relation.related_model)
+        field = getattr(field, "child", field)
+        if hasattr(field, "_readable_fields"):
+            collect_serializer_models(field, models)
+    return models
+
+
+def get_serializer_labels(serializer):
+    models = collect_serializer_models(serializer, set())
+    return tuple(sorted({get_model_label(model) for model in models}))
+
+
+def collect_fragments(serializer, fragments):
+    """
+    Collects the `Fragments` of the nested serializers with a fragment cache
+    into the `fragments`, a mapping of their paths.
+    """
+    for field in serializer._readable_fields:
+        field = getattr(field, "child", field)
+        if getattr(field, "fragment_cache", None) is not None:
+            fragments[field.field_path] = field._fragments
+        elif hasattr(field, "_readable_fields"):
+            collect_fragments(field, fragments)
+    return fragments
+
+
+def get_parent_model(root_model, prefetches, spec):
+    if spec.parent_prefetch_path is None:
+        return root_model
+    queryset = prefetches[spec.parent_prefetch_path].queryset
+    return None if queryset is None else queryset.model
+
+
+def apply_fragments(fragments, root_model, prefetches, annotations, selects, batches):
+    """
+    Returns the `prefetches`, `annotations`, `selects` and `batches` specs,
+    where the selects of the fragment cached paths are turned into batch loads,
+    which skip the cached instances, and the specs nested under those are dropped,
+    since their fields are a part of the cached representations.
+    Only the selects of a forward relation may be turned.
+    """
+    paths = set()
+    batches = dict(batches)
+    for path in fragments:
+        if path in batches:
+            paths.add(path)
+            continue
+        spec = selects.get(path)
+        if spec is None or "__" in spec.lookup:
+            continue
+        parent_model = get_parent_model(root_model, prefetches, spec)
+        if parent_model is None:
+            continue
+        relation = get_relation_field(parent_model, spec.lookup)
+        if relation is None or not relation.concrete or relation.many_to_many:
+            continue
+        paths.add(path)
+        batches[path] = DynamicBatchLoad(
+            spec.lookup,
+            pk_field_name=spec.pk_field_name,
+            parent_prefetch_path=spec.parent_prefetch_path,
+        )
+
+    def keep(specs, exclude=()):
+        return {
+            path: spec
+            for path, spec in specs.items()
+            if path not in exclude
+            and not any(path.startswith(f"{parent}.") for parent in paths)
+        }
+
+    return (
+        keep(prefetches),
+        keep(annotations),
+        keep(selects, paths),
+        keep(batches),
+    )
@@ -1,9 +1,24 @@
 import itertools
+import logging
+import threading
+import time
 from collections import Collection, Mapping, OrderedDict, Sequence
 
-from .specs import DynamicAnnotation, DynamicPrefetch, DynamicSelect, DynamicSpec
+from .specs import (
+    DynamicAnnotation,
+    DynamicBatchLoad,
+    DynamicPrefetch,
+    DynamicSelect,
+    DynamicSpec,
+)
 from django.core.exceptions import FieldDoesNotExist
 
+logger = logging.getLogger("drf_dynamics")
+
+_relation_indexes = {}
+_pending_specs = []
+_resolve_lock = threading.RLock()
+
 
 def tagged_chain(*iterables, tag_names=None):
     """
@@ -43,134 +58,272 @@ def tagged_chain(*iterables, tag_names=None):
         yield tag, item
 
 
-def set_deep(instance, path, value):
+def get_relation_field(model, name):
     """
-    Do NOT use this helper in your code.
-    It's extremely primitive and wouldn't work properly with most Mappings.
+    Returns the relation field of the `model` named `name`,
+    or `None` if there's no such field or it isn't a relation.
     """
-    path = path.split(".")
-    for path_segment in path[:-1]:
-        if path_segment not in instance:
-            instance[path_segment] = {}
-        instance = instance[path_segment]
-    instance[path[-1]] = value
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
 
 
-def get_deep(instance, path):
+def get_relation_index(model):
     """
-    Do NOT use this helper in your code.
-    It's extremely primitive and wouldn't work properly with most Mappings.
+    A mapping of every name a relation of the `model` may be referred to by
+    (the field name, the related name and the accessor name) to the related model.
+    Built once per model.
     """
-    path = path.split(".")
-    for path_segment in path:
-        if path_segment not in instance:
-            return None
-        instance = instance[path_segment]
-        # instance is empty ex: tickets: {}
-        if not instance:
-            return {}
-    return instance
-
-
-def dynamic_queryset(prefetches=None, annotations=None, selects=None):
-    def parse_spec(spec):
-        if not spec:
-            return {}
-
-        sequence_to_merge = ()
-        mapping_to_merge = {}
-        if isinstance(spec, str):
-            sequence_to_merge = (spec,)
-        elif isinstance(spec, Mapping):
-            mapping_to_merge = spec
-        elif isinstance(spec, Sequence):
-            if isinstance(spec[-1], Mapping):
-                sequence_to_merge = spec[:-1]
-                mapping_to_merge = spec[-1]
-            else:
-                sequence_to_merge = spec
-        return OrderedDict(
-            sorted(
-                {
-                    **{path: None for path in sequence_to_merge},
-                    **mapping_to_merge,
-                }.items()
-            )
+    index = _relation_indexes.get(model)
+    if index is None:
+        index = {}
+        for field in model._meta.get_fields(include_hidden=True):
+            if not field.is_relation or field.related_model is None:
+                continue
+            names = {field.name}
+            if field.auto_created and not field.concrete:
+                names.update((field.related_name, field.get_accessor_name()))
+            for name in names:
+                if name:
+                    index.setdefault(name, field.related_model)
+        _relation_indexes[model] = index
+    return index
+
+
+def get_field_path(field):
+    """
+    The dotted path of the field names from the root serializer to the `field`,
+    or `None` for the root serializer itself.
+    """
+    field_names = []
+    while field is not None:
+        if field.field_name:
+            field_names.append(field.field_name)
+        field = field.parent
+    return ".".join(reversed(field_names)) or None
+
+
+def parse_spec(spec):
+    if not spec:
+        return {}
+
+    sequence_to_merge = ()
+    mapping_to_merge = {}
+    if isinstance(spec, str):
+        sequence_to_merge = (spec,)
+    elif isinstance(spec, Mapping):
+        mapping_to_merge = spec
+    elif isinstance(spec, Sequence):
+        if isinstance(spec[-1], Mapping):
+            sequence_to_merge = spec[:-1]
+            mapping_to_merge = spec[-1]
+        else:
+            sequence_to_merge = spec
+    return OrderedDict(
+        sorted(
+            {
+                **{path: None for path in sequence_to_merge},
+                **mapping_to_merge,
+            }.items()
         )
+    )
 
-    def find_parent_prefetch_path(prefetches_map, path):
-        while path.count(".") != 0:
-            path = path.rsplit(".", 1)[0]
-            if path in prefetches_map:
-                return path
-        return None
 
-    def determine_queryset(parent_queryset, lookup):
-        _meta = parent_queryset.model._meta
-        model = None
-        try:
-            model = _meta.get_field(lookup).related_model
-        except FieldDoesNotExist:
-            for _, field in _meta.fields_map.items():
-                if field.related_name == lookup:
-                    model = field.related_model
-                    break
-
-        if model:
-            return model._meta.default_manager.all()
-        raise FieldDoesNotExist("%s has no field named '%s'" % (parent_queryset.model, lookup))
+def find_parent_prefetch_path(prefetches_map, path):
+    while path.count(".") != 0:
+        path = path.rsplit(".", 1)[0]
+        if path in prefetches_map:
+            return path
+    return None
 
-    def wrapper(klass):
-        root_queryset = klass.queryset
-        prefetches_map = {}
-        annotations_map = {}
-        selects_map = {}
-        tag_to_class = {
-            "prefetch": DynamicPrefetch,
-            "annotation": DynamicAnnotation,
-            "select": DynamicSelect,
-        }
-        tag_to_map = {
-            "prefetch": prefetches_map,
-            "annotation": annotations_map,
-            "select": selects_map,
+
+def determine_queryset(parent_queryset, lookup):
+    model = get_relation_index(parent_queryset.model).get(lookup)
+    if model:
+        return model._meta.default_manager.all()
+    raise FieldDoesNotExist("%s has no field named '%s'" % (parent_queryset.model, lookup))
+
+
+def merge_inferred_specs(klass, specs):
+    from .inference import infer_dynamic_specs
+
+    serializer_classes = {
+        klass.serializer_class,
+        *getattr(klass, "dynamic_serializer_class", {}).values(),
+    }
+    inferred = infer_dynamic_specs(
+        [
+            serializer_class()
+            for serializer_class in serializer_classes
+            if serializer_class is not None
+        ],
+        klass.queryset.model,
+    )
+    explicit = [parse_spec(spec) for spec in specs]
+    # The explicit specs override the inferred ones of the same path.
+    explicit_paths = {path for specs in explicit for path in specs}
+    # Nothing is inferred as a batch load, so those are passed as is.
+    return [
+        {
+            **{
+                path: spec
+                for path, spec in inferred_specs.items()
+                if path not in explicit_paths
+            },
+            **explicit_specs,
         }
-        for tag, (path, spec) in tagged_chain(
-            parse_spec(prefetches).items(),
-            parse_spec(annotations).items(),
-            parse_spec(selects).items(),
-            tag_names=("prefetch", "annotation", "select"),
-        ):
-            parent_prefetch_path = find_parent_prefetch_path(prefetches_map, path)
-            if not isinstance(spec, DynamicSpec):
-                if spec is None:
-                    # In this branch we assume the lookup for selects and prefetches
-                    # and method name for annotations if we weren't supplied a mapping.
-                    if parent_prefetch_path:
-                        # The lookup should start from the parent prefetch,
-                        # if there is one.
-                        spec = path[len(parent_prefetch_path) + 1 :]
-                    else:
-                        spec = path
-                    if tag == "annotation":
-                        spec = f"with_{spec}"
-                    else:
-                        spec = spec.replace(".", "__")
-                spec = tag_to_class[tag](spec)
-            spec.parent_prefetch_path = parent_prefetch_path
-            if tag == "prefetch" and spec.queryset is None:
-                parent_queryset = (
-                    root_queryset
-                    if parent_prefetch_path is None
-                    else prefetches_map[parent_prefetch_path].queryset
+        for inferred_specs, explicit_specs in zip(inferred, explicit)
+    ] + explicit[len(inferred) :]
+
+
+def build_dynamic_specs(klass, specs, auto=False):
+    """
+    Builds the `dynamic_prefetches`, `dynamic_annotations`, `dynamic_selects`
+    and `dynamic_batch_loads` maps of the `klass`
+    out of the `dynamic_queryset` arguments.
+    """
+    root_queryset = klass.queryset
+    if auto:
+        specs = merge_inferred_specs(klass, specs)
+    prefetches_map = {}
+    annotations_map = {}
+    selects_map = {}
+    batch_loads_map = {}
+    tag_to_class = {
+        "prefetch": DynamicPrefetch,
+        "annotation": DynamicAnnotation,
+        "select": DynamicSelect,
+        "batch": DynamicBatchLoad,
+    }
+    tag_to_map = {
+        "prefetch": prefetches_map,
+        "annotation": annotations_map,
+        "select": selects_map,
+        "batch": batch_loads_map,
+    }
+    for tag, (path, spec) in tagged_chain(
+        *(parse_spec(spec).items() for spec in specs),
+        tag_names=("prefetch", "annotation", "select", "batch"),
+    ):
+        parent_prefetch_path = find_parent_prefetch_path(prefetches_map, path)
+        if not isinstance(spec, DynamicSpec):
+            if spec is None:
+                # In this branch we assume the lookup for selects and prefetches
+                # and method name for annotations if we weren't supplied a mapping.
+                if parent_prefetch_path:
+                    # The lookup should start from the parent prefetch,
+                    # if there is one.
+                    spec = path[len(parent_prefetch_path) + 1 :]
+                else:
+                    spec = path
+                if tag == "annotation":
+                    spec = f"with_{spec}"
+                else:
+                    spec = spec.replace(".", "__")
+            spec = tag_to_class[tag](spec)
+        spec.parent_prefetch_path = parent_prefetch_path
+        if tag == "prefetch" and spec.queryset is None:
+            parent_queryset = (
+                root_queryset
+                if parent_prefetch_path is None
+                else prefetches_map[parent_prefetch_path].queryset
+            )
+            spec.queryset = determine_queryset(parent_queryset, spec.lookup)
+        tag_to_map[tag][path] = spec
+
+    return {
+        "dynamic_prefetches": prefetches_map,
+        "dynamic_annotations": annotations_map,
+        "dynamic_selects": selects_map,
+        "dynamic_batch_loads": batch_loads_map,
+    }
+
+
+class DeferredDynamicSpecs:
+    """
+    The `dynamic_queryset` arguments of a class,
+    which are resolved into the specs on the first access to any of those,
+    or by `resolve_dynamic_querysets`.
+    Once resolved, the class attributes are replaced with the plain maps.
+    """
+
+    attribute_names = (
+        "dynamic_prefetches",
+        "dynamic_annotations",
+        "dynamic_selects",
+        "dynamic_batch_loads",
+    )
+
+    def __init__(self, klass, specs, auto):
+        self.klass = klass
+        self.specs = specs
+        self.auto = auto
+        self.resolved = None
+
+    def resolve(self):
+        with _resolve_lock:
+            if self.resolved is None:
+                start = time.perf_counter()
+                self.resolved = build_dynamic_specs(self.klass, self.specs, self.auto)
+                for name, value in self.resolved.items():
+                    setattr(self.klass, name, value)
+                logger.debug(
+                    "Resolved the dynamic specs of %s in %.3fms",
+                    self.klass.__qualname__,
+                    (time.perf_counter() - start) * 1000,
                 )
-                spec.queryset = determine_queryset(parent_queryset, spec.lookup)
-            tag_to_map[tag][path] = spec
+            return self.resolved
+
 
-        klass.dynamic_prefetches = prefetches_map
-        klass.dynamic_annotations = annotations_map
-        klass.dynamic_selects = selects_map
+class DeferredSpecsDescriptor:
+    def __init__(self, name, deferred_specs):
+        self.name = name
+        self.deferred_specs = deferred_specs
 
+    def __get__(self, instance, owner):
+        return self.deferred_specs.resolve()[self.name]
+
+
+def resolve_dynamic_querysets():
+    """
+    Resolves the specs of all the classes decorated so far.
+    Call it in an `AppConfig.ready` to pay the cost at startup,
+    before the workers are forked, and to surface the misconfigured specs early.
+    """
+    with _resolve_lock:
+        pending_specs = list(_pending_specs)
+        _pending_specs.clear()
+    for deferred_specs in pending_specs:
+        deferred_specs.resolve()
+
+
+def dynamic_queryset(
+    prefetches=None,
+    annotations=None,
+    selects=None,
+    auto=False,
+    planner=None,
+    batch_loads=None,
+):
+    if planner is True:
+        from .planner import CostPlanner
+
+        planner = CostPlanner()
+
+    def wrapper(klass):
+        if planner is not None:
+            klass.dynamic_planner = planner
+        # The specs are resolved on the first use,
+        # so the decoration doesn't touch the models and the serializers.
+        deferred_specs = DeferredDynamicSpecs(
+            klass, (prefetches, annotations, selects, batch_loads), auto
+        )
+        for name in DeferredDynamicSpecs.attribute_names:
+            setattr(klass, name, DeferredSpecsDescriptor(name, deferred_specs))
+        with _resolve_lock:
+            _pending_specs.append(deferred_specs)
         return klass
 
     return wrapper
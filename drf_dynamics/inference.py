@@ -0,0 +1,94 @@
+from rest_framework.relations import (
+    ManyRelatedField,
+    PrimaryKeyRelatedField,
+    RelatedField,
+)
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from .helpers import get_relation_field
+
+
+def get_serializer_fields(serializer):
+    fields = dict(serializer.fields)
+    fields.update(getattr(serializer, "representation_fields", {}))
+    return fields
+
+
+def has_annotation_method(model, field_name):
+    return hasattr(model._meta.default_manager.all(), f"with_{field_name}")
+
+
+def collect_relations(serializer, model):
+    """
+    Walks the fields of the `serializer` against the `model`,
+    and returns the `(field_name, kind, source, nested)` tuples
+    of the fields, that need the queryset to be set up.
+    The `kind` is either `"annotation"`, `"to_one"` or `"to_many"`,
+    and `nested` holds the tuples of the nested serializer, if there is one.
+    """
+    relations = []
+    for field_name, field in get_serializer_fields(serializer).items():
+        if field.write_only:
+            continue
+        source = field.source or field_name
+        if source == "*" or "." in source:
+            continue
+
+        relation = get_relation_field(model, source)
+        if relation is None:
+            if source == field_name and has_annotation_method(model, field_name):
+                relations.append((field_name, "annotation", source, ()))
+            continue
+
+        target = field.child if isinstance(field, ListSerializer) else field
+        if isinstance(target, BaseSerializer):
+            nested = collect_relations(target, relation.related_model)
+        elif isinstance(target, ManyRelatedField) or (
+            # The pk of a forward relation is read from the column.
+            isinstance(target, RelatedField)
+            and not (isinstance(target, PrimaryKeyRelatedField) and relation.concrete)
+        ):
+            nested = ()
+        else:
+            continue
+
+        kind = "to_many" if relation.one_to_many or relation.many_to_many else "to_one"
+        relations.append((field_name, kind, source, nested))
+    return relations
+
+
+def is_selectable(relations):
+    return all(
+        kind == "to_one" and is_selectable(nested) for _, kind, _, nested in relations
+    )
+
+
+def infer_dynamic_specs(serializers, model):
+    """
+    Infers the `dynamic_queryset` specs out of the serializers' field trees.
+    Returns the `prefetches`, `annotations` and `selects` mappings
+    of a path to its lookup (`None` for the annotations, for the default method).
+    The to-one relations are selected, unless there are to-many relations
+    or annotations under those, in which case those are prefetched,
+    just like the to-many relations.
+    """
+    prefetches = {}
+    annotations = {}
+    selects = {}
+
+    def add_specs(relations, path, lookup_prefix):
+        for field_name, kind, source, nested in relations:
+            field_path = field_name if path is None else f"{path}.{field_name}"
+            lookup = f"{lookup_prefix}{source}"
+            if kind == "annotation":
+                annotations[field_path] = None
+            elif kind == "to_one" and is_selectable(nested):
+                selects[field_path] = lookup
+                add_specs(nested, field_path, f"{lookup}__")
+            else:
+                prefetches[field_path] = lookup
+                add_specs(nested, field_path, "")
+
+    for serializer in serializers:
+        add_specs(collect_relations(serializer, model), None, "")
+    return prefetches, annotations, selects
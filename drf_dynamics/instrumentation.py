@@ -0,0 +1,177 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+current_recorder = ContextVar("drf_dynamics_recorder", default=None)
+
+ROOT_PATH_NAME = "root"
+
+
+def get_current_recorder():
+    return current_recorder.get()
+
+
+class PathMetrics:
+    __slots__ = (
+        "queries",
+        "lazy_queries",
+        "db_time",
+        "rows",
+        "serializer_time",
+        "strategy",
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.lazy_queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.serializer_time = 0.0
+        # Whether the path was prefetched or selected, when it was planned.
+        self.strategy = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RecordingIterable:
+    """
+    Mixed into the iterable class of a queryset, so the queries run
+    while it's iterated are attributed to its `path`, and its rows are counted.
+    Subclassed for each queryset with the `recorder` and `path` set.
+    """
+
+    recorder = None
+    path = None
+
+    def __iter__(self):
+        rows = 0
+        try:
+            with self.recorder.at(self.path):
+                for row in super().__iter__():
+                    rows += 1
+                    yield row
+        finally:
+            self.recorder.add_rows(self.path, rows)
+
+
+class Recorder:
+    """
+    Collects the `PathMetrics` of a request per dynamic field path,
+    `None` being the root queryset and serializer.
+    Used as a database execute wrapper, which attributes the queries
+    to the path, that is being fetched or serialized at the moment.
+    The queries run while a path is serialized, rather than fetched
+    by a planned queryset, are counted as lazy ones.
+    Every thread (e.g. the one running a concurrent prefetch) has its own
+    stack of the paths.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def paths(self):
+        paths = getattr(self._local, "paths", None)
+        if paths is None:
+            paths = self._local.paths = [(None, False)]
+        return paths
+
+    @property
+    def current_path(self):
+        return self.paths[-1][0]
+
+    def get_metrics(self, path):
+        metrics = self.metrics.get(path)
+        if metrics is None:
+            with self._lock:
+                metrics = self.metrics.setdefault(path, PathMetrics())
+        return metrics
+
+    def add_rows(self, path, rows):
+        metrics = self.get_metrics(path)
+        with self._lock:
+            metrics.rows += rows
+
+    @contextmanager
+    def at(self, path, lazy=False):
+        self.paths.append((path, lazy))
+        try:
+            yield
+        finally:
+            self.paths.pop()
+
+    @contextmanager
+    def serializing(self, path):
+        """
+        Records the time spent serializing the `path`,
+        including the time of the nested serializers.
+        """
+        start = time.perf_counter()
+        try:
+            with self.at(path, lazy=True):
+                yield
+        finally:
+            self.get_metrics(path).serializer_time += time.perf_counter() - start
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            path, lazy = self.paths[-1]
+            metrics = self.get_metrics(path)
+            with self._lock:
+                metrics.queries += 1
+                metrics.lazy_queries += lazy
+                metrics.db_time += time.perf_counter() - start
+
+    def instrument(self, queryset, path):
+        """
+        Returns a clone of the `queryset`, that records its queries and rows
+        under the `path`. The given one may be shared (e.g. a spec's queryset).
+        """
+        queryset = queryset._chain()
+        iterable_class = queryset._iterable_class
+        queryset._iterable_class = type(
+            iterable_class.__name__,
+            (RecordingIterable, iterable_class),
+            {"recorder": self, "path": path},
+        )
+        return queryset
+
+    def record_strategies(self, strategies):
+        for path, strategy in strategies.items():
+            self.get_metrics(path).strategy = strategy
+
+    def as_dict(self):
+        return {
+            ROOT_PATH_NAME if path is None else path: metrics.as_dict()
+            for path, metrics in self.metrics.items()
+        }
+
+    def get_server_timing(self):
+        """
+        The value of the `Server-Timing` header,
+        with the database and serialization durations of every path.
+        """
+        entries = []
+        for path, metrics in sorted(
+            self.as_dict().items(),
+            key=lambda item: (item[0] != ROOT_PATH_NAME, item[0].split(".")),
+        ):
+            if metrics["queries"]:
+                desc = f"queries={metrics['queries']} rows={metrics['rows']}"
+                if metrics["strategy"] is not None:
+                    desc = f"{desc} strategy={metrics['strategy']}"
+                entries.append(
+                    f'db.{path};dur={metrics["db_time"] * 1000:.3f};desc="{desc}"'
+                )
+            if metrics["serializer_time"]:
+                entries.append(
+                    f"serializer.{path};dur={metrics['serializer_time'] * 1000:.3f}"
+                )
+        return ", ".join(entries)
@@ -0,0 +1,136 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from django.db import models
+from django.db.models.functions import RowNumber
+from rest_framework.exceptions import ValidationError
+
+from .batches import iter_related
+from .helpers import get_relation_field
+
+ROW_NUMBER = "_prefetch_row_number"
+TOTAL = "_prefetch_total"
+
+PrefetchLimit = namedtuple("PrefetchLimit", ("lookup", "limit", "ordering", "total"))
+
+
+def get_prefetch_limit(spec, requested_slice, relation):
+    """
+    The limit of the objects per parent for the prefetch `spec`:
+    the smaller of its own `limit` and the requested one, e.g. `invites[:5]`.
+    Only the reverse foreign keys can be limited, so a limit requested
+    for any other `relation` is rejected with a `ValidationError`.
+    """
+    requested_limit = getattr(requested_slice, "limit", None)
+    if requested_limit is not None and (relation is None or not relation.one_to_many):
+        raise ValidationError(
+            {"fields": [f"The '{spec.lookup}' objects can't be limited."]}
+        )
+    limits = [limit for limit in (spec.limit, requested_limit) if limit is not None]
+    return min(limits) if limits else None
+
+
+def get_ordering(queryset, ordering):
+    ordering = (
+        ordering or queryset.query.order_by or queryset.model._meta.ordering or ("pk",)
+    )
+    return [
+        (
+            name
+            if not isinstance(name, str)
+            else (
+                models.F(name[1:]).desc()
+                if name.startswith("-")
+                else models.F(name).asc()
+            )
+        )
+        for name in ordering
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_limited_class(mixin, base):
+    return type(base.__name__, (mixin, base), {})
+
+
+class LimitedCompiler:
+    """
+    Wraps the query into a subquery, that only keeps the first rows per parent.
+    """
+
+    limit = None
+
+    def as_sql(self, with_limits=True, with_col_aliases=False):
+        # The rows are ordered by their number, so the inner ordering isn't needed.
+        self.query = self.query.clone()
+        self.query.clear_ordering(True)
+        # The columns have to be aliased to be unique in the subquery.
+        sql, params = super().as_sql(with_limits, with_col_aliases=True)
+        quote_name = self.connection.ops.quote_name
+        row_number = quote_name(ROW_NUMBER)
+        return (
+            f"SELECT * FROM ({sql}) {quote_name('limited')} "
+            f"WHERE {row_number} <= %s ORDER BY {row_number}",
+            (*params, self.limit),
+        )
+
+
+class LimitedQuery:
+    limit = None
+
+    def get_compiler(self, using=None, connection=None):
+        compiler = super().get_compiler(using, connection)
+        # Only the regular selects of the rows are limited.
+        if self.compiler == "SQLCompiler" and ROW_NUMBER in self.annotation_select:
+            compiler.__class__ = get_limited_class(LimitedCompiler, type(compiler))
+            compiler.limit = self.limit
+        return compiler
+
+
+def limit_queryset(queryset, parent_model, prefetch_limit):
+    """
+    Limits the prefetch `queryset` to the first `limit` objects per parent,
+    with a single query, that numbers the rows with a window function
+    partitioned by the foreign key to the parent.
+    If the `total` is requested, the amount of all the objects of the parent
+    is annotated on every object from the same pass.
+    """
+    relation = get_relation_field(parent_model, prefetch_limit.lookup)
+    assert relation is not None and relation.one_to_many, (
+        f"The limited '{prefetch_limit.lookup}' of {parent_model.__name__} "
+        "has to be a reverse foreign key."
+    )
+    partition_by = [models.F(relation.field.attname)]
+    annotations = {
+        ROW_NUMBER: models.Window(
+            RowNumber(),
+            partition_by=partition_by,
+            order_by=get_ordering(queryset, prefetch_limit.ordering),
+        )
+    }
+    if prefetch_limit.total:
+        annotations[TOTAL] = models.Window(
+            models.Count("pk"), partition_by=partition_by
+        )
+    queryset = queryset.annotate(**annotations)
+    queryset.query.__class__ = get_limited_class(LimitedQuery, type(queryset.query))
+    queryset.query.limit = prefetch_limit.limit
+    return queryset
+
+
+class PrefetchTotalLoad(namedtuple("PrefetchTotalLoad", ("attrs", "name"))):
+    """
+    Sets the total amount of the objects of a limited prefetch at `attrs`
+    as the `name` attribute of their parents.
+    """
+
+    __slots__ = ()
+
+    def load(self, instances, instrument=None):
+        *attrs, attr = self.attrs
+        for parent in iter_related(instances, attrs):
+            related = getattr(parent, attr)
+            if isinstance(related, models.Manager):
+                related = related.all()
+            first = next(iter(related), None)
+            setattr(parent, self.name, 0 if first is None else getattr(first, TOTAL))
@@ -1,10 +1,46 @@
 import copy
-
-from django.db import models
+import itertools
+import random
+from contextlib import ExitStack
+
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.http import Http404, StreamingHttpResponse
 from django.utils.functional import cached_property
-from rest_framework.relations import RelatedField
-
-from .helpers import get_deep, set_deep, tagged_chain
+from rest_framework.filters import OrderingFilter
+from rest_framework.relations import PKOnlyObject, RelatedField
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .asynchronous import acall, afetch, aserialize, call_async, call_sync
+from .budgets import QueryBudgetExceeded, prune_tree
+from .cache import LRUCache
+from .concurrency import attach_concurrent_prefetches
+from .counts import estimate_count, get_count_cache_key, make_count_queryset
+from .detection import find_lazy_loads, report_lazy_loads
+from .fragments import (
+    LOOKED_UP_FRAGMENTS,
+    CachedFragment,
+    Fragments,
+    MissingFragment,
+    apply_fragments,
+    collect_fragments,
+    get_serializer_labels,
+)
+from .helpers import get_field_path, tagged_chain
+from .instrumentation import Recorder, current_recorder, get_current_recorder
+from .plans import compile_plan, plan_cache
+from .representation import compile_representation, get_representation_signature
+from .responses import (
+    freeze_response_data,
+    get_queryset_models,
+    get_response_cache_key,
+    register_backend,
+    response_models_cache,
+)
+from .specs import DynamicAnnotation
+from .trees import FieldTree
 
 
 class DynamicSerializerClassMixin:
@@ -37,66 +73,249 @@ class DynamicQuerySetMixin:
     dynamic_prefetches = {}
     dynamic_annotations = {}
     dynamic_selects = {}
+    dynamic_batch_loads = {}
+    dynamic_only_fields = True
+    dynamic_plan_cache = plan_cache
+    dynamic_values_actions = set()
+    dynamic_count_cache_timeout = None
+    dynamic_count_cache_alias = "default"
+    dynamic_count_estimate_threshold = None
+    dynamic_instrumentation = False
+    dynamic_server_timing = False
+    dynamic_metrics_callbacks = ()
+    dynamic_n_plus_one_detection = None
+    dynamic_n_plus_one_sample_rate = 1.0
+    dynamic_planner = None
+    dynamic_concurrent_prefetches = False
+    dynamic_prefetch_workers = 4
+    dynamic_query_budget = None
+    dynamic_query_budgets = {}
+    dynamic_pruned_fields = ()
 
     @cached_property
     def requested_fields(self):
         requested_fields = self.request.query_params.get("fields")
         if not requested_fields:
             return None
-        ret = {}
-        for path in requested_fields.lower().split(","):
-            set_deep(ret, path, {})
-        return ret
-
-    def setup_dynamic_queryset(self, queryset):
-        prefetches_map = {}
-        allow_all_fields = self.requested_fields is None
-
-        for tag, (path, spec) in tagged_chain(
-            self.dynamic_prefetches.items(),
-            self.dynamic_annotations.items(),
-            self.dynamic_selects.items(),
-            tag_names=("prefetch", "annotation", "select"),
-        ):
-            if not allow_all_fields:
-                requested_slice = get_deep(self.requested_fields, path)
-                if requested_slice is None:
-                    continue
-                # If the only field we're requesting is a pk,
-                # we don't need to select it.
-                # Make sure your serializer grabs the value smartly, though.
-                if (
-                    tag == "select"
-                    and len(requested_slice) == 1
-                    and spec.pk_field_name in requested_slice
-                ):
-                    continue
-
-            if tag == "prefetch":
-                prefetch_queryset = (
-                    spec.get_queryset(self.request)
-                    if spec.get_queryset is not None
-                    else spec.queryset
+        return FieldTree.parse(requested_fields)
+
+    def get_dynamic_planner_decisions(self, queryset):
+        # The values plans are shaped after the specs as those are declared.
+        if self.dynamic_planner is None or self.action in self.dynamic_values_actions:
+            return ()
+        return self.dynamic_planner.get_decisions(
+            type(self),
+            queryset.model,
+            self.dynamic_prefetches,
+            self.dynamic_annotations,
+            self.dynamic_selects,
+        )
+
+    def get_dynamic_serializer(self):
+        """
+        The dynamic serializer of the requested fields, which the plans
+        are compiled against, or `None`, if the serializer isn't dynamic.
+        """
+        if self.action not in self.dynamic_fields_actions:
+            return None
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, DynamicFieldsMixin):
+            return None
+        return serializer_class(
+            requested_fields=self.requested_fields,
+            context={"request": self.request, "view": self},
+        )
+
+    def get_dynamic_fragments(self, serializer):
+        """
+        The `Fragments` of the nested serializers with a fragment cache,
+        by their paths.
+        """
+        # The values plans render the rows, not the instances, the fragments are of.
+        if serializer is None or self.action in self.dynamic_values_actions:
+            return {}
+        return collect_fragments(serializer, {})
+
+    def get_dynamic_plan(self, queryset):
+        decisions = self.get_dynamic_planner_decisions(queryset)
+        key = (
+            type(self),
+            self.action,
+            self.requested_fields,
+            self.dynamic_only_fields,
+            decisions,
+        )
+        plan = self.dynamic_plan_cache.get(key)
+        if plan is None:
+            prefetches = self.dynamic_prefetches
+            annotations = self.dynamic_annotations
+            selects = self.dynamic_selects
+            batch_loads = self.dynamic_batch_loads
+            if decisions:
+                prefetches, selects = self.dynamic_planner.apply_decisions(
+                    decisions, queryset.model, prefetches, selects
                 )
-                prefetch = models.Prefetch(spec.lookup, prefetch_queryset, spec.to_attr)
-                prefetches_map[path] = prefetch
-                method = "prefetch_related"
-                arg = prefetch
-            elif tag == "annotation":
-                method = spec.method_name
-                arg = self.request
-            else:
-                method = "select_related"
-                arg = spec.lookup
-
-            if spec.parent_prefetch_path is not None:
-                parent_prefetch = prefetches_map[spec.parent_prefetch_path]
-                parent_prefetch.queryset = getattr(parent_prefetch.queryset, method)(
-                    arg
+            serializer = self.get_dynamic_serializer()
+            fragments = self.get_dynamic_fragments(serializer)
+            if fragments:
+                prefetches, annotations, selects, batch_loads = apply_fragments(
+                    fragments,
+                    queryset.model,
+                    prefetches,
+                    annotations,
+                    selects,
+                    batch_loads,
                 )
-            else:
-                queryset = getattr(queryset, method)(arg)
+            plan = compile_plan(
+                queryset.model,
+                self.requested_fields,
+                prefetches,
+                annotations,
+                selects,
+                only_fields=self.dynamic_only_fields,
+                values=self.action in self.dynamic_values_actions,
+                batch_loads=batch_loads,
+                fragments=fragments,
+                serializer=serializer,
+            )
+            self.dynamic_plan_cache.set(key, plan)
+        return plan
+
+    def get_dynamic_query_budget(self):
+        """
+        The `QueryBudget` of the request, looked up in `dynamic_query_budgets`
+        by the action and the throttle scope, the action and the throttle scope
+        alone, falling back to `dynamic_query_budget`.
+        """
+        scope = getattr(self, "throttle_scope", None)
+        for key in ((self.action, scope), self.action, scope):
+            if key is not None and key in self.dynamic_query_budgets:
+                return self.dynamic_query_budgets[key]
+        return self.dynamic_query_budget
+
+    def enforce_dynamic_query_budget(self, queryset):
+        """
+        Rejects the requested fields, if their plan is over the budget,
+        or degrades those until the plan fits the budget.
+        The degraded fields replace `requested_fields`, so the serializer,
+        the plan and the response cache see the same tree,
+        and the dropped paths are stored in `dynamic_pruned_fields`.
+        """
+        budget = self.get_dynamic_query_budget()
+        requested_fields = self.requested_fields
+        # Only the requested fields are limited, the default ones are up to the view.
+        if budget is None or requested_fields is None:
+            return
+        violations = budget.get_violations(
+            self.get_dynamic_plan(queryset), requested_fields
+        )
+        if not violations:
+            return
+        if not budget.degrade:
+            raise QueryBudgetExceeded(violations)
+
+        tree = budget.truncate(requested_fields)
+        while True:
+            self.requested_fields = tree
+            path = budget.get_prune_path(self.get_dynamic_plan(queryset))
+            if path is None:
+                break
+            pruned_tree = prune_tree(tree, path)
+            if pruned_tree == tree:
+                raise QueryBudgetExceeded(violations)
+            tree = pruned_tree
+        self.dynamic_pruned_fields = tuple(
+            sorted(set(requested_fields.paths()) - set(tree.paths()))
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # The budget is enforced before anything is saved, fetched or cached.
+        if (
+            self.action in self.dynamic_fields_actions
+            and self.get_dynamic_query_budget() is not None
+        ):
+            self.enforce_dynamic_query_budget(super().get_queryset())
+
+    def prepare_dynamic_plan(self, queryset):
+        """
+        Returns the plan for the `queryset` and the callable to instrument
+        its querysets with, if the request is recorded.
+        """
+        recorder = get_current_recorder()
+        # Once enforced, the requested fields fit the budget.
+        self.enforce_dynamic_query_budget(queryset)
+        plan = self.get_dynamic_plan(queryset)
+        if recorder is None:
+            return plan, None
+        if self.dynamic_planner is not None:
+            recorder.record_strategies(plan.get_strategies())
+        return plan, recorder.instrument
+
+    def finalize_dynamic_queryset(self, queryset):
+        if self.dynamic_concurrent_prefetches:
+            queryset = attach_concurrent_prefetches(
+                queryset, self.dynamic_prefetch_workers
+            )
+        return queryset
 
+    def setup_dynamic_queryset(self, queryset):
+        plan, instrument = self.prepare_dynamic_plan(queryset)
+        queryset = plan.apply(queryset, self.request, instrument=instrument)
+        return self.finalize_dynamic_queryset(queryset)
+
+    async def asetup_dynamic_queryset(self, queryset):
+        plan, instrument = self.prepare_dynamic_plan(queryset)
+        queryset = await plan.aapply(queryset, self.request, instrument=instrument)
+        return self.finalize_dynamic_queryset(queryset)
+
+    def get_dynamic_ordering(self, queryset):
+        """
+        The field names, that the `OrderingFilter` backends of the view
+        order the `queryset` by, if the ordering may refer to the dynamic annotations.
+        Only the fields, that the filters accept, are returned.
+        """
+        if self.action not in self.dynamic_fields_actions:
+            return []
+        ordering = []
+        for backend in self.filter_backends:
+            if issubclass(backend, OrderingFilter):
+                backend_ordering = backend().get_ordering(self.request, queryset, self)
+                ordering.extend(backend_ordering or ())
+        return ordering
+
+    def get_dynamic_ordering_specs(self, queryset, ordering):
+        """
+        The annotation specs of the root queryset, that the `ordering` refers to,
+        and that weren't applied already, because those weren't requested.
+        """
+        for field_name in ordering:
+            field_name = field_name.lstrip("-")
+            spec = self.dynamic_annotations.get(field_name)
+            # The aggregates are computed after the rows are fetched.
+            if (
+                isinstance(spec, DynamicAnnotation)
+                and spec.parent_prefetch_path is None
+                and field_name not in queryset.query.annotations
+            ):
+                yield spec
+
+    def setup_dynamic_ordering(self, queryset, ordering):
+        """
+        Applies the annotations of the root queryset, that the `ordering` refers to.
+        """
+        for spec in list(self.get_dynamic_ordering_specs(queryset, ordering)):
+            queryset = call_sync(getattr(queryset, spec.method_name), self.request)
+        return queryset
+
+    async def asetup_dynamic_ordering(self, queryset, ordering):
+        """
+        The `setup_dynamic_ordering` for the async code.
+        """
+        for spec in list(self.get_dynamic_ordering_specs(queryset, ordering)):
+            queryset = await call_async(
+                getattr(queryset, spec.method_name), self.request
+            )
         return queryset
 
     def get_queryset(self,):
@@ -105,18 +324,330 @@ class DynamicQuerySetMixin:
             queryset = self.setup_dynamic_queryset(queryset)
         return queryset
 
+    async def aget_queryset(self):
+        """
+        The `get_queryset` for the async code.
+        """
+        queryset = super().get_queryset()
+        if self.action in self.dynamic_fields_actions:
+            queryset = await self.asetup_dynamic_queryset(queryset)
+        return queryset
+
+    async def afilter_queryset(self, queryset):
+        """
+        The `filter_queryset` for the async code, which awaits the async
+        annotation methods, that the ordering refers to.
+        """
+        queryset = await self.asetup_dynamic_ordering(
+            queryset, self.get_dynamic_ordering(queryset)
+        )
+        return self.filter_queryset(queryset)
+
+    async def alist_data(self):
+        """
+        Fetches and serializes the list for the async views.
+        Pagination isn't applied.
+        """
+        queryset = await self.afilter_queryset(await self.aget_queryset())
+        instances = await afetch(queryset)
+        return await aserialize(self.get_serializer(instances, many=True))
+
+    async def aretrieve_data(self):
+        """
+        Fetches and serializes the object for the async views,
+        in the same way as `get_object` looks it up.
+        """
+        queryset = await self.afilter_queryset(await self.aget_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        instances = await afetch(
+            queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        )
+        if not instances:
+            raise Http404
+        if len(instances) > 1:
+            raise queryset.model.MultipleObjectsReturned
+        (instance,) = instances
+        await acall(self.check_object_permissions, self.request, instance)
+        return await aserialize(self.get_serializer(instance))
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.refetch_dynamic_instance(serializer)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.refetch_dynamic_instance(serializer)
+
+    def refetch_dynamic_instance(self, serializer):
+        """
+        Re-reads the instances saved by the `serializer` with a single query
+        through `get_queryset`, so those are rendered with the selects,
+        the prefetches and the annotations of the requested fields.
+        The instances, that the queryset doesn't return, are rendered as saved.
+        The query budget is enforced in `initial`, before the save,
+        so the serializer is built with the same fields as the plan.
+        """
+        if (
+            self.action not in self.dynamic_fields_actions
+            or self.action in self.dynamic_values_actions
+        ):
+            return
+        many = isinstance(serializer.instance, (list, tuple))
+        instances = serializer.instance if many else [serializer.instance]
+        fetched = {
+            instance.pk: instance
+            for instance in self.get_queryset().filter(
+                pk__in=[instance.pk for instance in instances]
+            )
+        }
+        instances = [fetched.get(instance.pk, instance) for instance in instances]
+        serializer.instance = instances if many else instances[0]
+
+    def filter_queryset(self, queryset):
+        # The ordering filter may order by the annotations, that weren't requested.
+        queryset = self.setup_dynamic_ordering(
+            queryset, self.get_dynamic_ordering(queryset)
+        )
+        return super().filter_queryset(queryset)
+
+    def get_count_queryset(self, queryset):
+        """
+        The queryset to count the rows of the paginated `queryset` with,
+        without the dynamic annotations of the root queryset,
+        the selects and the prefetches.
+        """
+        return make_count_queryset(
+            queryset,
+            {
+                path
+                for path, spec in self.dynamic_annotations.items()
+                if spec.parent_prefetch_path is None
+            },
+        )
+
+    def get_dynamic_count(self, queryset):
+        queryset = self.get_count_queryset(queryset)
+        threshold = self.dynamic_count_estimate_threshold
+        if threshold is not None:
+            estimate = estimate_count(queryset)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+
+        if self.dynamic_count_cache_timeout is None:
+            return queryset.count()
+        cache = caches[self.dynamic_count_cache_alias]
+        key = get_count_cache_key(queryset)
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.dynamic_count_cache_timeout)
+        return count
+
+    def dispatch(self, request, *args, **kwargs):
+        detect_n_plus_one = (
+            self.dynamic_n_plus_one_detection is not None
+            and random.random() < self.dynamic_n_plus_one_sample_rate
+        )
+        if not self.dynamic_instrumentation and not detect_n_plus_one:
+            return super().dispatch(request, *args, **kwargs)
+
+        recorder = Recorder()
+        token = current_recorder.set(recorder)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = super().dispatch(request, *args, **kwargs)
+        finally:
+            current_recorder.reset(token)
+        if self.dynamic_planner is not None:
+            self.dynamic_planner.observe(type(self), recorder)
+        if self.dynamic_instrumentation:
+            self.report_dynamic_metrics(recorder, response)
+        if detect_n_plus_one:
+            self.report_lazy_loads(recorder)
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.dynamic_pruned_fields:
+            response["X-Pruned-Fields"] = ",".join(self.dynamic_pruned_fields)
+        return response
+
+    def report_lazy_loads(self, recorder):
+        lazy_loads = find_lazy_loads(
+            recorder,
+            self.queryset.model,
+            self.dynamic_prefetches,
+            self.dynamic_selects,
+        )
+        report_lazy_loads(
+            lazy_loads, type(self).__name__, self.dynamic_n_plus_one_detection
+        )
+
+    def report_dynamic_metrics(self, recorder, response):
+        if self.dynamic_server_timing:
+            server_timing = recorder.get_server_timing()
+            if server_timing:
+                response["Server-Timing"] = server_timing
+        for callback in self.dynamic_metrics_callbacks:
+            callback(self.request, recorder)
+
     def get_serializer(self, *args, **kwargs):
         if self.action in self.dynamic_fields_actions:
             kwargs["requested_fields"] = self.requested_fields
         return super().get_serializer(*args, **kwargs)
 
 
+class DynamicStreamingListMixin:
+    """
+    Streams the `list` action response instead of rendering it at once.
+    The queryset is iterated in chunks of `stream_chunk_size`,
+    every chunk gets its prefetches and is serialized separately,
+    so the memory usage doesn't depend on the amount of rows.
+    Pagination isn't applied.
+    """
+
+    stream_chunk_size = 500
+    stream_format = "json"
+    stream_content_types = {
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+    }
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stream_format = self.get_stream_format()
+        return StreamingHttpResponse(
+            self.stream_list(queryset, stream_format),
+            content_type=self.stream_content_types[stream_format],
+        )
+
+    def get_stream_format(self):
+        return self.stream_format
+
+    def iter_chunks(self, queryset):
+        prefetch_lookups = queryset._prefetch_related_lookups
+        if prefetch_lookups:
+            queryset = queryset.prefetch_related(None)
+        iterator = queryset.iterator(chunk_size=self.stream_chunk_size)
+        while True:
+            chunk = list(itertools.islice(iterator, self.stream_chunk_size))
+            if not chunk:
+                return
+            if prefetch_lookups:
+                prefetch_related_objects(chunk, *prefetch_lookups)
+            batch_loader = getattr(queryset, "batch_loader", None)
+            if batch_loader is not None:
+                batch_loader.load(chunk)
+            yield chunk
+
+    def stream_list(self, queryset, stream_format):
+        renderer = JSONRenderer()
+        if stream_format == "ndjson":
+            for chunk in self.iter_chunks(queryset):
+                for item in self.get_serializer(chunk, many=True).data:
+                    yield renderer.render(item) + b"\n"
+            return
+
+        yield b"["
+        separator = b""
+        for chunk in self.iter_chunks(queryset):
+            rendered = renderer.render(self.get_serializer(chunk, many=True).data)
+            # Strip the brackets of the rendered list.
+            yield separator + rendered[1:-1]
+            separator = b","
+        yield b"]"
+
+
+class DynamicResponseCacheMixin:
+    """
+    Caches the data of the `response_cache_actions` responses
+    in the `response_cache` backend for `response_cache_timeout` seconds,
+    keyed by the viewset, the action, the requested fields, the query params,
+    the url kwargs, the user and the versions of the models,
+    that the planned queryset touches.
+    The versions are bumped by the saves and deletes of those models.
+    Has to be used along with the `DynamicQuerySetMixin`.
+    """
+
+    response_cache = None
+    response_cache_timeout = 60
+    response_cache_actions = {"list", "retrieve"}
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_response_cache_scope(self):
+        return getattr(self.request.user, "pk", None)
+
+    def get_response_cache_models(self):
+        key = (type(self), self.action, self.requested_fields)
+        labels = response_models_cache.get(key)
+        if labels is None:
+            labels = get_queryset_models(self.get_queryset())
+            response_models_cache.set(key, labels)
+        return labels
+
+    def get_response_cache_key(self):
+        labels = self.get_response_cache_models()
+        requested_fields = self.requested_fields
+        return get_response_cache_key(
+            (
+                type(self).__module__,
+                type(self).__qualname__,
+                self.action,
+                None if requested_fields is None else str(requested_fields),
+                sorted(
+                    (name, tuple(values))
+                    for name, values in self.request.query_params.lists()
+                    if name != "fields"
+                ),
+                sorted(self.kwargs.items()),
+                self.get_response_cache_scope(),
+                labels,
+                self.response_cache.get_versions(labels),
+            )
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if (
+            self.response_cache is None
+            or self.action not in self.response_cache_actions
+        ):
+            return handler(request, *args, **kwargs)
+        register_backend(self.response_cache)
+        key = self.get_response_cache_key()
+        data = self.response_cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.response_cache.set(
+                key, freeze_response_data(response.data), self.response_cache_timeout
+            )
+        return response
+
+
 class DynamicFieldsMixin:
     pk_field_name = "id"
     representation_fields = {}
+    cache_readable_fields = False
+    readable_fields_cache_size = 128
+    compile_representation = False
+    fragment_cache = None
+    fragment_cache_timeout = 300
 
     def __init__(self, *args, **kwargs):
-        self.requested_fields = kwargs.pop("requested_fields", None)
+        requested_fields = kwargs.pop("requested_fields", None)
+        if requested_fields is not None and not isinstance(
+            requested_fields, FieldTree
+        ):
+            requested_fields = FieldTree.from_mapping(requested_fields)
+        self.requested_fields = requested_fields
         super().__init__(*args, **kwargs)
 
     @staticmethod
@@ -124,15 +655,48 @@ class DynamicFieldsMixin:
         # For the hijacked RelatedField's `get_attribute`.
         return True
 
+    @property
+    def represents_pk_only(self):
+        return (
+            len(self._readable_fields) == 1
+            and self._readable_fields[0].field_name == self.pk_field_name
+        )
+
+    @property
+    def direct_attribute_access(self):
+        # Unless the pk optimization is used,
+        # the attribute is read in the same way as by the regular fields.
+        # The recorded queries have to be run by this field's `get_attribute`,
+        # to be attributed to its path.
+        # The cached fragments are looked up by the pk, before the instance is read.
+        return (
+            not self.represents_pk_only
+            and self.fragment_cache is None
+            and get_current_recorder() is None
+        )
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_serializer = super().many_init(*args, **kwargs)
+        list_serializer.__class__ = get_dynamic_list_serializer_class(
+            type(list_serializer)
+        )
+        return list_serializer
+
     def get_attribute(self, instance):
+        # The queries run to read the attribute belong to this field.
+        recorder = get_current_recorder()
+        if recorder is None:
+            return self.get_attribute_value(instance)
+        with recorder.at(self.field_path, lazy=True):
+            return self.get_attribute_value(instance)
+
+    def get_attribute_value(self, instance):
         # If the only field we need to represent is the `id`,
         # we should grab it in an optimized way,
         # to not trigger a query if it isn't selected.
         # For that we hijack the RelatedField's `get_attribute`.
-        if (
-            len(self._readable_fields) == 1
-            and self._readable_fields[0].field_name == self.pk_field_name
-        ):
+        if self.represents_pk_only:
             try:
                 pk_only = RelatedField.get_attribute(self, instance)
                 setattr(pk_only, self.pk_field_name, pk_only.pk)
@@ -140,6 +704,22 @@ class DynamicFieldsMixin:
             # Will be raised in case of reverse OneToOneField.
             except TypeError:
                 pass
+        if self.fragment_cache is not None:
+            # The batch loads look the representations up for all the instances.
+            looked_up = getattr(instance, LOOKED_UP_FRAGMENTS, {})
+            if len(self.source_attrs) == 1 and self.source in looked_up:
+                data = looked_up[self.source]
+                if data is not None:
+                    return CachedFragment(data)
+                value = super().get_attribute(instance)
+                return None if value is None else MissingFragment(value)
+            # The related instance isn't needed, if its representation is cached.
+            value = RelatedField.get_attribute(self, instance)
+            if not isinstance(value, PKOnlyObject) or value.pk is None:
+                return value
+            data = self._fragments.get(value.pk, self._fragment_versions)
+            if data is not None:
+                return CachedFragment(data)
         return super().get_attribute(instance)
 
     @staticmethod
@@ -152,8 +732,127 @@ class DynamicFieldsMixin:
             )
         return False
 
+    @classmethod
+    def get_class_cache(cls, name):
+        # Every class has to have its own caches,
+        # so those aren't inherited from the parent classes.
+        cache = cls.__dict__.get(name)
+        if cache is None:
+            cache = LRUCache(maxsize=cls.readable_fields_cache_size)
+            setattr(cls, name, cache)
+        return cache
+
+    @classmethod
+    def get_readable_fields_cache(cls):
+        return cls.get_class_cache("_readable_fields_cache")
+
+    @classmethod
+    def get_representation_cache(cls):
+        return cls.get_class_cache("_representation_cache")
+
+    @cached_property
+    def field_path(self):
+        return get_field_path(self)
+
+    def to_representation(self, instance):
+        recorder = get_current_recorder()
+        if recorder is None:
+            return self.represent(instance)
+        with recorder.serializing(self.field_path):
+            return self.represent(instance)
+
+    def represent(self, instance):
+        if isinstance(instance, CachedFragment):
+            return instance.data
+        if self.fragment_cache is None:
+            return self.render(instance)
+        versions = self._fragment_versions
+        if isinstance(instance, MissingFragment):
+            instance, data = instance.instance, None
+        else:
+            data = self._fragments.get(instance.pk, versions)
+        if data is None:
+            data = self.render(instance)
+            self._fragments.set(instance.pk, versions, data)
+        return data
+
+    def render(self, instance):
+        if self.compile_representation:
+            return self._compiled_representation(instance)
+        return super().to_representation(instance)
+
+    @cached_property
+    def _fragments(self):
+        cache = self.get_class_cache("_fragments_cache")
+        fragments = cache.get(self.requested_fields)
+        if fragments is None:
+            fragments = Fragments(
+                type(self),
+                self.requested_fields,
+                get_serializer_labels(self),
+                self.fragment_cache,
+                self.fragment_cache_timeout,
+            )
+            cache.set(self.requested_fields, fragments)
+        return fragments
+
+    @cached_property
+    def _fragment_versions(self):
+        # Read once per serialization.
+        return self._fragments.get_versions()
+
+    @cached_property
+    def _compiled_representation(self):
+        fields = self._readable_fields
+        signature = get_representation_signature(fields)
+        cache = self.get_representation_cache()
+        factory = cache.get(signature)
+        if factory is None:
+            factory = compile_representation(fields)
+            cache.set(signature, factory)
+        return factory(*fields)
+
+    @staticmethod
+    def clone_field(field, parent):
+        """
+        A cheap alternative to `copy.deepcopy`, that shares everything
+        but the binding with the original field.
+        Nested serializers and many related fields are cloned with their children,
+        and will pick their own readable fields from the cache.
+        """
+        clone = object.__new__(field.__class__)
+        clone.__dict__.update(field.__dict__)
+        clone.__dict__.pop("_readable_fields", None)
+        clone.__dict__.pop("fields", None)
+        clone.__dict__.pop("_compiled_representation", None)
+        clone.__dict__.pop("field_path", None)
+        clone.__dict__.pop("_fragments", None)
+        clone.__dict__.pop("_fragment_versions", None)
+        clone.parent = parent
+        if hasattr(field, "child"):
+            clone.child = DynamicFieldsMixin.clone_field(field.child, clone)
+        if hasattr(field, "child_relation"):
+            clone.child_relation = DynamicFieldsMixin.clone_field(
+                field.child_relation, clone
+            )
+        return clone
+
     @cached_property
     def _readable_fields(self):
+        if not self.cache_readable_fields:
+            return self.get_readable_fields()
+
+        cache = self.get_readable_fields_cache()
+        templates = cache.get(self.requested_fields)
+        if templates is None:
+            # Templates must not hold a reference to this serializer instance.
+            templates = [
+                self.clone_field(field, None) for field in self.get_readable_fields()
+            ]
+            cache.set(self.requested_fields, templates)
+        return [self.clone_field(field, self) for field in templates]
+
+    def get_readable_fields(self):
         base_fields = self.fields
         fields = {}
         representation_fields = copy.deepcopy(self.representation_fields)
@@ -191,3 +890,37 @@ class DynamicFieldsMixin:
             fields[field_name] = field
 
         return [field for field in fields.values() if not field.write_only]
+
+
+class DynamicListSerializerMixin:
+    """
+    Attributes the queries run while the list is iterated
+    (e.g. a relation, that isn't prefetched) to the list's path.
+    """
+
+    @cached_property
+    def field_path(self):
+        return get_field_path(self)
+
+    def to_representation(self, data):
+        recorder = get_current_recorder()
+        if recorder is None:
+            return super().to_representation(data)
+        with recorder.at(self.field_path, lazy=True):
+            return super().to_representation(data)
+
+
+_list_serializer_classes = {}
+
+
+def get_dynamic_list_serializer_class(list_serializer_class):
+    if issubclass(list_serializer_class, DynamicListSerializerMixin):
+        return list_serializer_class
+    dynamic_class = _list_serializer_classes.get(list_serializer_class)
+    if dynamic_class is None:
+        dynamic_class = _list_serializer_classes[list_serializer_class] = type(
+            list_serializer_class.__name__,
+            (DynamicListSerializerMixin, list_serializer_class),
+            {},
+        )
+    return dynamic_class
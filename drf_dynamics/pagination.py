@@ -0,0 +1,256 @@
+import functools
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    CursorPagination,
+    LimitOffsetPagination,
+    PageNumberPagination,
+)
+from rest_framework.utils.urls import replace_query_param
+
+from .values import add_values_fields
+
+SeekCursor = namedtuple("SeekCursor", ("reverse", "position"))
+
+
+def get_count(queryset, view):
+    """
+    Counts the rows with the lean count queryset of the view, if it has one.
+    """
+    if hasattr(view, "get_dynamic_count"):
+        return view.get_dynamic_count(queryset)
+    try:
+        return queryset.count()
+    except (AttributeError, TypeError):
+        return len(queryset)
+
+
+class DynamicPaginator(Paginator):
+    """
+    A Django paginator, that takes the amount of rows from the `count` callable.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.get_count = count
+
+    @cached_property
+    def count(self):
+        if self.get_count is None:
+            return super().count
+        return self.get_count()
+
+
+class DynamicPageNumberPagination(PageNumberPagination):
+    django_paginator_class = DynamicPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = functools.partial(
+            type(self).django_paginator_class,
+            count=functools.partial(get_count, queryset, view),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class DynamicLimitOffsetPagination(LimitOffsetPagination):
+    def paginate_queryset(self, queryset, request, view=None):
+        self.view = view
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count(self, queryset):
+        return get_count(queryset, self.view)
+
+
+class DynamicCursorPagination(CursorPagination):
+    """
+    A keyset pagination, which seeks to the page by the values
+    of the ordering fields and the pk of the boundary row,
+    so the deep pages are as cheap as the first one.
+    The ordering fields may be the dynamic annotations of the root queryset,
+    those are applied by the view, even if they aren't requested.
+    `NULL` values are ordered last.
+    """
+
+    ordering = "-pk"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        ordering = self.get_ordering(request, queryset, view)
+        if hasattr(view, "setup_dynamic_ordering"):
+            queryset = view.setup_dynamic_ordering(queryset, ordering)
+        self.ordering = self.get_seek_ordering(queryset, ordering)
+        self.ordering_fields = self.get_ordering_fields(queryset, self.ordering)
+        # The rows of the values plans have to hold the position too.
+        queryset = add_values_fields(
+            queryset, [field_name.lstrip("-") for field_name in self.ordering]
+        )
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, position = False, None
+        else:
+            reverse, position = self.cursor
+
+        queryset = queryset.order_by(*self.get_order_by(self.ordering, reverse))
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_seek_filter(self.ordering, position, reverse)
+            )
+
+        # The prefetches of the queryset only run for the rows of the page.
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if results:
+            self.next_position = self.get_position(results[-1])
+            self.previous_position = self.get_position(results[0])
+        else:
+            self.next_position = self.previous_position = position
+
+        if (self.has_next or self.has_previous) and self.template is not None:
+            self.display_page_controls = True
+
+        return results
+
+    def get_seek_ordering(self, queryset, ordering):
+        """
+        Makes the ordering unique by adding the pk, if it isn't there.
+        """
+        field_names = {field_name.lstrip("-") for field_name in ordering}
+        if field_names.isdisjoint({"pk", queryset.model._meta.pk.name}):
+            ordering = (*ordering, "-pk" if ordering[-1].startswith("-") else "pk")
+        return ordering
+
+    @staticmethod
+    def get_ordering_fields(queryset, ordering):
+        """
+        The model fields of the ordering, or the output fields of the annotations.
+        """
+        fields = []
+        for field_name in ordering:
+            name = field_name.lstrip("-")
+            if name in queryset.query.annotations:
+                fields.append(queryset.query.annotations[name].output_field)
+            elif name == "pk":
+                fields.append(queryset.model._meta.pk)
+            else:
+                fields.append(queryset.model._meta.get_field(name))
+        return fields
+
+    @staticmethod
+    def get_order_by(ordering, reverse):
+        """
+        The ordering of the query, backwards if the previous page is requested.
+        """
+        for field_name in ordering:
+            expression = F(field_name.lstrip("-"))
+            nulls = {"nulls_first": reverse, "nulls_last": not reverse}
+            if field_name.startswith("-") != reverse:
+                yield expression.desc(**nulls)
+            else:
+                yield expression.asc(**nulls)
+
+    @staticmethod
+    def get_seek_filter(ordering, position, reverse):
+        """
+        Filters the rows, that follow the `position` in the query ordering:
+        `a > x OR (a = x AND b > y) OR ...`, with `NULL` values following
+        all the others, or preceding those if the query goes backwards.
+        """
+        seek_filter = Q()
+        equal = Q()
+        for field_name, value in zip(ordering, position):
+            name = field_name.lstrip("-")
+            if value is None:
+                follows = Q(**{f"{name}__isnull": False}) if reverse else None
+                equal_value = Q(**{f"{name}__isnull": True})
+            else:
+                operator = "lt" if field_name.startswith("-") != reverse else "gt"
+                follows = Q(**{f"{name}__{operator}": value})
+                if not reverse:
+                    follows |= Q(**{f"{name}__isnull": True})
+                equal_value = Q(**{name: value})
+            if follows is not None:
+                seek_filter |= equal & follows
+            equal &= equal_value
+        return seek_filter
+
+    def get_position(self, instance):
+        position = []
+        for field_name in self.ordering:
+            name = field_name.lstrip("-")
+            if isinstance(instance, dict):
+                # Rows of the values fast path.
+                position.append(instance[name])
+            else:
+                position.append(getattr(instance, name))
+        return position
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(SeekCursor(False, self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(SeekCursor(True, self.previous_position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            reverse = bool(cursor["r"])
+            position = cursor["p"]
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # The position is converted by the ordering fields, as the cursor may be forged.
+        try:
+            position = [
+                self.clean_position_value(field, value)
+                for field, value in zip(self.ordering_fields, position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return SeekCursor(reverse, position)
+
+    @staticmethod
+    def clean_position_value(field, value):
+        if value is None:
+            return None
+        if not isinstance(value, (str, int, float, bool)):
+            raise TypeError("The position values have to be scalars.")
+        return field.to_python(value)
+
+    def encode_cursor(self, cursor):
+        encoded = urlsafe_b64encode(
+            json.dumps(
+                {"r": int(cursor.reverse), "p": cursor.position},
+                cls=DjangoJSONEncoder,
+                separators=(",", ":"),
+            ).encode("ascii")
+        ).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
@@ -0,0 +1,185 @@
+import threading
+from collections import namedtuple
+
+from .helpers import get_relation_field
+from .specs import DynamicPrefetch, DynamicSelect
+
+Candidate = namedtuple(
+    "Candidate", ("path", "tag", "parent_path", "related_model", "width", "cardinality")
+)
+
+
+class PlannerStats:
+    """
+    The row counts observed per viewset class and path (`None` being the root),
+    smoothed with an exponential moving average.
+    """
+
+    def __init__(self, smoothing=0.2):
+        self.smoothing = smoothing
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def get_rows(self, view_class, path):
+        return self._rows.get((view_class, path))
+
+    def observe(self, view_class, path, rows):
+        key = (view_class, path)
+        with self._lock:
+            average = self._rows.get(key)
+            if average is None:
+                self._rows[key] = float(rows)
+            else:
+                self._rows[key] = average + self.smoothing * (rows - average)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+
+class CostPlanner:
+    """
+    Chooses between joining a to-one relation with `select_related`
+    and fetching it with a separate prefetch query.
+
+    The cost is measured in the amount of cells to transfer:
+    a join repeats the related columns for every parent row,
+    while a prefetch costs an extra query (`query_cost` cells)
+    and the distinct related rows.
+    The parent row counts and the distinct related rows per parent row
+    are taken from the rows observed by the instrumentation,
+    falling back to the `default_rows` and the specs' `cardinality` hints.
+    The row width defaults to the amount of the related model's columns.
+
+    Only the relations without any specs under those,
+    and the prefetches without a custom queryset, can be switched.
+    """
+
+    def __init__(self, query_cost=1000, default_rows=100, stats=None):
+        self.query_cost = query_cost
+        self.default_rows = default_rows
+        self.stats = PlannerStats() if stats is None else stats
+        self._candidates = {}
+
+    def get_candidates(self, view_class, root_model, prefetches, annotations, selects):
+        candidates = self._candidates.get(view_class)
+        if candidates is None:
+            candidates = self._candidates[view_class] = tuple(
+                self.collect_candidates(root_model, prefetches, annotations, selects)
+            )
+        return candidates
+
+    def collect_candidates(self, root_model, prefetches, annotations, selects):
+        nested_parents = {
+            path.rsplit(".", 1)[0]
+            for path in (*prefetches, *annotations, *selects)
+            if path.count(".") != 0
+        }
+        for tag, specs in (("prefetch", prefetches), ("select", selects)):
+            for path, spec in specs.items():
+                if "__" in spec.lookup or any(
+                    parent == path or parent.startswith(f"{path}.")
+                    for parent in nested_parents
+                ):
+                    continue
+                if tag == "prefetch" and not is_plain_prefetch(spec):
+                    continue
+                relation = get_relation_field(
+                    get_parent_model(root_model, prefetches, spec), spec.lookup
+                )
+                if relation is None or relation.one_to_many or relation.many_to_many:
+                    continue
+                related_model = relation.related_model
+                yield Candidate(
+                    path,
+                    tag,
+                    spec.parent_prefetch_path,
+                    related_model,
+                    spec.width or len(related_model._meta.concrete_fields),
+                    spec.cardinality,
+                )
+
+    def get_cardinality(self, view_class, candidate, parent_rows):
+        rows = self.stats.get_rows(view_class, candidate.path)
+        if rows is not None and parent_rows:
+            return min(rows / parent_rows, 1.0)
+        if candidate.cardinality is not None:
+            return candidate.cardinality
+        return 1.0
+
+    def choose_strategy(self, view_class, candidate):
+        parent_rows = self.stats.get_rows(view_class, candidate.parent_path)
+        if parent_rows is None:
+            parent_rows = self.default_rows
+        cardinality = self.get_cardinality(view_class, candidate, parent_rows)
+        join_cost = parent_rows * candidate.width
+        # The prefetch also sends the ids of the parent rows.
+        prefetch_cost = (
+            self.query_cost + parent_rows * cardinality * candidate.width + parent_rows
+        )
+        return "prefetch" if prefetch_cost < join_cost else "select"
+
+    def get_decisions(self, view_class, root_model, prefetches, annotations, selects):
+        """
+        Returns the sorted `(path, strategy)` pairs of the specs,
+        which strategy is switched.
+        """
+        decisions = []
+        for candidate in self.get_candidates(
+            view_class, root_model, prefetches, annotations, selects
+        ):
+            strategy = self.choose_strategy(view_class, candidate)
+            if strategy != candidate.tag:
+                decisions.append((candidate.path, strategy))
+        return tuple(sorted(decisions))
+
+    def apply_decisions(self, decisions, root_model, prefetches, selects):
+        """
+        Returns the `prefetches` and `selects` with the `decisions` applied.
+        """
+        prefetches = dict(prefetches)
+        selects = dict(selects)
+        for path, strategy in decisions:
+            if strategy == "prefetch":
+                spec = selects.pop(path)
+                related_model = get_relation_field(
+                    get_parent_model(root_model, prefetches, spec), spec.lookup
+                ).related_model
+                prefetches[path] = DynamicPrefetch(
+                    spec.lookup,
+                    related_model._meta.default_manager.all(),
+                    pk_field_name=spec.pk_field_name,
+                    parent_prefetch_path=spec.parent_prefetch_path,
+                )
+            else:
+                spec = prefetches.pop(path)
+                selects[path] = DynamicSelect(
+                    spec.lookup,
+                    spec.queryset.model._meta.pk.name,
+                    parent_prefetch_path=spec.parent_prefetch_path,
+                )
+        return prefetches, selects
+
+    def observe(self, view_class, recorder):
+        """
+        Records the rows fetched for the root and the prefetches of a request.
+        """
+        for path, metrics in recorder.metrics.items():
+            if metrics.queries and metrics.rows:
+                self.stats.observe(view_class, path, metrics.rows)
+
+
+def is_plain_prefetch(spec):
+    if spec.get_queryset is not None or spec.to_attr is not None:
+        return False
+    query = spec.queryset.query
+    return (
+        not (query.where or query.annotations or query.select_related)
+        and not spec.queryset._prefetch_related_lookups
+    )
+
+
+def get_parent_model(root_model, prefetches, spec):
+    if spec.parent_prefetch_path is None:
+        return root_model
+    return prefetches[spec.parent_prefetch_path].queryset.model
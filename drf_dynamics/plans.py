@@ -0,0 +1,476 @@
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+
+from .aggregates import AggregateLoad, get_parent_attrs
+from .asynchronous import call_async, call_sync
+from .batches import BatchLoad, BatchLoader, get_batch_attrs, get_prefetch_attrs
+from .cache import LRUCache
+from .helpers import get_relation_field, tagged_chain
+from .limits import PrefetchLimit, PrefetchTotalLoad, get_prefetch_limit, limit_queryset
+from .planner import is_plain_prefetch
+from .specs import DynamicAggregate
+from .values import ValuesPlanCompiler
+
+PlanOperation = namedtuple("PlanOperation", ("tag", "path", "target", "arg"))
+
+plan_cache = LRUCache(maxsize=256)
+
+
+class QueryPlan:
+    """
+    A flat list of operations, that a dynamic queryset is set up with.
+    Every operation is applied either to the root queryset,
+    if its `target` is `None`, or to the queryset of the prefetch at `target` path.
+    Plans don't depend on the request, so those can be cached and replayed.
+    If the `instrument` callable is given, it's called with every queryset
+    set up by the plan and its path (`None` for the root queryset).
+    The batch loads are run by the root queryset, once its instances are fetched.
+    """
+
+    def __init__(self, operations, values_plan=None):
+        self.operations = tuple(operations)
+        self.values_plan = values_plan
+
+    def get_strategies(self):
+        """
+        The mapping of the planned relation paths to `"prefetch"` or `"select"`.
+        """
+        return {
+            operation.path: operation.tag
+            for operation in self.operations
+            if operation.tag in ("prefetch", "select")
+        }
+
+    def apply(self, queryset, request, instrument=None):
+        steps = self.iter_steps(queryset, request, instrument)
+        result = None
+        while True:
+            try:
+                function, args = steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result = call_sync(function, *args)
+
+    async def aapply(self, queryset, request, instrument=None):
+        """
+        The `apply` for the async code, which awaits the async callables
+        of the `DynamicPrefetch` querysets and the async annotation methods.
+        """
+        steps = self.iter_steps(queryset, request, instrument)
+        result = None
+        while True:
+            try:
+                function, args = steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result = await call_async(function, *args)
+
+    def iter_steps(self, queryset, request, instrument):
+        """
+        Applies the operations, yielding the request dependent calls
+        (the prefetch querysets and the annotations) as `(function, args)`
+        to the caller, which sends their results back.
+        Returns the queryset.
+        """
+        prefetches_map = {}
+        batch_loads = []
+        aggregate_loads = []
+
+        for tag, path, target, arg in self.operations:
+            args = (arg,)
+            if tag == "batch":
+                batch_loads.append(arg)
+                continue
+            if tag == "aggregate":
+                aggregate_loads.append(arg)
+                continue
+            if tag == "limit":
+                # The `target` is the parent of the limited prefetch at `path`.
+                parent_model = (
+                    queryset.model
+                    if target is None
+                    else prefetches_map[target].queryset.model
+                )
+                prefetch = prefetches_map[path]
+                prefetch.queryset = limit_queryset(prefetch.queryset, parent_model, arg)
+                continue
+            if tag == "prefetch":
+                prefetch_queryset = (
+                    (yield arg.get_queryset, (request,))
+                    if arg.get_queryset is not None
+                    else arg.queryset
+                )
+                if instrument is not None:
+                    prefetch_queryset = instrument(prefetch_queryset, path)
+                prefetch = models.Prefetch(arg.lookup, prefetch_queryset, arg.to_attr)
+                prefetches_map[path] = prefetch
+                method = "prefetch_related"
+                args = (prefetch,)
+            elif tag == "annotation":
+                method = arg
+                args = (request,)
+            elif tag == "select":
+                method = "select_related"
+            else:
+                method = "only"
+                args = arg
+
+            if target is not None:
+                prefetch = prefetches_map[target]
+                if tag == "annotation":
+                    prefetch.queryset = yield getattr(prefetch.queryset, method), args
+                else:
+                    prefetch.queryset = getattr(prefetch.queryset, method)(*args)
+            elif tag == "annotation":
+                queryset = yield getattr(queryset, method), args
+            else:
+                queryset = getattr(queryset, method)(*args)
+
+        if self.values_plan is not None:
+            queryset = self.values_plan.apply(queryset, prefetches_map, instrument)
+        elif batch_loads or aggregate_loads:
+            queryset = BatchLoader(batch_loads, instrument, aggregate_loads).attach(
+                queryset
+            )
+        if instrument is not None:
+            queryset = instrument(queryset, None)
+        return queryset
+
+
+def compile_plan(
+    root_model,
+    requested_fields,
+    prefetches,
+    annotations,
+    selects,
+    only_fields=True,
+    values=False,
+    batch_loads=None,
+    fragments=None,
+    serializer=None,
+):
+    """
+    Compiles the `QueryPlan` for the `requested_fields`
+    out of the `dynamic_queryset` specs.
+    The batch loads of the paths in `fragments` skip the cached instances.
+    The values plan renders the foreign keys, that the related fields
+    of the `serializer` render, and falls back to the models without it.
+    """
+    batch_loads = batch_loads or {}
+    fragments = fragments or {}
+    operations = []
+    selected_paths = set()
+    planned_prefetches = {}
+    aggregated_fields = {}
+    limits = {}
+    allow_all_fields = requested_fields is None
+
+    for tag, (path, spec) in tagged_chain(
+        prefetches.items(),
+        annotations.items(),
+        selects.items(),
+        batch_loads.items(),
+        tag_names=("prefetch", "annotation", "select", "batch"),
+    ):
+        if not allow_all_fields:
+            requested_slice = requested_fields.lookup(path)
+            if requested_slice is None:
+                continue
+            # If the only field we're requesting is a pk,
+            # we don't need to select it.
+            # Make sure your serializer grabs the value smartly, though.
+            pk_field_name = getattr(spec, "pk_field_name", None)
+            if (
+                tag != "annotation"
+                and pk_field_name is not None
+                and requested_slice.is_pk_only(pk_field_name)
+            ):
+                continue
+
+        if tag == "prefetch":
+            limit = get_prefetch_limit(
+                spec,
+                None if allow_all_fields else requested_slice,
+                get_prefetch_relation(root_model, prefetches, path),
+            )
+            if limit is not None:
+                limits[path] = PrefetchLimit(
+                    spec.lookup, limit, spec.ordering, spec.count_attr is not None
+                )
+            else:
+                planned_prefetches[path] = spec
+            arg = spec
+        elif isinstance(spec, DynamicAggregate):
+            tag = "aggregate"
+            prefetch_path = find_aggregated_prefetch(spec, planned_prefetches)
+            if prefetch_path is not None and spec.field != "pk":
+                aggregated_fields.setdefault(prefetch_path, set()).add(spec.field)
+            arg = AggregateLoad(
+                path,
+                get_parent_attrs(spec, prefetches),
+                spec,
+                prefetch_path is not None,
+            )
+        elif tag == "annotation":
+            arg = spec.method_name
+        elif tag == "batch":
+            arg = BatchLoad(
+                path, get_batch_attrs(spec, prefetches), spec, fragments.get(path)
+            )
+        else:
+            selected_paths.add(path)
+            arg = spec.lookup
+        operations.append(PlanOperation(tag, path, spec.parent_prefetch_path, arg))
+        if path in limits:
+            # Applied before any of the operations nested under the prefetch.
+            operations.append(
+                PlanOperation("limit", path, spec.parent_prefetch_path, limits[path])
+            )
+            if spec.count_attr is not None:
+                operations.append(
+                    PlanOperation(
+                        "aggregate",
+                        path,
+                        None,
+                        PrefetchTotalLoad(
+                            get_prefetch_attrs(spec, prefetches), spec.count_attr
+                        ),
+                    )
+                )
+
+    if only_fields and not allow_all_fields:
+        compiler = OnlyFieldsCompiler(
+            root_model, requested_fields, prefetches, annotations, selects, batch_loads
+        )
+        prefetch_paths = [
+            operation.path for operation in operations if operation.tag == "prefetch"
+        ]
+        for path in (None, *prefetch_paths):
+            fields = compiler.get_only_fields(path, selected_paths)
+            if fields is not None:
+                # The fields aggregated in memory have to be fetched too.
+                fields = tuple(sorted({*fields, *aggregated_fields.get(path, ())}))
+                operations.append(PlanOperation("only", None, path, fields))
+        # The batch loaded instances are narrowed by their own queries.
+        for index, operation in enumerate(operations):
+            if operation.tag == "batch":
+                batch_load = operation.arg._replace(
+                    only_fields=compiler.get_batch_only_fields(operation.path)
+                )
+                operations[index] = operation._replace(arg=batch_load)
+
+    values_plan = None
+    # The values of the limited prefetches aren't numbered.
+    if values and not limits:
+        values_plan = ValuesPlanCompiler(
+            root_model, requested_fields, prefetches, annotations, selects, serializer
+        ).compile(selected_paths)
+
+    return QueryPlan(operations, values_plan)
+
+
+def get_prefetch_relation(root_model, prefetches, path):
+    """
+    The relation field of the prefetch at `path`, resolved from the `root_model`
+    through the lookups of its parent prefetches, or `None`, if it can't be.
+    """
+    spec = prefetches[path]
+    if spec.parent_prefetch_path is None:
+        parent_model = root_model
+    else:
+        parent_relation = get_prefetch_relation(
+            root_model, prefetches, spec.parent_prefetch_path
+        )
+        if parent_relation is None:
+            return None
+        parent_model = parent_relation.related_model
+    return get_relation_field(parent_model, spec.lookup)
+
+
+def find_aggregated_prefetch(spec, planned_prefetches):
+    """
+    The path of the planned prefetch of the collection, that the aggregate `spec`
+    may be computed from in memory, if there's one.
+    It has to fetch every row of the collection, as the aggregate would.
+    """
+    if spec.queryset is not None:
+        return None
+    for path, prefetch in planned_prefetches.items():
+        if (
+            prefetch.parent_prefetch_path == spec.parent_prefetch_path
+            and prefetch.lookup == spec.lookup
+            and is_plain_prefetch(prefetch)
+        ):
+            return path
+    return None
+
+
+class OnlyFieldsCompiler:
+    """
+    Determines the columns each queryset of the plan needs
+    to render the requested fields.
+    """
+
+    def __init__(
+        self,
+        root_model,
+        requested_fields,
+        prefetches,
+        annotations,
+        selects,
+        batch_loads=None,
+    ):
+        self.root_model = root_model
+        self.requested_fields = requested_fields
+        self.prefetches = prefetches
+        self.annotations = annotations
+        self.selects = selects
+        self.batch_loads = batch_loads or {}
+
+    def get_only_fields(self, path, selected_paths):
+        """
+        Returns the field names to pass to `only()` for the queryset of `path`
+        (the root queryset if `path` is `None`), or `None` if the requested fields
+        can't be mapped to the model with certainty,
+        in which case the queryset should be left as is.
+        """
+        only_fields = set()
+        if path is None:
+            model = self.root_model
+            requested_slice = self.requested_fields
+        else:
+            spec = self.prefetches[path]
+            if "__" in spec.lookup:
+                return None
+            model = spec.queryset.model
+            requested_slice = self.requested_fields.lookup(path)
+            parent_model = (
+                self.root_model
+                if spec.parent_prefetch_path is None
+                else self.prefetches[spec.parent_prefetch_path].queryset.model
+            )
+            # The prefetched instances have to be matched to their parents,
+            # so keep the column pointing back to the parent, if there is one.
+            relation = get_relation_field(parent_model, spec.lookup)
+            if relation is not None and (relation.one_to_many or relation.one_to_one):
+                if not relation.concrete:
+                    only_fields.add(relation.remote_field.name)
+
+        if not self.collect_only_fields(
+            only_fields, model, model, requested_slice, path, "", selected_paths
+        ):
+            return None
+        only_fields.add(model._meta.pk.name)
+        return tuple(sorted(only_fields))
+
+    def get_batch_only_fields(self, path):
+        """
+        Returns the field names to pass to `only()` for the query of the batch load
+        of `path`, or `None`, if all the columns should be fetched.
+        """
+        spec = self.batch_loads[path]
+        if "__" in spec.lookup:
+            return None
+        if spec.parent_prefetch_path is None:
+            parent_model = self.root_model
+        else:
+            parent_queryset = self.prefetches[spec.parent_prefetch_path].queryset
+            if parent_queryset is None:
+                return None
+            parent_model = parent_queryset.model
+        relation = get_relation_field(parent_model, spec.lookup)
+        if relation is None or not relation.concrete:
+            return None
+        model = relation.related_model if spec.queryset is None else spec.queryset.model
+        # The instances are matched to the foreign keys by the target field.
+        only_fields = {relation.target_field.name}
+        if not self.collect_only_fields(
+            only_fields,
+            model,
+            model,
+            self.requested_fields.lookup(path),
+            path,
+            "",
+            set(),
+        ):
+            return None
+        only_fields.add(model._meta.pk.name)
+        return tuple(sorted(only_fields))
+
+    def collect_only_fields(
+        self,
+        only_fields,
+        target_model,
+        model,
+        requested_slice,
+        path,
+        lookup_prefix,
+        selected_paths,
+    ):
+        for field_name, nested_slice in requested_slice.items():
+            field_path = field_name if path is None else f"{path}.{field_name}"
+            if field_path in self.annotations:
+                continue
+
+            prefetch_spec = self.prefetches.get(field_path)
+            if prefetch_spec is not None:
+                # Forward relations are matched using the column on this model.
+                relation = get_relation_field(
+                    model, prefetch_spec.lookup.split("__", 1)[0]
+                )
+                if relation is not None and relation.concrete:
+                    only_fields.add(f"{lookup_prefix}{relation.name}")
+                continue
+
+            batch_spec = self.batch_loads.get(field_path)
+            if batch_spec is not None:
+                # Only the foreign key is needed, the instances are loaded in bulk.
+                # Batch lookups start from the queryset they're applied to.
+                lookup = batch_spec.lookup
+                if lookup.startswith(lookup_prefix):
+                    lookup = lookup[len(lookup_prefix) :]
+                relation = get_relation_field(model, lookup.split("__", 1)[0])
+                if relation is not None and relation.concrete:
+                    only_fields.add(f"{lookup_prefix}{relation.name}")
+                continue
+
+            select_spec = self.selects.get(field_path)
+            if select_spec is not None:
+                # Select lookups start from the queryset they're applied to.
+                related_model = target_model
+                select_prefix = ""
+                for lookup in select_spec.lookup.split("__"):
+                    relation = get_relation_field(related_model, lookup)
+                    if relation is None:
+                        return False
+                    if relation.concrete:
+                        only_fields.add(f"{select_prefix}{relation.name}")
+                    select_prefix = f"{select_prefix}{relation.name}__"
+                    related_model = relation.related_model
+                if field_path not in selected_paths:
+                    continue
+                if not self.collect_only_fields(
+                    only_fields,
+                    target_model,
+                    related_model,
+                    nested_slice,
+                    field_path,
+                    select_prefix,
+                    selected_paths,
+                ):
+                    return False
+                continue
+
+            try:
+                field = model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                return False
+            if field.many_to_many or not field.concrete:
+                # Those are fetched by separate queries,
+                # and only need the pk of this model.
+                continue
+            only_fields.add(f"{lookup_prefix}{field.name}")
+
+        return True
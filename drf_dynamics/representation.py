@@ -0,0 +1,119 @@
+import keyword
+from collections import OrderedDict
+
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import fields as drf_fields
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+
+# Fields, which `to_representation` is a single builtin call.
+INLINE_REPRESENTATIONS = {
+    drf_fields.CharField: "str",
+    drf_fields.IntegerField: "int",
+    drf_fields.ReadOnlyField: "",
+}
+
+_skip = object()
+
+
+def read_attribute(field, instance):
+    """
+    The regular `get_attribute` of a field, with `SkipField` turned into a marker.
+    """
+    try:
+        return field.get_attribute(instance)
+    except SkipField:
+        return _skip
+
+
+def reads_attribute_directly(field):
+    """
+    Whether the field's value may be read with a plain attribute access.
+    Anything else goes through the field's `get_attribute`.
+    """
+    if type(field).get_attribute is not drf_fields.Field.get_attribute and not getattr(
+        field, "direct_attribute_access", False
+    ):
+        return False
+    if len(field.source_attrs) != 1:
+        return False
+    attr = field.source_attrs[0]
+    return attr.isidentifier() and not keyword.iskeyword(attr)
+
+
+def get_representation_signature(fields):
+    return tuple(
+        (
+            field.field_name,
+            type(field),
+            tuple(field.source_attrs),
+            reads_attribute_directly(field),
+        )
+        for field in fields
+    )
+
+
+def compile_representation(fields):
+    """
+    Generates a factory of a specialized `to_representation` function
+    for the readable `fields` of a serializer.
+    The factory has to be called with the fields of a serializer instance
+    (with the same signature) and returns a function of an instance,
+    which reads the attributes directly, where it's safe to do so,
+    and calls the fields' `to_representation` for the non `None` values.
+    Custom fields fall back to their own `get_attribute`.
+    """
+    lines = ["def factory(%s):" % ", ".join(f"f{i}" for i in range(len(fields)))]
+    for index, field in enumerate(fields):
+        inline = INLINE_REPRESENTATIONS.get(type(field))
+        if inline is None:
+            lines.append(f"    r{index} = f{index}.to_representation")
+    lines.append("    def to_representation(instance):")
+    lines.append("        ret = OrderedDict()")
+    for index, field in enumerate(fields):
+        key = repr(field.field_name)
+        inline = INLINE_REPRESENTATIONS.get(type(field))
+        representation = f"r{index}(value)" if inline is None else f"{inline}(value)"
+        if reads_attribute_directly(field):
+            lines.extend(
+                (
+                    "        try:",
+                    f"            value = instance.{field.source_attrs[0]}",
+                    "        except (AttributeError, ObjectDoesNotExist):",
+                    f"            value = read_attribute(f{index}, instance)",
+                    "        else:",
+                    "            if callable(value):",
+                    f"                value = read_attribute(f{index}, instance)",
+                    "        if value is not _skip:",
+                    f"            ret[{key}] = None if value is None"
+                    f" else {representation}",
+                )
+            )
+            continue
+
+        # The same as the generic `Serializer.to_representation` loop.
+        lines.extend(
+            (
+                f"        value = read_attribute(f{index}, instance)",
+                "        if value is not _skip:",
+                "            if isinstance(value, PKOnlyObject):",
+                f"                ret[{key}] = None if value.pk is None"
+                f" else {representation}",
+                "            elif value is None:",
+                f"                ret[{key}] = None",
+                "            else:",
+                f"                ret[{key}] = {representation}",
+            )
+        )
+    lines.append("        return ret")
+    lines.append("    return to_representation")
+
+    namespace = {
+        "OrderedDict": OrderedDict,
+        "ObjectDoesNotExist": ObjectDoesNotExist,
+        "PKOnlyObject": PKOnlyObject,
+        "read_attribute": read_attribute,
+        "_skip": _skip,
+    }
+    exec(compile("\n".join(lines), "<drf_dynamics representation>", "exec"), namespace)
+    return namespace["factory"]
@@ -0,0 +1,110 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Manager
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+from .fragments import CachedFragment, MissingFragment
+from .helpers import get_field_path
+from .instrumentation import get_current_recorder
+
+
+class BatchedField(serializers.Field):
+    """
+    A read only field, which values are resolved in batches.
+    The `resolver` is called once per serialization, with the list of the keys
+    (the `source` attribute, the pk by default) of every instance
+    the field is rendered for, anywhere in the serialized tree,
+    and the serializer context.
+    It has to return a mapping of the keys to the values,
+    the missing keys are rendered as `None`.
+    """
+
+    def __init__(self, resolver, **kwargs):
+        kwargs["read_only"] = True
+        kwargs.setdefault("source", "pk")
+        super().__init__(**kwargs)
+        self.resolver = resolver
+
+    def to_representation(self, value):
+        values = get_batched_values(self.root).get(self.resolver)
+        if values is None:
+            # The instance wasn't reachable from the root serializer's instance.
+            values = self.resolver([value], self.root.context)
+        return values.get(value)
+
+
+def get_batched_values(root):
+    """
+    The resolved values of every resolver of the `root` serializer's tree,
+    resolved on the first access.
+    """
+    batched_values = root.__dict__.get("_batched_values")
+    if batched_values is None:
+        batched_values = root._batched_values = resolve_batches(root)
+    return batched_values
+
+
+def iter_instances(value):
+    if isinstance(value, Manager):
+        value = value.all()
+    return value if value is not None else ()
+
+
+def read_related(field, instances):
+    for instance in instances:
+        try:
+            value = field.get_attribute(instance)
+        except (SkipField, AttributeError, ObjectDoesNotExist):
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            yield from iter_instances(value)
+        # The cached representations are rendered already.
+        elif isinstance(value, MissingFragment):
+            yield value.instance
+        elif value is not None and not isinstance(value, CachedFragment):
+            yield value
+
+
+def collect_batch_keys(serializer, instances, batches):
+    """
+    Collects the keys of the `BatchedField`s among the readable fields
+    of the `serializer` and its nested serializers into the `batches`,
+    a mapping of a resolver to its keys and the paths of its fields.
+    """
+    instances = list(instances)
+    if not instances:
+        return
+    for field in serializer._readable_fields:
+        if isinstance(field, BatchedField):
+            keys, paths = batches.setdefault(field.resolver, ({}, set()))
+            for instance in instances:
+                try:
+                    key = field.get_attribute(instance)
+                except SkipField:
+                    continue
+                if key is not None:
+                    keys[key] = None
+            paths.add(get_field_path(field))
+        elif isinstance(field, serializers.ListSerializer):
+            collect_batch_keys(field.child, read_related(field, instances), batches)
+        elif isinstance(field, serializers.BaseSerializer):
+            collect_batch_keys(field, read_related(field, instances), batches)
+
+
+def resolve_batches(root):
+    if isinstance(root, serializers.ListSerializer):
+        serializer, instances = root.child, iter_instances(root.instance)
+    else:
+        serializer, instances = root, (root.instance,)
+    batches = {}
+    collect_batch_keys(serializer, instances, batches)
+
+    recorder = get_current_recorder()
+    batched_values = {}
+    for resolver, (keys, paths) in batches.items():
+        if recorder is None:
+            batched_values[resolver] = resolver(list(keys), root.context)
+            continue
+        with recorder.at("+".join(sorted(paths))):
+            batched_values[resolver] = resolver(list(keys), root.context)
+    return batched_values
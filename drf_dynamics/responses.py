@@ -0,0 +1,243 @@
+import hashlib
+import pickle
+import threading
+import time
+import weakref
+
+from django.apps import apps
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Prefetch
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .aggregates import AggregateLoad
+from .cache import LRUCache
+from .helpers import get_relation_field
+
+# The backends, that the saves and deletes of the models bump the versions in.
+_backends = weakref.WeakSet()
+_backends_lock = threading.Lock()
+
+# The models, the planned querysets touch, per viewset, action and requested fields.
+response_models_cache = LRUCache(maxsize=256)
+
+
+class LocalResponseCache:
+    """
+    An in-process response cache, bounded by the amount of the entries,
+    which also expire after their timeout.
+    The model versions are only bumped by the saves of this process,
+    so it's only consistent, if the data is changed by the same process.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.entries = LRUCache(maxsize=maxsize)
+        self.versions = {}
+        self._lock = threading.Lock()
+        register_backend(self)
+
+    def get_version_store_key(self):
+        return ("local", id(self))
+
+    def get(self, key):
+        return self.get_many((key,)).get(key)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = {}
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                self.entries.delete(key)
+                continue
+            values[key] = value
+        return values
+
+    def set(self, key, value, timeout=None):
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        self.entries.set(key, (value, expires_at))
+
+    def get_versions(self, labels):
+        return tuple(self.versions.get(label, 0) for label in labels)
+
+    def bump_version(self, label):
+        with self._lock:
+            self.versions[label] = self.versions.get(label, 0) + 1
+
+
+class DjangoResponseCache:
+    """
+    A response cache on top of a Django cache, shared by the processes.
+    The model versions are stored in the same cache, so the saves of any process,
+    that defines the backend with the same `alias` and `prefix`, bump those.
+    """
+
+    def __init__(self, alias="default", prefix="drf_dynamics"):
+        self.alias = alias
+        self.prefix = prefix
+        register_backend(self)
+
+    def get_version_store_key(self):
+        return ("django", self.alias, self.prefix)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_version_key(self, label):
+        return f"{self.prefix}:version:{label}"
+
+    def get_entry_key(self, key):
+        return f"{self.prefix}:response:{key}"
+
+    def get(self, key):
+        return self.cache.get(self.get_entry_key(key))
+
+    def get_many(self, keys):
+        entry_keys = {self.get_entry_key(key): key for key in keys}
+        return {
+            entry_keys[entry_key]: value
+            for entry_key, value in self.cache.get_many(entry_keys).items()
+        }
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(self.get_entry_key(key), value, timeout)
+
+    def get_versions(self, labels):
+        keys = [self.get_version_key(label) for label in labels]
+        versions = self.cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # A version, that was evicted, mustn't revive the older entries.
+                self.cache.add(key, time.time_ns(), None)
+                versions[key] = self.cache.get(key)
+        return tuple(versions[key] for key in keys)
+
+    def bump_version(self, label):
+        key = self.get_version_key(label)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, time.time_ns(), None)
+
+
+def get_model_label(model):
+    return model._meta.concrete_model._meta.label_lower
+
+
+def invalidate_model(sender, **kwargs):
+    """
+    Bumps the version of the `sender` model once in every version store,
+    the backends sharing a store (e.g. the same Django cache) are bumped once.
+    """
+    label = get_model_label(sender)
+    with _backends_lock:
+        backends = list(_backends)
+    stores = {}
+    for backend in backends:
+        get_version_store_key = getattr(backend, "get_version_store_key", None)
+        key = id(backend) if get_version_store_key is None else get_version_store_key()
+        stores[key] = backend
+    for backend in stores.values():
+        backend.bump_version(label)
+
+
+# Connected once the module is loaded, so the saves of the processes,
+# that don't serve the cached responses, invalidate those as well.
+for signal in (post_save, post_delete, m2m_changed):
+    signal.connect(invalidate_model, dispatch_uid="drf_dynamics_responses")
+
+
+def register_backend(backend):
+    """
+    Makes the saves and deletes of the models bump their versions in the `backend`.
+    The backends register themselves, once those are created.
+    """
+    with _backends_lock:
+        _backends.add(backend)
+
+
+def get_table_models():
+    return {
+        model._meta.db_table: model
+        for model in apps.get_models(include_auto_created=True)
+    }
+
+
+def collect_queryset_models(queryset, table_models, models):
+    """
+    Collects the models, which tables are queried by the `queryset`
+    (including its joins and subqueries) and its prefetches.
+    """
+    try:
+        sql, _ = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        sql = ""
+    quote_name = connections[queryset.db].ops.quote_name
+    for table, model in table_models.items():
+        if quote_name(table) in sql:
+            models.add(model)
+    models.add(queryset.model)
+
+    for lookup in queryset._prefetch_related_lookups:
+        if isinstance(lookup, Prefetch) and lookup.queryset is not None:
+            collect_queryset_models(lookup.queryset, table_models, models)
+            continue
+        if isinstance(lookup, Prefetch):
+            lookup = lookup.prefetch_through
+        model = queryset.model
+        for name in lookup.split("__"):
+            relation = get_relation_field(model, name)
+            if relation is None:
+                break
+            model = relation.related_model
+            models.add(model)
+            if relation.many_to_many:
+                field = relation if relation.concrete else relation.remote_field
+                models.add(field.remote_field.through)
+
+    batch_loader = getattr(queryset, "batch_loader", None)
+    if batch_loader is not None:
+        chains = [
+            batch_load.attrs
+            for batch_loads in batch_loader.rounds
+            for batch_load in batch_loads
+        ]
+        # The totals of the limited prefetches come from the prefetched objects.
+        chains.extend(
+            (*aggregate_load.attrs, aggregate_load.spec.lookup)
+            for aggregate_load in batch_loader.aggregate_loads
+            if isinstance(aggregate_load, AggregateLoad)
+        )
+        for attrs in chains:
+            model = queryset.model
+            for name in attrs:
+                relation = get_relation_field(model, name)
+                if relation is None:
+                    break
+                model = relation.related_model
+                models.add(model)
+    return models
+
+
+def get_queryset_models(queryset):
+    """
+    The labels of the models, the results of the `queryset` depend on.
+    """
+    models = collect_queryset_models(queryset, get_table_models(), set())
+    return tuple(sorted({get_model_label(model) for model in models}))
+
+
+def get_response_cache_key(parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def freeze_response_data(data):
+    """
+    A plain copy of the response data, without the references to the serializers.
+    """
+    return pickle.loads(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
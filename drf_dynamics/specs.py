@@ -9,15 +9,46 @@ class DynamicAnnotation(DynamicSpec):
         self.method_name = method_name
 
 
+class DynamicAggregate(DynamicSpec):
+    functions = ("count", "exists", "sum", "min", "max")
+
+    def __init__(self, lookup, function="count", field="pk", queryset=None, **kwargs):
+        assert (
+            function in self.functions
+        ), f"function has to be one of {', '.join(self.functions)}"
+        super().__init__(**kwargs)
+        self.lookup = lookup
+        self.function = function
+        self.field = field
+        self.queryset = queryset
+
+
 class DynamicSelect(DynamicSpec):
-    def __init__(self, lookup, pk_field_name="id", **kwargs):
+    def __init__(
+        self, lookup, pk_field_name="id", cardinality=None, width=None, **kwargs
+    ):
         super().__init__(**kwargs)
         self.lookup = lookup
         self.pk_field_name = pk_field_name
+        # The cost planner hints, see `CostPlanner`.
+        self.cardinality = cardinality
+        self.width = width
 
 
 class DynamicPrefetch(DynamicSpec):
-    def __init__(self, lookup, queryset=None, to_attr=None, **kwargs):
+    def __init__(
+        self,
+        lookup,
+        queryset=None,
+        to_attr=None,
+        cardinality=None,
+        width=None,
+        limit=None,
+        ordering=None,
+        count_attr=None,
+        pk_field_name=None,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
         self.lookup = lookup
         if callable(queryset):
@@ -27,3 +58,20 @@ class DynamicPrefetch(DynamicSpec):
             self.queryset = queryset
             self.get_queryset = None
         self.to_attr = to_attr
+        self.cardinality = cardinality
+        self.width = width
+        # The limit of the related objects per parent, see `limit_queryset`.
+        self.limit = limit
+        self.ordering = ordering
+        self.count_attr = count_attr
+        # The pk of a forward relation, that is read from the foreign key,
+        # if it's the only requested field, so the prefetch is skipped.
+        self.pk_field_name = pk_field_name
+
+
+class DynamicBatchLoad(DynamicSpec):
+    def __init__(self, lookup, queryset=None, pk_field_name="id", **kwargs):
+        super().__init__(**kwargs)
+        self.lookup = lookup
+        self.queryset = queryset
+        self.pk_field_name = pk_field_name
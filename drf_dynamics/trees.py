@@ -0,0 +1,152 @@
+import re
+from collections.abc import Mapping
+
+# A field name with an optional limit of the related objects, e.g. `invites[:5]`.
+SEGMENT_PATTERN = re.compile(r"^(?P<name>[^\[]+?)\s*(?:\[:(?P<limit>\d+)\])?$")
+
+
+class FieldTree(Mapping):
+    """
+    An immutable and hashable tree of the requested field names.
+    Behaves like a read-only mapping of a field name to its nested `FieldTree`,
+    where an empty tree means the field is requested without any nested fields.
+    The `limit` is the amount of the related objects requested for the field,
+    capped by the `max_limit`.
+    """
+
+    __slots__ = ("_children", "_hash", "limit")
+
+    max_limit = 1000
+
+    def __init__(self, children=(), limit=None):
+        children = dict(children)
+        assert all(
+            isinstance(child, FieldTree) for child in children.values()
+        ), "FieldTree children have to be FieldTree instances"
+        object.__setattr__(self, "_children", children)
+        object.__setattr__(self, "limit", limit)
+        object.__setattr__(self, "_hash", hash((frozenset(children.items()), limit)))
+
+    @classmethod
+    def parse(cls, fields):
+        """
+        Parses the comma separated dotted paths, as in the `fields` query parameter.
+        Paths are lowercased, stripped and merged, so the same set of fields
+        results in an equal tree no matter the order and repetitions.
+        A segment may limit the related objects, e.g. `invites[:5].id`,
+        the largest limit of the merged segments wins,
+        unless the same field is requested without a limit as well.
+        The limits above the `max_limit` are lowered to it.
+        The rest of the path after a malformed segment is ignored.
+        """
+        root = {}
+        limits = {}
+        for path in fields.lower().split(","):
+            node = root
+            for segment in path.split("."):
+                match = SEGMENT_PATTERN.match(segment.strip())
+                if match is None:
+                    break
+                name, limit = match.group("name", "limit")
+                node = node.setdefault(name, {})
+                limit = None if limit is None else cls.clean_limit(limit)
+                merged_limit = limits.get(id(node), limit)
+                if limit is not None and merged_limit is not None:
+                    limit = max(limit, merged_limit)
+                else:
+                    limit = None
+                limits[id(node)] = limit
+        return cls.from_mapping(root, limits)
+
+    @classmethod
+    def clean_limit(cls, limit):
+        # The digits are counted first, since the huge numbers can't be converted.
+        if len(limit.lstrip("0")) > len(str(cls.max_limit)):
+            return cls.max_limit
+        return min(int(limit), cls.max_limit)
+
+    @classmethod
+    def from_mapping(cls, mapping, limits=None):
+        limits = limits or {}
+        return cls(
+            (
+                (
+                    name,
+                    child
+                    if isinstance(child, FieldTree)
+                    else cls.from_mapping(child, limits),
+                )
+                for name, child in mapping.items()
+            ),
+            limits.get(id(mapping)),
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FieldTree is immutable")
+
+    def __getitem__(self, name):
+        return self._children[name]
+
+    def __contains__(self, name):
+        return name in self._children
+
+    def __iter__(self):
+        return iter(self._children)
+
+    def __len__(self):
+        return len(self._children)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, FieldTree):
+            return (
+                self._hash == other._hash
+                and self.limit == other.limit
+                and self._children == other._children
+            )
+        return super().__eq__(other)
+
+    def __repr__(self):
+        return "FieldTree(%r)" % str(self)
+
+    def __str__(self):
+        return ",".join(self.paths())
+
+    def paths(self):
+        """
+        Yields the sorted dotted paths of the leaves.
+        """
+        for name in sorted(self._children):
+            child = self._children[name]
+            if child.limit is not None:
+                name = f"{name}[:{child.limit}]"
+            if not child:
+                yield name
+                continue
+            for path in child.paths():
+                yield f"{name}.{path}"
+
+    def lookup(self, path):
+        """
+        Returns the tree at the dotted `path` (or a sequence of names),
+        or `None` if it isn't requested.
+        If the path goes through a field requested without nested fields,
+        that field's empty tree is returned.
+        """
+        node = self
+        for name in path.split(".") if isinstance(path, str) else path:
+            try:
+                node = node._children[name]
+            except KeyError:
+                return None
+            if not node._children:
+                return node
+        return node
+
+    def is_pk_only(self, pk_field_name="id"):
+        return len(self._children) == 1 and pk_field_name in self._children
+
+
+FieldTree.empty = FieldTree()
@@ -0,0 +1,418 @@
+import itertools
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.query import ValuesIterable
+from rest_framework.relations import PKOnlyObject, RelatedField
+
+from .helpers import get_relation_field
+from .specs import DynamicAggregate
+
+
+class ValuesShape:
+    """
+    Describes how the flat `values()` rows of a queryset
+    are reshaped into the nested dictionaries to be serialized.
+
+    `fields` is a sequence of `(name, lookup)` pairs,
+    `relations` of `(name, key_lookup, ValuesShape)` triples for the joined relations,
+    which are rendered as `None` if the `key_lookup` value is `None`,
+    `prefetches` of `ValuesPrefetch` instances,
+    and `pks` of `(name, lookup)` pairs for the foreign keys,
+    that the related fields render, which are wrapped into `PKOnlyObject`.
+    """
+
+    def __init__(self, fields=(), relations=(), prefetches=(), pks=()):
+        self.fields = tuple(fields)
+        self.relations = tuple(relations)
+        self.prefetches = tuple(prefetches)
+        self.pks = tuple(pks)
+
+    def get_lookups(self):
+        lookups = {lookup for _, lookup in (*self.fields, *self.pks)}
+        for _, key_lookup, shape in self.relations:
+            lookups.add(key_lookup)
+            lookups.update(shape.get_lookups())
+        for prefetch in self.prefetches:
+            lookups.add(prefetch.parent_key)
+        return lookups
+
+    def build_row(self, row):
+        ret = {name: row[lookup] for name, lookup in self.fields}
+        for name, lookup in self.pks:
+            ret[name] = None if row[lookup] is None else PKOnlyObject(pk=row[lookup])
+        for name, key_lookup, shape in self.relations:
+            ret[name] = None if row[key_lookup] is None else shape.build_row(row)
+        return ret
+
+    def build(self, rows, querysets):
+        objs = [self.build_row(row) for row in rows]
+        for prefetch in self.prefetches:
+            prefetch.attach(rows, objs, querysets)
+        return objs
+
+
+class ValuesPrefetch:
+    """
+    A reverse relation of a `ValuesShape`, fetched with a single `values()` query
+    for all the parent rows, and grouped by the parent key.
+    """
+
+    def __init__(self, name, path, parent_key, child_key, many, shape):
+        self.name = name
+        self.path = path
+        self.parent_key = parent_key
+        self.child_key = child_key
+        self.many = many
+        self.shape = shape
+
+    def get_lookups(self):
+        return {self.child_key, *self.shape.get_lookups()}
+
+    def attach(self, rows, objs, querysets):
+        keys = {row[self.parent_key] for row in rows}
+        keys.discard(None)
+        child_rows = (
+            list(querysets[self.path].filter(**{f"{self.child_key}__in": keys}))
+            if keys
+            else []
+        )
+        child_objs = self.shape.build(child_rows, querysets)
+
+        grouped = {}
+        for child_row, child_obj in zip(child_rows, child_objs):
+            grouped.setdefault(child_row[self.child_key], []).append(child_obj)
+        for row, obj in zip(rows, objs):
+            related = grouped.get(row[self.parent_key], [])
+            if self.many:
+                obj[self.name] = related
+            else:
+                obj[self.name] = related[0] if related else None
+
+
+class NestedValuesIterable(ValuesIterable):
+    """
+    Yields the nested dictionaries described by the `shape`.
+    The rows are reshaped in chunks, if the queryset is iterated with a chunk size,
+    so the prefetches are run for each chunk.
+    Subclassed for each queryset with the `shape` and prefetch `querysets` set.
+    """
+
+    shape = None
+    querysets = None
+
+    def __iter__(self):
+        rows = super().__iter__()
+        if not self.shape.prefetches:
+            for row in rows:
+                yield self.shape.build_row(row)
+            return
+
+        chunk_size = getattr(self, "chunk_size", None) if self.chunked_fetch else None
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield from self.shape.build(chunk, self.querysets)
+            if chunk_size is None:
+                return
+
+
+class ValuesPlan:
+    """
+    Turns the querysets set up by a `QueryPlan` into `values()` querysets,
+    that yield the nested dictionaries without instantiating the models.
+    """
+
+    def __init__(self, shape, annotations):
+        self.shape = shape
+        self.annotations = annotations
+
+    def apply(self, queryset, prefetches_map, instrument=None):
+        querysets = {None: queryset}
+        querysets.update(
+            (path, prefetch.queryset) for path, prefetch in prefetches_map.items()
+        )
+        # The annotation methods are expected to add an annotation
+        # named after the field. If that's not the case, the models are used.
+        for path, names in self.annotations.items():
+            if not all(name in querysets[path].query.annotations for name in names):
+                return queryset
+
+        prefetch_querysets = {}
+        for path, prefetch in self.iter_prefetches(self.shape):
+            prefetch_querysets[path] = (
+                querysets[path].prefetch_related(None).values(*prefetch.get_lookups())
+            )
+            if instrument is not None:
+                prefetch_querysets[path] = instrument(prefetch_querysets[path], path)
+
+        iterable_class = type(
+            NestedValuesIterable.__name__,
+            (NestedValuesIterable,),
+            {"shape": self.shape, "querysets": prefetch_querysets},
+        )
+        queryset = queryset.prefetch_related(None).values(*self.shape.get_lookups())
+        queryset._iterable_class = iterable_class
+        return queryset
+
+    @classmethod
+    def iter_prefetches(cls, shape):
+        for prefetch in shape.prefetches:
+            yield prefetch.path, prefetch
+            yield from cls.iter_prefetches(prefetch.shape)
+
+
+def add_values_fields(queryset, names):
+    """
+    Adds the root columns `names` to the nested dictionaries of a values plan
+    `queryset` under their own names, e.g. for the pagination to read those.
+    Any other queryset is returned as is.
+    """
+    iterable_class = queryset._iterable_class
+    if not issubclass(iterable_class, NestedValuesIterable):
+        return queryset
+    shape = iterable_class.shape
+    present = {name for name, _ in shape.fields}
+    missing = [(name, name) for name in names if name not in present]
+    if not missing:
+        return queryset
+    shape = ValuesShape(
+        (*shape.fields, *missing), shape.relations, shape.prefetches, shape.pks
+    )
+    iterable_class = type(iterable_class.__name__, (iterable_class,), {"shape": shape})
+    queryset = queryset.values(*shape.get_lookups())
+    queryset._iterable_class = iterable_class
+    return queryset
+
+
+def collect_serializer_fields(serializer, fields, path=None):
+    """
+    Collects the readable fields of the `serializer` and its nested serializers
+    into the `fields`, a mapping of their dotted paths.
+    """
+    for field in serializer._readable_fields:
+        field_path = field.field_name if path is None else f"{path}.{field.field_name}"
+        fields[field_path] = field
+        nested = getattr(field, "child", field)
+        if hasattr(nested, "_readable_fields"):
+            collect_serializer_fields(nested, fields, field_path)
+    return fields
+
+
+class ValuesPlanCompiler:
+    """
+    Compiles a `ValuesPlan` for the requested fields,
+    if all of those are concrete columns, annotations,
+    forward relations joined by the selects,
+    and reverse relations fetched by the prefetches.
+    Returns `None` for any other shape, in which case the models are used.
+    """
+
+    def __init__(
+        self,
+        root_model,
+        requested_fields,
+        prefetches,
+        annotations,
+        selects,
+        serializer=None,
+    ):
+        self.root_model = root_model
+        self.requested_fields = requested_fields
+        self.prefetches = prefetches
+        self.annotations = annotations
+        self.selects = selects
+        # The readable fields of the serializer, that renders the rows, by paths.
+        self.serializer_fields = (
+            None if serializer is None else collect_serializer_fields(serializer, {})
+        )
+
+    def compile(self, selected_paths):
+        if self.requested_fields is None:
+            return None
+        self.selected_paths = selected_paths
+        self.annotation_names = {}
+        shape = self.compile_shape(
+            self.root_model, self.root_model, self.requested_fields, None, None, ""
+        )
+        if shape is None:
+            return None
+        return ValuesPlan(shape, self.annotation_names)
+
+    def compile_shape(
+        self, target_model, model, requested_slice, target_path, path, lookup_prefix
+    ):
+        fields = []
+        relations = []
+        prefetches = []
+        pks = []
+
+        for field_name, nested_slice in requested_slice.items():
+            field_path = field_name if path is None else f"{path}.{field_name}"
+
+            if field_path in self.annotations:
+                # The aggregates are computed once the models are fetched.
+                if lookup_prefix or isinstance(
+                    self.annotations[field_path], DynamicAggregate
+                ):
+                    return None
+                fields.append((field_name, field_name))
+                self.annotation_names.setdefault(target_path, []).append(field_name)
+                continue
+
+            prefetch_spec = self.prefetches.get(field_path)
+            if prefetch_spec is not None:
+                if lookup_prefix:
+                    return None
+                if not nested_slice:
+                    if self.get_rendered_field(field_path) is False:
+                        continue
+                    return None
+                prefetch = self.compile_prefetch(
+                    model, field_name, field_path, prefetch_spec, nested_slice
+                )
+                if prefetch is None:
+                    return None
+                prefetches.append(prefetch)
+                continue
+
+            select_spec = self.selects.get(field_path)
+            if select_spec is not None:
+                if not nested_slice:
+                    pk = self.compile_pk(model, field_path, lookup_prefix)
+                    if pk is None:
+                        return None
+                    pks.extend(pk)
+                    continue
+                relation = self.compile_select(
+                    target_model,
+                    target_path,
+                    field_name,
+                    field_path,
+                    select_spec,
+                    nested_slice,
+                )
+                if relation is None:
+                    return None
+                relations.append(relation)
+                continue
+
+            try:
+                field = model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                return None
+            lookup = f"{lookup_prefix}{field.name}"
+            if not field.is_relation:
+                fields.append((field_name, lookup))
+                continue
+            if not nested_slice:
+                pk = self.compile_pk(model, field_path, lookup_prefix)
+                if pk is None:
+                    return None
+                pks.extend(pk)
+                continue
+            # A forward relation, that only renders the pk, may use the column.
+            if (
+                field.concrete
+                and not field.many_to_many
+                and len(nested_slice) == 1
+                and field.target_field.primary_key
+                and field.target_field.name in nested_slice
+            ):
+                shape = ValuesShape([(field.target_field.name, lookup)])
+                relations.append((field_name, lookup, shape))
+                continue
+            return None
+
+        return ValuesShape(fields, relations, prefetches, pks)
+
+    def get_rendered_field(self, field_path):
+        """
+        The serializer field, that renders the `field_path`,
+        `False` if it isn't rendered (e.g. a nested serializer without fields),
+        or `None` if the serializer is unknown.
+        """
+        if self.serializer_fields is None:
+            return None
+        return self.serializer_fields.get(field_path, False)
+
+    def compile_pk(self, model, field_path, lookup_prefix):
+        """
+        Returns the `(name, lookup)` pairs of a relation requested without
+        the nested fields: the foreign key, if it's rendered by a related field
+        from the pk, nothing, if it isn't rendered, or `None`,
+        if the models have to be used.
+        """
+        field = self.get_rendered_field(field_path)
+        if field is False:
+            return ()
+        if (
+            not isinstance(field, RelatedField)
+            or not field.use_pk_only_optimization()
+            or "." in field.source
+        ):
+            return None
+        try:
+            relation = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if (
+            not relation.is_relation
+            or not relation.concrete
+            or relation.many_to_many
+            or not relation.target_field.primary_key
+        ):
+            return None
+        return ((field.source, f"{lookup_prefix}{relation.name}"),)
+
+    def compile_select(
+        self, target_model, target_path, field_name, field_path, spec, nested_slice
+    ):
+        # Select lookups start from the queryset they're applied to.
+        related_model = target_model
+        relation = None
+        for lookup in spec.lookup.split("__"):
+            relation = get_relation_field(related_model, lookup)
+            if relation is None or relation.one_to_many or relation.many_to_many:
+                return None
+            related_model = relation.related_model
+
+        if field_path not in self.selected_paths:
+            # Only the pk is requested, which is the value of the lookup itself.
+            if not relation.concrete or not relation.target_field.primary_key:
+                return None
+            shape = ValuesShape([(spec.pk_field_name, spec.lookup)])
+        else:
+            shape = self.compile_shape(
+                target_model,
+                related_model,
+                nested_slice,
+                target_path,
+                field_path,
+                f"{spec.lookup}__",
+            )
+            if shape is None:
+                return None
+        return field_name, spec.lookup, shape
+
+    def compile_prefetch(self, model, field_name, field_path, spec, nested_slice):
+        if "__" in spec.lookup:
+            return None
+        relation = get_relation_field(model, spec.lookup)
+        if relation is None or relation.concrete or relation.many_to_many:
+            return None
+        child_model = spec.queryset.model
+        shape = self.compile_shape(
+            child_model, child_model, nested_slice, field_path, field_path, ""
+        )
+        if shape is None:
+            return None
+        foreign_key = relation.remote_field
+        return ValuesPrefetch(
+            field_name,
+            field_path,
+            foreign_key.target_field.name,
+            foreign_key.name,
+            relation.one_to_many,
+            shape,
+        )
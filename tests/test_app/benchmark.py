@@ -0,0 +1,225 @@
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+import rest_framework
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from drf_dynamics.plans import plan_cache
+from .models import Answer, Details, Invite, Party, Person
+from .views import PartyViewSet
+
+FIELDS_MATRIX = (
+    "id",
+    "id,title",
+    "id,title,host.name",
+    "id,title,invites_count",
+    "id,title,invites.id",
+    "id,title,invites.text,invites.sender.name,invites.recipient.name",
+    "id,title,invites.has_answer,invites.answer.text",
+    "id,title,invites.answer.all_details_reviewed,invites.answer.details.reviewed",
+    "id,title,host.name,invites_count,invites.text,invites.sender.name,"
+    "invites.recipient.name,invites.has_answer,invites.answer.text,"
+    "invites.answer.all_details_reviewed,invites.answer.details.reviewed,"
+    "invites.answer.details.reviewer.name",
+)
+
+INVITES_PER_PARTY = 3
+DETAILS_PER_ANSWER = 2
+BATCH_SIZE = 5000
+
+
+def generate_data(scale):
+    """
+    Generates `scale` parties with their invites, answers and details,
+    about 10 rows per party in total.
+    All the invites are sent by the first person, which is returned,
+    so its requests see every row.
+    The ids are assigned explicitly, so the database has to be empty.
+    """
+    persons_count = max(10, scale // 10)
+    Person.objects.bulk_create(
+        (
+            Person(id=index, name=f"person {index}")
+            for index in range(1, persons_count + 1)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Party.objects.bulk_create(
+        (
+            Party(id=index, title=f"party {index}", host_id=index % persons_count + 1)
+            for index in range(1, scale + 1)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    invites_count = scale * INVITES_PER_PARTY
+    Invite.objects.bulk_create(
+        (
+            Invite(
+                id=index,
+                party_id=(index - 1) // INVITES_PER_PARTY + 1,
+                sender_id=1,
+                recipient_id=index % persons_count + 1,
+                text=f"invite {index}",
+            )
+            for index in range(1, invites_count + 1)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    # Two out of three invites are answered.
+    answer_invite_ids = [index for index in range(1, invites_count + 1) if index % 3]
+    Answer.objects.bulk_create(
+        (
+            Answer(id=index, invite_id=invite_id, text=f"answer {index}")
+            for index, invite_id in enumerate(answer_invite_ids, 1)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Details.objects.bulk_create(
+        (
+            Details(
+                answer_id=(index - 1) // DETAILS_PER_ANSWER + 1,
+                reviewer_id=index % persons_count + 1,
+                reviewed=bool(index % 2),
+            )
+            for index in range(1, len(answer_invite_ids) * DETAILS_PER_ANSWER + 1)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    return Person.objects.get(id=1)
+
+
+class QueryTimer:
+    """
+    A database execute wrapper, that counts the queries and their time.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.duration += time.perf_counter() - start
+
+
+def get_viewset(viewset_class, user, fields):
+    request = Request(APIRequestFactory().get("/parties/", {"fields": fields}))
+    request.user = user
+    return viewset_class(request=request, action="list", format_kwarg=None)
+
+
+def run_request(viewset_class, user, fields, page_size):
+    """
+    Runs the list request once, and returns the durations of its phases.
+    """
+    timer = QueryTimer()
+    with connection.execute_wrapper(timer):
+        start = time.perf_counter()
+        viewset = get_viewset(viewset_class, user, fields)
+        queryset = viewset.get_queryset()
+        if page_size:
+            queryset = queryset[:page_size]
+        planned = time.perf_counter()
+        instances = list(queryset)
+        fetched = time.perf_counter()
+        JSONRenderer().render(viewset.get_serializer(instances, many=True).data)
+        rendered = time.perf_counter()
+    return {
+        "planning": planned - start,
+        "fetch": fetched - planned,
+        "sql": timer.duration,
+        "serialization": rendered - fetched,
+        "total": rendered - start,
+        "queries": timer.queries,
+    }
+
+
+def run_case(viewset_class, user, fields, page_size, repeat):
+    plan_cache.clear()
+    cold = run_request(viewset_class, user, fields, page_size)
+    runs = [run_request(viewset_class, user, fields, page_size) for _ in range(repeat)]
+
+    tracemalloc.start()
+    try:
+        run_request(viewset_class, user, fields, page_size)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {"fields": fields}
+    for phase in ("planning", "fetch", "sql", "serialization", "total"):
+        result[f"{phase}_ms"] = round(
+            statistics.median(run[phase] for run in runs) * 1000, 3
+        )
+    result["cold_planning_ms"] = round(cold["planning"] * 1000, 3)
+    result["requests_per_second"] = round(1000 / result["total_ms"], 2)
+    result["queries"] = runs[-1]["queries"]
+    result["peak_memory_kb"] = round(peak_memory / 1024, 1)
+    return result
+
+
+def run_benchmark(
+    user,
+    scale,
+    page_size=100,
+    repeat=5,
+    fields_matrix=FIELDS_MATRIX,
+    viewset_class=None,
+):
+    """
+    Benchmarks the list requests of the `PartyViewSet`
+    for every `fields` string of the matrix.
+    """
+    viewset_class = viewset_class or PartyViewSet
+    return {
+        "meta": {
+            "scale": scale,
+            "page_size": page_size,
+            "repeat": repeat,
+            "vendor": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "djangorestframework": rest_framework.VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": [
+            run_case(viewset_class, user, fields, page_size, repeat)
+            for fields in fields_matrix
+        ],
+    }
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Returns the regressions of the `current` results against the `baseline`:
+    the cases, which total time grew by more than the `threshold` ratio,
+    or which run more queries.
+    """
+    baseline_results = {result["fields"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        baseline_result = baseline_results.get(result["fields"])
+        if baseline_result is None:
+            continue
+        for metric, tolerance in (("total_ms", threshold), ("queries", 0)):
+            before, after = baseline_result[metric], result[metric]
+            if after > before * (1 + tolerance):
+                regressions.append(
+                    {
+                        "fields": result["fields"],
+                        "metric": metric,
+                        "baseline": before,
+                        "current": after,
+                    }
+                )
+    return regressions
@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...benchmark import FIELDS_MATRIX, compare_results, generate_data, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the dynamic list requests of the test app "
+        "on a generated dataset, in a separate test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=int,
+            default=1000,
+            help="The amount of parties to generate, about 10 rows per party.",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=100,
+            help="The amount of parties per request, 0 to list all of them.",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--fields",
+            action="append",
+            help="The fields to request, may be repeated. "
+            "Defaults to the built-in matrix.",
+        )
+        parser.add_argument("--output", help="The file to write the JSON results to.")
+        parser.add_argument(
+            "--compare", help="The JSON results file to compare the results with."
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.1,
+            help="The ratio of the total time growth considered a regression.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user = generate_data(options["scale"])
+            results = run_benchmark(
+                user,
+                options["scale"],
+                page_size=options["page_size"],
+                repeat=options["repeat"],
+                fields_matrix=options["fields"] or FIELDS_MATRIX,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for result in results["results"]:
+            self.stdout.write(
+                f"{result['requests_per_second']:>10.2f} req/s "
+                f"{result['queries']:>3} queries "
+                f"{result['planning_ms']:>8.3f} plan "
+                f"{result['fetch_ms']:>9.3f} fetch "
+                f"{result['sql_ms']:>9.3f} sql "
+                f"{result['serialization_ms']:>9.3f} serialize ms "
+                f"{result['peak_memory_kb']:>10.1f} KiB  {result['fields']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump(results, output_file, indent=2)
+
+        if baseline is not None:
+            regressions = compare_results(baseline, results, options["threshold"])
+            for regression in regressions:
+                self.stderr.write(
+                    f"{regression['metric']}: {regression['baseline']} -> "
+                    f"{regression['current']}  {regression['fields']}"
+                )
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions found.")
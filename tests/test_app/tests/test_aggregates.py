@@ -0,0 +1,108 @@
+from rest_framework import serializers
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.specs import DynamicAggregate
+
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..models import Invite, Party, Person
+from ..serializers import PartySerializer
+
+
+class AggregatedPartySerializer(PartySerializer):
+    representation_fields = {
+        **PartySerializer.representation_fields,
+        "has_invites": serializers.BooleanField(),
+        "last_invite_id": serializers.IntegerField(),
+        "own_invites_count": serializers.IntegerField(),
+    }
+
+
+class DynamicAggregateTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        @dynamic_queryset(
+            prefetches="invites",
+            annotations={
+                "invites_count": DynamicAggregate("invites"),
+                "has_invites": DynamicAggregate("invites", "exists"),
+                "last_invite_id": DynamicAggregate("invites", "max", "id"),
+                "own_invites_count": DynamicAggregate(
+                    "invites", queryset=Invite.objects.filter(text="own")
+                ),
+            },
+        )
+        class ViewSet(DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.order_by("id")
+            serializer_class = AggregatedPartySerializer
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.parties = [
+            Party.objects.create(title=title, host=self.user)
+            for title in ("foo", "bar")
+        ]
+        self.invites = [
+            Invite.objects.create(
+                party=self.parties[0], sender=self.user, recipient=self.user, text=text
+            )
+            for text in ("own", "other")
+        ]
+
+    def get_data(self, fields):
+        viewset = self.viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action="list",
+            format_kwarg=None,
+        )
+        return viewset.get_serializer(viewset.get_queryset(), many=True).data
+
+    def test_grouped(self):
+        with self.assertNumQueries(4):
+            data = self.get_data("id,invites_count,has_invites,last_invite_id")
+        self.assertEqual(
+            [
+                {
+                    "id": self.parties[0].id,
+                    "invites_count": 2,
+                    "has_invites": True,
+                    "last_invite_id": self.invites[1].id,
+                },
+                {
+                    "id": self.parties[1].id,
+                    "invites_count": 0,
+                    "has_invites": False,
+                    "last_invite_id": None,
+                },
+            ],
+            data,
+        )
+
+    def test_prefetched(self):
+        # The unfiltered aggregates are computed from the prefetched invites.
+        with self.assertNumQueries(3):
+            data = self.get_data(
+                "id,invites.id,invites_count,has_invites,last_invite_id,"
+                "own_invites_count"
+            )
+        self.assertEqual(
+            [(2, True, self.invites[1].id, 1), (0, False, None, 0)],
+            [
+                (
+                    party["invites_count"],
+                    party["has_invites"],
+                    party["last_invite_id"],
+                    party["own_invites_count"],
+                )
+                for party in data
+            ],
+        )
+
+    def test_values_action(self):
+        self.viewset_class.dynamic_values_actions = {"list"}
+        data = self.get_data("id,invites_count")
+        self.assertEqual([2, 0], [party["invites_count"] for party in data])
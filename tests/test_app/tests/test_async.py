@@ -0,0 +1,147 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.http import Http404
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import BasePermission
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.specs import DynamicAggregate, DynamicPrefetch
+
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..managers import PartyQuerySet
+from ..models import Invite, Party, Person
+from ..serializers import PartySerializer
+
+
+async def get_invites(request):
+    return Invite.objects.filter(sender=request.user)
+
+
+async def with_invites_count(self, request):
+    return PartyQuerySet.with_invites_count(self, request)
+
+
+@mock.patch.object(
+    PartyQuerySet, "with_async_invites_count", with_invites_count, create=True
+)
+class AsyncDynamicQuerySetTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        @dynamic_queryset(
+            prefetches={"invites": DynamicPrefetch("invites", get_invites)},
+            annotations={"invites_count": "with_async_invites_count"},
+            selects=("host", "invites.sender"),
+        )
+        class ViewSet(DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.order_by("id")
+            serializer_class = PartySerializer
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.guest = Person.objects.create(name="bar")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            for sender in (self.user, self.guest):
+                Invite.objects.create(party=party, sender=sender, recipient=self.user)
+
+    def get_viewset(self, fields, action="list", ordering=None, **kwargs):
+        query_params = {"fields": fields}
+        if ordering is not None:
+            query_params["ordering"] = ordering
+        return self.viewset_class(
+            request=MockRequest(query_params=query_params, user=self.user),
+            action=action,
+            kwargs=kwargs,
+            format_kwarg=None,
+        )
+
+    def test_list(self):
+        viewset = self.get_viewset("id,invites_count,host.name,invites.sender.name")
+        with self.assertNumQueries(2):
+            data = async_to_sync(viewset.alist_data)()
+        self.assertEqual(
+            [
+                {
+                    "id": party.id,
+                    "invites_count": 2,
+                    "host": {"name": "foo"},
+                    "invites": [{"sender": {"name": "foo"}}],
+                }
+                for party in Party.objects.order_by("id")
+            ],
+            data,
+        )
+
+    def test_retrieve(self):
+        party = Party.objects.first()
+        viewset = self.get_viewset("id,invites_count", action="retrieve", pk=party.id)
+        self.assertEqual(
+            {"id": party.id, "invites_count": 2},
+            async_to_sync(viewset.aretrieve_data)(),
+        )
+        viewset = self.get_viewset("id", action="retrieve", pk=0)
+        with self.assertRaises(Http404):
+            async_to_sync(viewset.aretrieve_data)()
+
+    def test_object_permissions(self):
+        # The host isn't selected, so the permission is checked in a thread.
+        class IsHost(BasePermission):
+            def has_object_permission(self, request, view, obj):
+                return obj.host.name == request.user.name
+
+        self.viewset_class.permission_classes = (IsHost,)
+        party = Party.objects.first()
+        viewset = self.get_viewset("id", action="retrieve", pk=party.id)
+        self.assertEqual({"id": party.id}, async_to_sync(viewset.aretrieve_data)())
+
+    def test_ordering(self):
+        # The async annotation, that isn't requested, is awaited for the ordering.
+        self.viewset_class.filter_backends = (OrderingFilter,)
+        self.viewset_class.ordering_fields = ("invites_count", "id")
+        Invite.objects.filter(party=Party.objects.first(), sender=self.guest).delete()
+        viewset = self.get_viewset("id", ordering="-invites_count,id")
+        self.assertEqual(
+            [party.id for party in Party.objects.order_by("-id")],
+            [party["id"] for party in async_to_sync(viewset.alist_data)()],
+        )
+
+    def test_lazy_load(self):
+        # The recipients aren't selected, so those are loaded in a thread.
+        viewset = self.get_viewset("id,invites.recipient.name")
+        with self.assertNumQueries(4):
+            data = async_to_sync(viewset.alist_data)()
+        self.assertEqual([{"recipient": {"name": "foo"}}], data[0]["invites"])
+
+    def test_sync_apply(self):
+        viewset = self.get_viewset("id,invites_count,invites.id")
+        with self.assertNumQueries(2):
+            parties = list(viewset.get_queryset())
+        self.assertEqual([2, 2], [party.invites_count for party in parties])
+
+    def test_batch_loads(self):
+        @dynamic_queryset(
+            annotations={"invites_count": DynamicAggregate("invites")},
+            batch_loads="host",
+        )
+        class ViewSet(DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.order_by("id")
+            serializer_class = PartySerializer
+
+        self.viewset_class = ViewSet
+        viewset = self.get_viewset("id,host.name,invites_count")
+        # The parties, the hosts and the invites counts.
+        with self.assertNumQueries(3):
+            data = async_to_sync(viewset.alist_data)()
+        self.assertEqual(
+            [
+                {"id": party.id, "host": {"name": "foo"}, "invites_count": 2}
+                for party in Party.objects.order_by("id")
+            ],
+            data,
+        )
@@ -0,0 +1,138 @@
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin, DynamicStreamingListMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.specs import DynamicPrefetch
+
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..models import Answer, Details, Invite, Party, Person
+from ..serializers import InviteSerializer, PartySerializer
+
+
+class BatchLoadTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        @dynamic_queryset(
+            prefetches=(
+                "invites.answer",
+                "invites.answer.details",
+                {"invites": DynamicPrefetch("invites", Invite.objects.for_user)},
+            ),
+            batch_loads=(
+                "host",
+                "invites.sender",
+                "invites.recipient",
+                "invites.answer.details.reviewer",
+            ),
+        )
+        class ViewSet(ListModelMixin, DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.all()
+            serializer_class = PartySerializer
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.guest = Person.objects.create(name="bar")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            for _ in range(2):
+                invite = Invite.objects.create(
+                    party=party, sender=self.user, recipient=self.guest
+                )
+                answer = Answer.objects.create(invite=invite)
+                Details.objects.create(answer=answer, reviewer=self.user)
+
+    def get_queryset(self, fields):
+        viewset = self.viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action="list",
+        )
+        return viewset.get_queryset()
+
+    def test_shared_instances(self):
+        queryset = self.get_queryset(
+            "id,host.name,invites.sender.name,invites.recipient.name,"
+            "invites.answer.details.reviewer.name"
+        )
+        # The parties, invites, answers, details and a single query for the persons.
+        with self.assertNumQueries(5):
+            parties = list(queryset)
+            hosts = {id(party.host) for party in parties}
+            invites = [invite for party in parties for invite in party.invites.all()]
+            senders = {id(invite.sender) for invite in invites}
+            recipients = {id(invite.recipient) for invite in invites}
+            reviewers = {
+                id(details.reviewer)
+                for invite in invites
+                for details in invite.answer.details.all()
+            }
+        self.assertEqual(1, len(hosts))
+        self.assertEqual(hosts, senders)
+        self.assertEqual(hosts, reviewers)
+        self.assertEqual(1, len(recipients))
+        self.assertEqual("bar", invites[0].recipient.name)
+
+    def test_pk_only(self):
+        with self.assertNumQueries(2):
+            parties = list(self.get_queryset("id,host.id,invites.sender.id"))
+        self.assertFalse(Party.host.is_cached(parties[0]))
+
+    def test_only_fields(self):
+        queryset = self.get_queryset("id,invites.sender.name")
+        self.assertEqual(
+            {"id", "party", "sender"},
+            set(
+                queryset._prefetch_related_lookups[0].queryset.query.deferred_loading[0]
+            ),
+        )
+
+    def test_batch_only_fields(self):
+        @dynamic_queryset(batch_loads="party")
+        class ViewSet(DynamicQuerySetMixin, GenericViewSet):
+            queryset = Invite.objects.all()
+            serializer_class = InviteSerializer
+
+        viewset = ViewSet(
+            request=MockRequest(query_params={"fields": "id,party.title"}),
+            action="list",
+        )
+        with self.assertNumQueries(2) as context:
+            invites = list(viewset.get_queryset())
+        self.assertEqual("foo", invites[0].party.title)
+        parties_sql = context.captured_queries[1]["sql"]
+        self.assertIn('"test_app_party"."title"', parties_sql)
+        self.assertNotIn('"test_app_party"."host_id"', parties_sql)
+
+    def test_request(self):
+        request = APIRequestFactory().get(
+            "/parties/", {"fields": "id,host.name,invites.sender.name"}
+        )
+        force_authenticate(request, self.user)
+        with self.assertNumQueries(3):
+            response = self.viewset_class.as_view({"get": "list"})(request)
+        self.assertEqual(
+            [
+                {
+                    "id": party.id,
+                    "host": {"name": "foo"},
+                    "invites": [{"sender": {"name": "foo"}}] * 2,
+                }
+                for party in Party.objects.order_by("id")
+            ],
+            response.data,
+        )
+
+    def test_streaming(self):
+        class ViewSet(DynamicStreamingListMixin, self.viewset_class):
+            stream_chunk_size = 1
+
+        request = APIRequestFactory().get("/parties/", {"fields": "id,host.name"})
+        force_authenticate(request, self.user)
+        response = ViewSet.as_view({"get": "list"})(request)
+        with self.assertNumQueries(3):
+            content = b"".join(response.streaming_content)
+        self.assertEqual(2, content.count(b'"host":{"name":"foo"}'))
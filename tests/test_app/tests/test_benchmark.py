@@ -0,0 +1,72 @@
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..benchmark import compare_results, generate_data, run_benchmark
+from ..models import Answer, Details, Invite, Party, Person
+
+
+class BenchmarkTestCase(TestCase):
+    def test_generate_data(self):
+        user = generate_data(30)
+        self.assertEqual(10, Person.objects.count())
+        self.assertEqual(30, Party.objects.count())
+        self.assertEqual(90, Invite.objects.count())
+        self.assertEqual(60, Answer.objects.count())
+        self.assertEqual(120, Details.objects.count())
+        self.assertEqual(90, Invite.objects.for_user(MockRequest(user=user)).count())
+
+    def test_run_benchmark(self):
+        user = generate_data(5)
+        results = run_benchmark(
+            user, 5, page_size=2, repeat=1, fields_matrix=("id", "id,invites.id")
+        )
+        self.assertEqual(5, results["meta"]["scale"])
+        self.assertEqual(
+            ["id", "id,invites.id"], [result["fields"] for result in results["results"]]
+        )
+        self.assertEqual([1, 2], [result["queries"] for result in results["results"]])
+        for result in results["results"]:
+            for metric in (
+                "planning_ms",
+                "fetch_ms",
+                "sql_ms",
+                "serialization_ms",
+                "total_ms",
+                "cold_planning_ms",
+                "requests_per_second",
+                "peak_memory_kb",
+            ):
+                self.assertGreater(result[metric], 0, metric)
+
+    def test_compare_results(self):
+        baseline = {
+            "results": [
+                {"fields": "id", "total_ms": 10, "queries": 1},
+                {"fields": "id,host.name", "total_ms": 10, "queries": 1},
+                {"fields": "id,invites.id", "total_ms": 10, "queries": 2},
+            ]
+        }
+        current = {
+            "results": [
+                {"fields": "id", "total_ms": 10.5, "queries": 1},
+                {"fields": "id,host.name", "total_ms": 12, "queries": 1},
+                {"fields": "id,invites.id", "total_ms": 9, "queries": 3},
+                {"fields": "id,title", "total_ms": 100, "queries": 1},
+            ]
+        }
+        self.assertEqual(
+            [
+                {
+                    "fields": "id,host.name",
+                    "metric": "total_ms",
+                    "baseline": 10,
+                    "current": 12,
+                },
+                {
+                    "fields": "id,invites.id",
+                    "metric": "queries",
+                    "baseline": 2,
+                    "current": 3,
+                },
+            ],
+            compare_results(baseline, current),
+        )
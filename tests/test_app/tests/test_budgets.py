@@ -0,0 +1,101 @@
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.budgets import QueryBudget, QueryBudgetExceeded
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin, DynamicResponseCacheMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.responses import LocalResponseCache, response_models_cache
+
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..models import Invite, Party, Person
+from ..serializers import PartySerializer
+
+
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        @dynamic_queryset(
+            prefetches="invites",
+            selects=("host", "invites.sender", "invites.recipient"),
+        )
+        class ViewSet(DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.order_by("id")
+            serializer_class = PartySerializer
+            dynamic_query_budget = QueryBudget(max_cost=6)
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.party = Party.objects.create(title="foo", host=self.user)
+        Invite.objects.create(party=self.party, sender=self.user, recipient=self.user)
+
+    def get_viewset(self, fields, action="list"):
+        return self.viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action=action,
+            format_kwarg=None,
+        )
+
+    def test_reject(self):
+        viewset = self.get_viewset("id,invites.sender.name,invites.recipient.name")
+        with self.assertNumQueries(0), self.assertRaises(QueryBudgetExceeded) as cm:
+            viewset.get_queryset()
+        self.assertEqual(400, cm.exception.status_code)
+        # Within the budget, and without the requested fields, nothing is limited.
+        for fields in ("id,invites.sender.name", None):
+            viewset = self.get_viewset(fields)
+            self.assertEqual([self.party], list(viewset.get_queryset()))
+
+    def test_budgets(self):
+        self.viewset_class.throttle_scope = "parties"
+        self.viewset_class.dynamic_query_budgets = {
+            ("retrieve", "parties"): QueryBudget(max_cost=20),
+            "parties": QueryBudget(max_fields=1),
+        }
+        fields = "id,invites.sender.name,invites.recipient.name"
+        self.get_viewset(fields, "retrieve").get_queryset()
+        with self.assertRaises(QueryBudgetExceeded):
+            self.get_viewset(fields).get_queryset()
+
+    def test_degrade(self):
+        self.viewset_class.dynamic_query_budget = QueryBudget(max_cost=7, degrade=True)
+        viewset = self.get_viewset(
+            "id,host.name,invites.sender.name,invites.recipient.name"
+        )
+        with self.assertNumQueries(2):
+            data = viewset.get_serializer(viewset.get_queryset(), many=True).data
+        self.assertEqual(("invites.sender.name",), viewset.dynamic_pruned_fields)
+        self.assertEqual(
+            {"id", "host", "invites"},
+            set(data[0]),
+        )
+        self.assertEqual({"recipient": {"name": "foo"}}, data[0]["invites"][0])
+
+    def test_truncate(self):
+        budget = QueryBudget(max_depth=2, max_fields=2, degrade=True)
+        self.viewset_class.dynamic_query_budget = budget
+        viewset = self.get_viewset("id,invites.sender.name,host.name,title")
+        viewset.get_queryset()
+        self.assertEqual(["host.name", "id"], list(viewset.requested_fields.paths()))
+
+    def test_response_cache(self):
+        response_models_cache.clear()
+
+        class ViewSet(DynamicResponseCacheMixin, ListModelMixin, self.viewset_class):
+            dynamic_query_budget = QueryBudget(max_cost=6, degrade=True)
+            response_cache = LocalResponseCache()
+
+        fields = "id,invites.sender.name,invites.recipient.name"
+        for queries in (2, 0):
+            request = APIRequestFactory().get("/parties/", {"fields": fields})
+            force_authenticate(request, self.user)
+            with self.assertNumQueries(queries):
+                response = ViewSet.as_view({"get": "list"})(request)
+            self.assertEqual("invites.sender.name", response["X-Pruned-Fields"])
+            self.assertEqual(
+                [{"id": self.party.id, "invites": [{"recipient": {"name": "foo"}}]}],
+                response.data,
+            )
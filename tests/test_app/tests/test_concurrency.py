@@ -0,0 +1,124 @@
+import threading
+from unittest import mock
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.test import TransactionTestCase
+from rest_framework import serializers
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics import concurrency
+from drf_dynamics.concurrency import group_prefetch_lookups
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicFieldsMixin, DynamicQuerySetMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.specs import DynamicPrefetch
+
+from .helpers import MockRequest
+from ..models import Invite, Party, Person
+from ..serializers import InviteSerializer
+
+
+class ProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Person
+        fields = ("id", "name")
+
+    representation_fields = {
+        "hosted_parties": serializers.PrimaryKeyRelatedField(many=True, read_only=True),
+        "sent_invites": InviteSerializer(many=True),
+    }
+
+
+class ConcurrentPrefetchesTestCase(TransactionTestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        @dynamic_queryset(
+            prefetches=(
+                "hosted_parties",
+                "sent_invites.answer",
+                {"sent_invites": DynamicPrefetch("sent_invites", Invite.objects.all())},
+            ),
+            selects="sent_invites.recipient",
+        )
+        class ViewSet(ListModelMixin, DynamicQuerySetMixin, GenericViewSet):
+            queryset = Person.objects.order_by("id")
+            serializer_class = ProfileSerializer
+            dynamic_concurrent_prefetches = True
+            dynamic_prefetch_workers = 2
+            dynamic_instrumentation = True
+            dynamic_metrics_callbacks = (self.callback,)
+
+        self.viewset_class = ViewSet
+        self.recorders = []
+        self.user = Person.objects.create(name="foo")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            Invite.objects.create(party=party, sender=self.user, recipient=self.user)
+
+    def callback(self, request, recorder):
+        self.recorders.append(recorder)
+
+    def get_queryset(self, fields):
+        viewset = self.viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action="list",
+        )
+        return viewset.get_queryset()
+
+    def test_prefetches(self):
+        queryset = self.get_queryset(
+            "id,hosted_parties,sent_invites.recipient.name,sent_invites.answer.id"
+        )
+        threads = set()
+        run_prefetches = concurrency.run_prefetches
+
+        def record_thread(*args):
+            threads.add(threading.get_ident())
+            return run_prefetches(*args)
+
+        with mock.patch.object(concurrency, "run_prefetches", record_thread):
+            (person,) = queryset
+        self.assertEqual(1, len(threads))
+        self.assertNotIn(threading.get_ident(), threads)
+        with self.assertNumQueries(0):
+            self.assertEqual(2, len(person.hosted_parties.all()))
+            self.assertEqual(
+                ["foo", "foo"],
+                [invite.recipient.name for invite in person.sent_invites.all()],
+            )
+
+    def test_atomic(self):
+        queryset = self.get_queryset("id,hosted_parties,sent_invites.id")
+        with mock.patch.object(concurrency, "run_prefetches") as run_prefetches:
+            with transaction.atomic():
+                (person,) = queryset
+        run_prefetches.assert_not_called()
+        self.assertEqual(2, len(person.sent_invites.all()))
+
+    def test_instrumentation(self):
+        request = APIRequestFactory().get(
+            "/persons/", {"fields": "id,hosted_parties,sent_invites.text"}
+        )
+        force_authenticate(request, self.user)
+        response = self.viewset_class.as_view({"get": "list"})(request)
+        self.assertEqual(200, response.status_code)
+        metrics = self.recorders[0].as_dict()
+        self.assertEqual(
+            {"root": 1, "hosted_parties": 1, "sent_invites": 1},
+            {
+                path: metrics[path]["queries"]
+                for path in ("root", "hosted_parties", "sent_invites")
+            },
+        )
+        self.assertEqual(2, metrics["sent_invites"]["rows"])
+
+    def test_group_prefetch_lookups(self):
+        bar = Prefetch("bar")
+        self.assertEqual(
+            [["foo", "foo__baz"], [bar]],
+            group_prefetch_lookups(["foo", bar, "foo__baz"]),
+        )
@@ -0,0 +1,115 @@
+from unittest import mock
+
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.responses import LocalResponseCache
+
+from .testcases import TestCase
+from ..models import Invite, Party, Person
+from ..serializers import InviteSerializer, PartySerializer, PersonSerializer
+
+
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        self.fragment_cache = LocalResponseCache()
+
+        class CachedPersonSerializer(PersonSerializer):
+            fragment_cache = self.fragment_cache
+
+        class CachedInviteSerializer(InviteSerializer):
+            representation_fields = {
+                **InviteSerializer.representation_fields,
+                "sender": CachedPersonSerializer(),
+            }
+
+        class CachedPartySerializer(PartySerializer):
+            representation_fields = {
+                **PartySerializer.representation_fields,
+                "host": CachedPersonSerializer(),
+                "invites": CachedInviteSerializer(many=True),
+            }
+
+        @dynamic_queryset(
+            prefetches="invites",
+            selects=("host", "invites.sender", "invites.recipient"),
+        )
+        class ViewSet(ListModelMixin, DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.order_by("id")
+            serializer_class = CachedPartySerializer
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.guest = Person.objects.create(name="bar")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            Invite.objects.create(party=party, sender=self.guest, recipient=self.user)
+
+    def get_data(self, fields):
+        request = APIRequestFactory().get("/parties/", {"fields": fields})
+        force_authenticate(request, self.user)
+        return self.viewset_class.as_view({"get": "list"})(request).data
+
+    def test_cached_fragments(self):
+        fields = "id,host.name,invites.sender.name,invites.recipient.name"
+        # The hosts and the senders are loaded by a single query.
+        with self.assertNumQueries(3):
+            data = self.get_data(fields)
+        self.assertEqual(
+            [
+                {
+                    "id": party.id,
+                    "host": {"name": "foo"},
+                    "invites": [
+                        {"sender": {"name": "bar"}, "recipient": {"name": "foo"}}
+                    ],
+                }
+                for party in Party.objects.order_by("id")
+            ],
+            data,
+        )
+        # Only the ids of the cached persons are fetched,
+        # the recipients aren't cached, so those are still joined.
+        with self.assertNumQueries(2) as context:
+            self.assertEqual(data, self.get_data(fields))
+        root_sql, invites_sql = (query["sql"] for query in context.captured_queries)
+        self.assertNotIn("JOIN", root_sql)
+        self.assertIn('"test_app_party"."host_id"', root_sql)
+        self.assertIn("JOIN", invites_sql)
+
+    def test_invalidation(self):
+        fields = "id,host.name"
+        self.get_data(fields)
+        self.user.name = "baz"
+        self.user.save()
+        with self.assertNumQueries(2):
+            data = self.get_data(fields)
+        self.assertEqual(["baz", "baz"], [party["host"]["name"] for party in data])
+        with self.assertNumQueries(1):
+            self.get_data(fields)
+
+    def test_requested_subtree(self):
+        self.get_data("id,host.name")
+        with self.assertNumQueries(2):
+            data = self.get_data("id,host.id,host.name")
+        self.assertEqual({"id": self.user.id, "name": "foo"}, data[0]["host"])
+
+    def test_cache_lookups(self):
+        fields = "id,host.name,invites.sender.name"
+        data = self.get_data(fields)
+        # Every batch load looks its persons up at once, and those aren't looked up
+        # again, when rendered.
+        with mock.patch.object(
+            self.fragment_cache, "get", wraps=self.fragment_cache.get
+        ) as get, mock.patch.object(
+            self.fragment_cache, "get_many", wraps=self.fragment_cache.get_many
+        ) as get_many:
+            self.assertEqual(data, self.get_data(fields))
+        get.assert_not_called()
+        self.assertEqual(2, get_many.call_count)
@@ -1,7 +1,19 @@
-from drf_dynamics.helpers import dynamic_queryset, tagged_chain
+from unittest import mock
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+from drf_dynamics.helpers import (
+    dynamic_queryset,
+    get_relation_index,
+    resolve_dynamic_querysets,
+    tagged_chain,
+)
+from drf_dynamics.mixins import DynamicFieldsMixin
 from drf_dynamics.specs import DynamicAnnotation, DynamicPrefetch, DynamicSelect
 from .testcases import TestCase
-from ..models import Answer, Details, Invite, Party
+from ..models import Answer, Details, Invite, Party, Person
+from ..serializers import InviteSerializer, PartySerializer, PersonSerializer
 
 
 class TaggedChainTestCase(TestCase):
@@ -187,3 +199,200 @@ class DynamicQuerySetTestCase(TestCase):
             DynamicSelect("answer__reviewer", parent_prefetch_path="invites"),
             self.viewset_class.dynamic_selects["invites.answer.reviewer"],
         )
+
+    def test_auto(self):
+        self.viewset_class.serializer_class = PartySerializer
+        dynamic_queryset(auto=True)(self.viewset_class)
+
+        self.assertEqual(
+            {
+                "invites": ("invites", None),
+                "invites.answer": ("answer", "invites"),
+                "invites.answer.details": ("details", "invites.answer"),
+            },
+            {
+                path: (spec.lookup, spec.parent_prefetch_path)
+                for path, spec in self.viewset_class.dynamic_prefetches.items()
+            },
+        )
+        self.assertSpecsEqual(
+            DynamicPrefetch(
+                "details",
+                Details.objects.all(),
+                parent_prefetch_path="invites.answer",
+            ),
+            self.viewset_class.dynamic_prefetches["invites.answer.details"],
+        )
+        self.assertEqual(
+            {
+                "invites_count": ("with_invites_count", None),
+                "invites.answer.all_details_reviewed": (
+                    "with_all_details_reviewed",
+                    "invites.answer",
+                ),
+            },
+            {
+                path: (spec.method_name, spec.parent_prefetch_path)
+                for path, spec in self.viewset_class.dynamic_annotations.items()
+            },
+        )
+        self.assertEqual(
+            {
+                "host": ("host", None),
+                "invites.sender": ("sender", "invites"),
+                "invites.recipient": ("recipient", "invites"),
+                "invites.answer.details.reviewer": (
+                    "reviewer",
+                    "invites.answer.details",
+                ),
+            },
+            {
+                path: (spec.lookup, spec.parent_prefetch_path)
+                for path, spec in self.viewset_class.dynamic_selects.items()
+            },
+        )
+
+    def test_auto_explicit_specs(self):
+        self.viewset_class.serializer_class = PartySerializer
+        dynamic_queryset(
+            prefetches={"invites": DynamicPrefetch("invites", Invite.objects.for_user)},
+            selects={"host": DynamicSelect("host", pk_field_name="pk")},
+            auto=True,
+        )(self.viewset_class)
+
+        self.assertIsNotNone(
+            self.viewset_class.dynamic_prefetches["invites"].get_queryset
+        )
+        self.assertEqual("pk", self.viewset_class.dynamic_selects["host"].pk_field_name)
+        self.assertIn("invites.answer.details", self.viewset_class.dynamic_prefetches)
+
+    def test_auto_select_chains(self):
+        class AnswerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+            class Meta:
+                model = Answer
+                fields = ("id", "text")
+
+            representation_fields = {
+                "invite": InviteSerializer(),
+            }
+
+        class DetailsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+            class Meta:
+                model = Details
+                fields = ("id", "answer", "reviewer")
+
+            representation_fields = {
+                "answer": AnswerSerializer(),
+                "reviewer_name": serializers.CharField(source="reviewer.name"),
+            }
+
+        class ViewSet:
+            queryset = Details.objects.all()
+            serializer_class = DetailsSerializer
+
+        dynamic_queryset(auto=True)(ViewSet)
+
+        # The invite's answer has the details and an annotation under it,
+        # so the relations leading to it are prefetched instead of selected.
+        self.assertEqual(
+            {
+                "answer": "answer",
+                "answer.invite": "invite",
+                "answer.invite.answer": "answer",
+                "answer.invite.answer.details": "details",
+            },
+            {path: spec.lookup for path, spec in ViewSet.dynamic_prefetches.items()},
+        )
+        self.assertEqual(
+            {
+                "answer.invite.sender": "sender",
+                "answer.invite.recipient": "recipient",
+                "answer.invite.answer.details.reviewer": "reviewer",
+            },
+            {path: spec.lookup for path, spec in ViewSet.dynamic_selects.items()},
+        )
+
+    def test_auto_select_lookups(self):
+        class EventSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+            class Meta:
+                model = Party
+                fields = ("id", "title")
+
+            representation_fields = {
+                "organizer": PersonSerializer(source="host"),
+            }
+
+        class TicketSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+            class Meta:
+                model = Invite
+                fields = ("id",)
+
+            representation_fields = {
+                "host": PersonSerializer(source="party.host"),
+                "event": EventSerializer(source="party"),
+            }
+
+        class ViewSet:
+            queryset = Invite.objects.all()
+            serializer_class = TicketSerializer
+
+        dynamic_queryset(auto=True)(ViewSet)
+
+        self.assertEqual({}, ViewSet.dynamic_prefetches)
+        self.assertEqual(
+            {"event": "party", "event.organizer": "party__host"},
+            {path: spec.lookup for path, spec in ViewSet.dynamic_selects.items()},
+        )
+
+
+class DeferredResolutionTestCase(TestCase):
+    def test_decoration_is_lazy(self):
+        class ViewSet:
+            queryset = Party.objects.all()
+
+        with mock.patch(
+            "drf_dynamics.helpers.build_dynamic_specs",
+            side_effect=AssertionError("resolved at decoration"),
+        ):
+            dynamic_queryset(prefetches="invites", selects="host")(ViewSet)
+
+        self.assertEqual(["invites"], list(ViewSet.dynamic_prefetches))
+        self.assertEqual(["host"], list(ViewSet.dynamic_selects))
+        # Once resolved, the plain maps replace the deferred attributes.
+        self.assertIs(dict, type(ViewSet.__dict__["dynamic_prefetches"]))
+
+    def test_subclass_access(self):
+        class ViewSet:
+            queryset = Party.objects.all()
+
+        dynamic_queryset(prefetches="invites")(ViewSet)
+
+        class SubViewSet(ViewSet):
+            pass
+
+        self.assertEqual(["invites"], list(SubViewSet.dynamic_prefetches))
+        self.assertIs(
+            ViewSet.__dict__["dynamic_prefetches"], SubViewSet.dynamic_prefetches
+        )
+
+    def test_resolve_dynamic_querysets(self):
+        class ViewSet:
+            queryset = Party.objects.all()
+
+        with mock.patch("drf_dynamics.helpers._pending_specs", []):
+            dynamic_queryset(prefetches="foo")(ViewSet)
+            with self.assertRaises(FieldDoesNotExist):
+                resolve_dynamic_querysets()
+
+    def test_relation_index(self):
+        self.assertEqual(
+            {
+                "host": Person,
+                "invites": Invite,
+            },
+            get_relation_index(Party),
+        )
+        index = get_relation_index(Person)
+        self.assertIs(Party, index["hosted_parties"])
+        self.assertIs(Invite, index["sent_invites"])
+        self.assertIs(index, get_relation_index(Person))
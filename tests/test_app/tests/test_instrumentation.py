@@ -0,0 +1,241 @@
+from unittest import mock
+
+from django.db.models.query import ModelIterable
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.detection import NPlusOneError, NPlusOneWarning, get_spec_kind
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.instrumentation import Recorder, get_current_recorder
+from drf_dynamics.mixins import DynamicQuerySetMixin
+
+from .testcases import TestCase
+from ..models import Answer, Details, Invite, Party, Person
+from ..serializers import PartySerializer
+from ..views import PartyViewSet
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.callback = mock.Mock()
+
+        class ViewSet(ListModelMixin, PartyViewSet):
+            dynamic_instrumentation = True
+            dynamic_server_timing = True
+            dynamic_metrics_callbacks = (self.callback,)
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            for _ in range(2):
+                invite = Invite.objects.create(
+                    party=party, sender=self.user, recipient=self.user
+                )
+                Answer.objects.create(invite=invite)
+
+    def get_response(self, viewset_class, fields):
+        request = APIRequestFactory().get("/parties/", {"fields": fields})
+        force_authenticate(request, self.user)
+        return viewset_class.as_view({"get": "list"})(request)
+
+    def test_metrics(self):
+        response = self.get_response(
+            self.viewset_class, "id,host.name,invites.id,invites.answer.id"
+        )
+        self.assertEqual(200, response.status_code)
+        self.callback.assert_called_once()
+        _, recorder = self.callback.call_args[0]
+        metrics = recorder.as_dict()
+
+        self.assertEqual(
+            {"root", "host", "invites", "invites.answer"}, set(metrics.keys())
+        )
+        self.assertEqual(
+            {"root": 1, "host": 0, "invites": 1, "invites.answer": 1},
+            {path: path_metrics["queries"] for path, path_metrics in metrics.items()},
+        )
+        self.assertEqual(
+            {"root": 2, "host": 0, "invites": 4, "invites.answer": 4},
+            {path: path_metrics["rows"] for path, path_metrics in metrics.items()},
+        )
+        for path in ("root", "host", "invites", "invites.answer"):
+            self.assertGreater(metrics[path]["serializer_time"], 0)
+        self.assertGreaterEqual(
+            metrics["root"]["serializer_time"], metrics["invites"]["serializer_time"]
+        )
+
+        server_timing = response["Server-Timing"].split(", ")
+        self.assertEqual(
+            [
+                "db.root",
+                "serializer.root",
+                "serializer.host",
+                "db.invites",
+                "serializer.invites",
+                "db.invites.answer",
+                "serializer.invites.answer",
+            ],
+            [entry.split(";")[0] for entry in server_timing],
+        )
+        self.assertIn('desc="queries=1 rows=4"', server_timing[3])
+
+    def test_lazy_queries_attributed_to_serializer(self):
+        # Without the answers prefetch, every answer is fetched
+        # by the answer field itself, while the invites are serialized.
+        class ViewSet(self.viewset_class):
+            dynamic_prefetches = {
+                path: spec
+                for path, spec in PartyViewSet.dynamic_prefetches.items()
+                if path != "invites.answer"
+            }
+
+        self.get_response(ViewSet, "id,invites.answer.text")
+        _, recorder = self.callback.call_args[0]
+        self.assertEqual(4, recorder.as_dict()["invites.answer"]["queries"])
+
+    def test_disabled(self):
+        class ViewSet(self.viewset_class):
+            dynamic_instrumentation = False
+
+        response = self.get_response(ViewSet, "id")
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.callback.assert_not_called()
+
+    def test_consecutive_requests(self):
+        # The shared querysets of the specs aren't instrumented in place.
+        fields = "id,invites.answer.id"
+        for _ in range(2):
+            self.assertEqual(
+                200, self.get_response(self.viewset_class, fields).status_code
+            )
+            _, recorder = self.callback.call_args[0]
+            self.assertEqual(1, recorder.as_dict()["invites.answer"]["queries"])
+        self.assertIsNone(get_current_recorder())
+        shared_queryset = PartyViewSet.dynamic_prefetches["invites.answer"].queryset
+        self.assertIs(ModelIterable, shared_queryset._iterable_class)
+        self.assertIsNone(shared_queryset._result_cache)
+
+    def test_recorder_reset(self):
+        self.get_response(self.viewset_class, "id")
+        self.assertIsNone(get_current_recorder())
+
+
+class RecorderTestCase(TestCase):
+    def test_instrument(self):
+        recorder = Recorder()
+        Party.objects.create(host=Person.objects.create())
+        queryset = recorder.instrument(Party.objects.all(), "parties")
+        self.assertEqual(1, len(queryset.filter(title="")))
+        self.assertEqual(1, recorder.metrics["parties"].rows)
+        self.assertEqual({}, Recorder().as_dict())
+
+
+class NPlusOneDetectionTestCase(TestCase):
+    def setUp(self):
+        @dynamic_queryset(prefetches="invites", selects="host")
+        class ViewSet(ListModelMixin, DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.all()
+            serializer_class = PartySerializer
+            dynamic_n_plus_one_detection = "raise"
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            Invite.objects.create(party=party, sender=self.user, recipient=self.user)
+
+    def get_response(self, viewset_class, fields):
+        request = APIRequestFactory().get("/parties/", {"fields": fields})
+        force_authenticate(request, self.user)
+        return viewset_class.as_view({"get": "list"})(request)
+
+    def test_missing_prefetch(self):
+        class ViewSet(self.viewset_class):
+            dynamic_prefetches = {}
+
+        with self.assertRaisesMessage(
+            NPlusOneError,
+            '2 queries were run lazily while serializing "invites" of ViewSet, '
+            'add "invites" to the prefetches of its @dynamic_queryset.',
+        ):
+            self.get_response(ViewSet, "id,invites.text")
+
+    def test_missing_select(self):
+        with self.assertRaisesMessage(
+            NPlusOneError,
+            '2 queries were run lazily while serializing "invites.sender" '
+            'of ViewSet, add "invites.sender" to the selects '
+            "of its @dynamic_queryset.",
+        ):
+            self.get_response(self.viewset_class, "id,invites.sender.name")
+
+    def test_compiled_representation(self):
+        class ViewSet(self.viewset_class):
+            dynamic_prefetches = {}
+
+        with mock.patch.object(PartySerializer, "compile_representation", True):
+            with self.assertRaisesMessage(NPlusOneError, 'serializing "invites"'):
+                self.get_response(ViewSet, "id,invites.text")
+
+    def test_planned(self):
+        response = self.get_response(
+            self.viewset_class, "id,host.name,invites.text,invites.sender.id"
+        )
+        self.assertEqual(200, response.status_code)
+
+    def test_auto_specs(self):
+        @dynamic_queryset(auto=True)
+        class ViewSet(ListModelMixin, DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.all()
+            serializer_class = PartySerializer
+            dynamic_n_plus_one_detection = "raise"
+
+        for invite in Invite.objects.all():
+            answer = Answer.objects.create(invite=invite)
+            Details.objects.create(answer=answer, reviewer=self.user)
+
+        response = self.get_response(
+            ViewSet,
+            "id,host.name,invites_count,invites.sender.name,invites.recipient.name,"
+            "invites.answer.all_details_reviewed,invites.answer.details.reviewer.name",
+        )
+        self.assertEqual(200, response.status_code)
+
+    def test_warn(self):
+        class ViewSet(self.viewset_class):
+            dynamic_n_plus_one_detection = "warn"
+
+        with self.assertWarns(NPlusOneWarning):
+            response = self.get_response(ViewSet, "id,invites.sender.name")
+        self.assertEqual(200, response.status_code)
+
+    def test_log(self):
+        class ViewSet(self.viewset_class):
+            dynamic_n_plus_one_detection = "log"
+
+        with self.assertLogs("drf_dynamics", "WARNING") as logs:
+            self.get_response(ViewSet, "id,invites.sender.name")
+        self.assertEqual(1, len(logs.output))
+        self.assertIn('add "invites.sender" to the selects', logs.output[0])
+
+    def test_sample_rate(self):
+        class ViewSet(self.viewset_class):
+            dynamic_n_plus_one_sample_rate = 0
+
+        response = self.get_response(ViewSet, "id,invites.sender.name")
+        self.assertEqual(200, response.status_code)
+
+    def test_get_spec_kind(self):
+        for path, spec_kind in (
+            ("host", "selects"),
+            ("invites", "prefetches"),
+            ("invites.answer", "selects"),
+            ("invites.answer.details", "prefetches"),
+            ("invites.answer.details.reviewer", "selects"),
+            ("title", None),
+            ("invites.foo", None),
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(spec_kind, get_spec_kind(Party, path))
@@ -0,0 +1,115 @@
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.specs import DynamicPrefetch
+
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..models import Answer, Invite, Party, Person
+from ..serializers import PartySerializer
+
+
+class CountedPartySerializer(PartySerializer):
+    representation_fields = {
+        **PartySerializer.representation_fields,
+        "invites_total": serializers.IntegerField(),
+    }
+
+
+class LimitedPrefetchTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        @dynamic_queryset(
+            prefetches=(
+                "invites.answer",
+                {
+                    "invites": DynamicPrefetch(
+                        "invites",
+                        Invite.objects.all(),
+                        limit=3,
+                        ordering=("-id",),
+                        count_attr="invites_total",
+                    )
+                },
+            ),
+            selects="invites.sender",
+        )
+        class ViewSet(DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.order_by("id")
+            serializer_class = CountedPartySerializer
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.parties = [
+            Party.objects.create(title=title, host=self.user)
+            for title in ("foo", "bar", "baz")
+        ]
+        self.invites = {
+            party.id: [
+                Invite.objects.create(
+                    party=party, sender=self.user, recipient=self.user
+                )
+                for _ in range(count)
+            ]
+            for party, count in zip(self.parties, (4, 1, 0))
+        }
+        for invites in self.invites.values():
+            for invite in invites:
+                Answer.objects.create(invite=invite, text=f"answer {invite.id}")
+
+    def get_data(self, fields):
+        viewset = self.viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action="list",
+            format_kwarg=None,
+        )
+        return viewset.get_serializer(viewset.get_queryset(), many=True).data
+
+    def test_limit(self):
+        with self.assertNumQueries(2):
+            data = self.get_data("id,invites[:2].id,invites_total")
+        self.assertEqual(
+            [
+                (
+                    [invite.id for invite in reversed(self.invites[party.id])][:2],
+                    len(self.invites[party.id]),
+                )
+                for party in self.parties
+            ],
+            [
+                ([invite["id"] for invite in party["invites"]], party["invites_total"])
+                for party in data
+            ],
+        )
+
+    def test_spec_limit(self):
+        # The requested limit can't exceed the spec's one.
+        data = self.get_data("id,invites[:10].id,invites.sender.name")
+        self.assertEqual([3, 1, 0], [len(party["invites"]) for party in data])
+        data = self.get_data("id,invites.id")
+        self.assertEqual([3, 1, 0], [len(party["invites"]) for party in data])
+
+    def test_nested(self):
+        with self.assertNumQueries(3):
+            data = self.get_data("id,invites[:1].sender.name,invites[:1].answer.text")
+        (invite,) = data[0]["invites"]
+        self.assertEqual(
+            {
+                "sender": {"name": "foo"},
+                "answer": {"text": f"answer {self.invites[self.parties[0].id][-1].id}"},
+            },
+            invite,
+        )
+
+    def test_invalid_limit(self):
+        # Only the reverse foreign keys can be limited.
+        with self.assertRaises(ValidationError):
+            self.get_data("id,invites.answer[:1].text")
+        # The huge limits are capped.
+        data = self.get_data(f"id,invites[:{'9' * 5000}].id")
+        self.assertEqual([3, 1, 0], [len(party["invites"]) for party in data])
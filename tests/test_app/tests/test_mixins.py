@@ -1,4 +1,11 @@
+import json
+from unittest import mock
+
 from django.db import models
+from rest_framework import serializers
+
+from drf_dynamics.mixins import DynamicFieldsMixin, DynamicStreamingListMixin
+from drf_dynamics.trees import FieldTree
 
 from .helpers import MockRequest
 from .testcases import TestCase
@@ -34,30 +41,38 @@ class DynamicQuerySetMixinTestCase(TestCase):
                 Party.objects.prefetch_related(
                     models.Prefetch(
                         "invites",
-                        Invite.objects.for_user(
-                            MockRequest(user=self.user)
-                        ).prefetch_related(
-                            models.Prefetch("answer", Answer.objects.all())
-                        ),
+                        Invite.objects.for_user(MockRequest(user=self.user))
+                        .prefetch_related(
+                            models.Prefetch(
+                                "answer", Answer.objects.only("id", "invite")
+                            )
+                        )
+                        .only("id", "party"),
                     )
-                ),
+                ).only("host", "id"),
             ),
             (
                 {"fields": "host.id,host.name,invites.answer.id"},
                 Party.objects.prefetch_related(
                     models.Prefetch(
                         "invites",
-                        Invite.objects.for_user(
-                            MockRequest(user=self.user)
-                        ).prefetch_related(
-                            models.Prefetch("answer", Answer.objects.all())
-                        ),
+                        Invite.objects.for_user(MockRequest(user=self.user))
+                        .prefetch_related(
+                            models.Prefetch(
+                                "answer", Answer.objects.only("id", "invite")
+                            )
+                        )
+                        .only("id", "party"),
                     )
-                ).select_related("host"),
+                )
+                .select_related("host")
+                .only("host", "host__id", "host__name", "id"),
             ),
             (
                 {"fields": "host.id,host.name,invites_count"},
-                Party.objects.with_invites_count(None).select_related("host"),
+                Party.objects.with_invites_count(None)
+                .select_related("host")
+                .only("host", "host__id", "host__name", "id"),
             ),
             (
                 {
@@ -67,20 +82,25 @@ class DynamicQuerySetMixinTestCase(TestCase):
                 Party.objects.prefetch_related(
                     models.Prefetch(
                         "invites",
-                        Invite.objects.for_user(
-                            MockRequest(user=self.user)
-                        ).prefetch_related(
+                        Invite.objects.for_user(MockRequest(user=self.user))
+                        .prefetch_related(
                             models.Prefetch(
                                 "answer",
-                                Answer.objects.with_all_details_reviewed(
-                                    None
-                                ).prefetch_related(
-                                    models.Prefetch("details", Details.objects.all())
-                                ),
+                                Answer.objects.with_all_details_reviewed(None)
+                                .prefetch_related(
+                                    models.Prefetch(
+                                        "details",
+                                        Details.objects.only(
+                                            "answer", "id", "reviewer"
+                                        ),
+                                    )
+                                )
+                                .only("id", "invite"),
                             ),
-                        ),
+                        )
+                        .only("id", "party"),
                     )
-                ),
+                ).only("id"),
             ),
         ):
             viewset = self.viewset_class(
@@ -89,6 +109,29 @@ class DynamicQuerySetMixinTestCase(TestCase):
             )
             self.assertQuerysetsEqual(queryset, viewset.get_queryset())
 
+    def test_get_queryset_only_fields_disabled(self):
+        viewset = self.viewset_class(
+            request=MockRequest(
+                query_params={"fields": "host.id,host.name,invites_count"},
+                user=self.user,
+            ),
+            action="list",
+        )
+        viewset.dynamic_only_fields = False
+        self.assertQuerysetsEqual(
+            Party.objects.with_invites_count(None).select_related("host"),
+            viewset.get_queryset(),
+        )
+
+    def test_get_queryset_only_fields_unknown_field(self):
+        # `foo` can't be mapped to the model,
+        # so the root queryset is left untouched.
+        viewset = self.viewset_class(
+            request=MockRequest(query_params={"fields": "id,foo"}, user=self.user),
+            action="list",
+        )
+        self.assertQuerysetsEqual(Party.objects.all(), viewset.get_queryset())
+
     def test_get_queryset_no_fields(self):
         viewset = self.viewset_class(
             request=MockRequest(query_params={}, user=self.user), action="list"
@@ -156,6 +199,83 @@ class DynamicFieldsMixinTestCase(TestCase):
         with self.assertNumQueries(0):
             serializer.data
 
+    def test_only_fields_num_queries(self):
+        query_params = {
+            "fields": "id,title,invites.text,invites.sender.name,"
+            "invites.answer.details.reviewer.name"
+        }
+        viewset = self.viewset_class(
+            request=MockRequest(query_params=query_params, user=self.user),
+            action="list",
+            format_kwarg="json",
+        )
+        serializer = viewset.get_serializer(viewset.get_queryset(), many=True)
+        # The party, invites, answers and details, nothing deferred is loaded.
+        with self.assertNumQueries(4):
+            serializer.data
+
+    def test_readable_fields_cached(self):
+        class Serializer(self.serializer_class):
+            cache_readable_fields = True
+
+        requested_fields = FieldTree.parse("id,host.name,invites.sender.id")
+        serializer = Serializer(self.party, requested_fields=requested_fields)
+        data = serializer.data
+        with mock.patch.object(
+            Serializer, "get_readable_fields"
+        ) as get_readable_fields:
+            other = Serializer(
+                self.party,
+                requested_fields=requested_fields,
+                context={"request": "foo"},
+            )
+            self.assertEqual(data, other.data)
+            get_readable_fields.assert_not_called()
+
+        fields = {field.field_name: field for field in other._readable_fields}
+        self.assertEqual({"id", "host", "invites"}, set(fields))
+        for field in fields.values():
+            self.assertIs(other, field.parent)
+        invite_fields = fields["invites"].child._readable_fields
+        self.assertEqual(["sender"], [field.field_name for field in invite_fields])
+        self.assertEqual({"request": "foo"}, invite_fields[0].context)
+        self.assertIsNot(
+            serializer._readable_fields[0],
+            other._readable_fields[0],
+        )
+
+    def test_readable_fields_cached_many_related(self):
+        class Serializer(DynamicFieldsMixin, serializers.ModelSerializer):
+            cache_readable_fields = True
+
+            class Meta:
+                model = Party
+                fields = ("id", "invites")
+
+        requested_fields = FieldTree.parse("id,invites")
+        Serializer(self.party, requested_fields=requested_fields).data
+        other = Serializer(
+            self.party, requested_fields=requested_fields, context={"request": "foo"}
+        )
+        invites = {field.field_name: field for field in other._readable_fields}[
+            "invites"
+        ]
+        # The child relation isn't shared with the template.
+        self.assertIs(invites, invites.child_relation.parent)
+        self.assertEqual({"request": "foo"}, invites.child_relation.context)
+
+    def test_readable_fields_cache_disabled(self):
+        class Serializer(self.serializer_class):
+            cache_readable_fields = False
+
+        requested_fields = FieldTree.parse("id,title")
+        Serializer(self.party, requested_fields=requested_fields).data
+        self.assertEqual(0, len(Serializer.get_readable_fields_cache()))
+        self.assertEqual(
+            {"id": self.party.pk, "title": self.party.title},
+            Serializer(self.party, requested_fields=requested_fields).data,
+        )
+
     def test_representation(self):
         for query_params, representation in (
             (
@@ -211,3 +331,219 @@ class DynamicFieldsMixinTestCase(TestCase):
                     serializer = viewset.get_serializer(instance)
                     data = representation
                 self.assertEqual(data, serializer.data)
+
+
+class CompiledRepresentationTestCase(TestCase):
+    def setUp(self):
+        self.user = Person.objects.create(name="foo")
+        self.party = Party.objects.create(title="foo", host=self.user)
+        self.invite = Invite.objects.create(
+            text="foo", party=self.party, sender=self.user, recipient=self.user
+        )
+        self.answer = Answer.objects.create(text="foo", invite=self.invite)
+        self.details = Details.objects.create(answer=self.answer, reviewer=self.user)
+
+    def get_data(self, serializer_class, instance, fields=None, compiled=True):
+        requested_fields = None if fields is None else FieldTree.parse(fields)
+        with mock.patch.object(DynamicFieldsMixin, "compile_representation", compiled):
+            return serializer_class(instance, requested_fields=requested_fields).data
+
+    def test_same_representation(self):
+        queryset = Party.objects.with_invites_count(None)
+        for fields in (
+            "id,title,host.id",
+            "id,host.name,invites_count,invites.answer.details.reviewer.name",
+            "invites.sender.id,invites.recipient.name,invites.answer.text",
+        ):
+            party = queryset.get()
+            self.assertEqual(
+                self.get_data(PartySerializer, party, fields, compiled=False),
+                self.get_data(PartySerializer, party, fields),
+            )
+
+    def test_custom_fields(self):
+        class Serializer(DynamicFieldsMixin, serializers.ModelSerializer):
+            class Meta:
+                model = Party
+                fields = ("id",)
+
+            representation_fields = {
+                "host_name": serializers.CharField(source="host.name"),
+                "upper_title": serializers.SerializerMethodField(),
+                "missing": serializers.CharField(required=False),
+                "missing_default": serializers.CharField(default="bar"),
+            }
+
+            def get_upper_title(self, instance):
+                return instance.title.upper()
+
+        self.assertEqual(
+            {
+                "id": self.party.pk,
+                "host_name": "foo",
+                "upper_title": "FOO",
+                "missing_default": "bar",
+            },
+            self.get_data(Serializer, self.party),
+        )
+
+    def test_pk_only(self):
+        party = Party.objects.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                {"host": {"id": self.user.pk}},
+                self.get_data(PartySerializer, party, "host.id"),
+            )
+
+
+class ValuesFastPathTestCase(TestCase):
+    def setUp(self):
+        class ViewSet(PartyViewSet):
+            dynamic_values_actions = {"list"}
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            Invite.objects.create(
+                text="foo", party=party, sender=self.user, recipient=self.user
+            )
+            invite = Invite.objects.create(
+                text="bar", party=party, sender=self.user, recipient=self.user
+            )
+            answer = Answer.objects.create(text="foo", invite=invite)
+            Details.objects.create(answer=answer, reviewer=self.user)
+
+    def get_data(self, viewset_class, fields):
+        viewset = viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action="list",
+            format_kwarg="json",
+        )
+        queryset = viewset.get_queryset()
+        return queryset, viewset.get_serializer(queryset, many=True).data
+
+    def test_same_representation(self):
+        for fields, num_queries in (
+            ("id,title,host.id", 1),
+            ("id,host.name,invites_count", 1),
+            (
+                "id,invites.text,invites.sender.name,invites.answer.text,"
+                "invites.answer.all_details_reviewed,"
+                "invites.answer.details.reviewed,invites.answer.details.reviewer.name",
+                4,
+            ),
+        ):
+            _, data = self.get_data(PartyViewSet, fields)
+            with self.assertNumQueries(num_queries):
+                queryset, values_data = self.get_data(self.viewset_class, fields)
+            self.assertEqual(data, values_data)
+            self.assertIsInstance(queryset[0], dict)
+
+    def test_unsupported_shape(self):
+        for fields in ("id,foo", "host.id,host.foo", None):
+            queryset, _ = self.get_data(self.viewset_class, fields)
+            self.assertIsInstance(queryset[0], Party)
+
+    def test_bare_relations(self):
+        class Serializer(DynamicFieldsMixin, serializers.ModelSerializer):
+            class Meta:
+                model = Party
+                fields = ("id", "host", "invites")
+
+        class ViewSet(self.viewset_class):
+            serializer_class = Serializer
+
+        class ModelsViewSet(PartyViewSet):
+            serializer_class = Serializer
+
+        _, data = self.get_data(ModelsViewSet, "id,host")
+        with self.assertNumQueries(1):
+            queryset, values_data = self.get_data(ViewSet, "id,host")
+        self.assertEqual(data, values_data)
+        self.assertEqual(self.user.pk, values_data[0]["host"])
+        self.assertIsInstance(queryset[0], dict)
+        # The nested serializers aren't rendered without the nested fields.
+        queryset, values_data = self.get_data(self.viewset_class, "id,host")
+        self.assertEqual(["id"], list(values_data[0]))
+        self.assertIsInstance(queryset[0], dict)
+        # The many related fields are rendered from the models.
+        viewset = ViewSet(
+            request=MockRequest(query_params={"fields": "id,invites"}, user=self.user),
+            action="list",
+        )
+        self.assertIsNone(viewset.get_dynamic_plan(Party.objects.all()).values_plan)
+
+    def test_other_actions(self):
+        viewset = self.viewset_class(
+            request=MockRequest(query_params={"fields": "id"}, user=self.user),
+            action="retrieve",
+        )
+        self.assertIsNone(viewset.get_dynamic_plan(Party.objects.all()).values_plan)
+
+    def test_chunked(self):
+        queryset, data = self.get_data(
+            self.viewset_class, "id,invites.text,invites.answer.text"
+        )
+        # Each chunk runs its own prefetches.
+        with self.assertNumQueries(5):
+            rows = list(queryset.iterator(chunk_size=1))
+        self.assertEqual(
+            [{"id": party["id"], "invites": party["invites"]} for party in data],
+            rows,
+        )
+
+
+class DynamicStreamingListMixinTestCase(TestCase):
+    def setUp(self):
+        class ViewSet(DynamicStreamingListMixin, PartyViewSet):
+            stream_chunk_size = 2
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        for title in ("foo", "bar", "baz"):
+            party = Party.objects.create(title=title, host=self.user)
+            Invite.objects.create(
+                text=title, party=party, sender=self.user, recipient=self.user
+            )
+
+    def get_viewset(self, viewset_class, fields):
+        return viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action="list",
+            format_kwarg=None,
+        )
+
+    def get_expected_data(self, fields):
+        viewset = self.get_viewset(PartyViewSet, fields)
+        return json.loads(
+            json.dumps(viewset.get_serializer(viewset.get_queryset(), many=True).data)
+        )
+
+    def test_json(self):
+        fields = "id,title,host.name,invites.text"
+        viewset = self.get_viewset(self.viewset_class, fields)
+        response = viewset.list(viewset.request)
+        self.assertEqual("application/json", response["Content-Type"])
+        # The parties are fetched by a single query in chunks of 2,
+        # and each chunk gets its own invites query.
+        with self.assertNumQueries(3):
+            content = b"".join(response.streaming_content)
+        self.assertEqual(self.get_expected_data(fields), json.loads(content))
+
+    def test_ndjson(self):
+        fields = "id,invites.text"
+        viewset = self.get_viewset(self.viewset_class, fields)
+        viewset.stream_format = "ndjson"
+        response = viewset.list(viewset.request)
+        self.assertEqual("application/x-ndjson", response["Content-Type"])
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(
+            self.get_expected_data(fields), [json.loads(line) for line in lines]
+        )
+
+    def test_empty(self):
+        Party.objects.all().delete()
+        viewset = self.get_viewset(self.viewset_class, "id")
+        response = viewset.list(viewset.request)
+        self.assertEqual([], json.loads(b"".join(response.streaming_content)))
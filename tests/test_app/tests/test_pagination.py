@@ -0,0 +1,258 @@
+import json
+from base64 import urlsafe_b64encode
+from unittest import mock
+from urllib import parse
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from drf_dynamics.counts import estimate_count
+from drf_dynamics.pagination import (
+    DynamicCursorPagination,
+    DynamicLimitOffsetPagination,
+    DynamicPageNumberPagination,
+)
+
+from .testcases import TestCase
+from ..models import Invite, Party, Person
+from ..views import PartyViewSet
+
+
+class DynamicCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        class Pagination(DynamicCursorPagination):
+            page_size = 2
+            ordering = "-invites_count"
+
+        class ViewSet(PartyViewSet):
+            pagination_class = Pagination
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.parties = []
+        for index, invites_count in enumerate((1, 3, 0, 3, 2)):
+            party = Party.objects.create(title=f"party {index}", host=self.user)
+            for _ in range(invites_count):
+                Invite.objects.create(
+                    party=party, sender=self.user, recipient=self.user
+                )
+            self.parties.append(party)
+
+    def get_viewset(self, viewset_class, url="/parties/", **query_params):
+        request = Request(APIRequestFactory().get(url, query_params))
+        request.user = self.user
+        viewset = viewset_class(request=request, action="list", format_kwarg=None)
+        return viewset
+
+    def get_page(self, url="/parties/", **query_params):
+        viewset = self.get_viewset(self.viewset_class, url, **query_params)
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        page = viewset.paginate_queryset(queryset)
+        return viewset.paginator, page
+
+    def test_pages(self):
+        paginator, page = self.get_page(fields="id,title,invites.id")
+        self.assertIsNone(paginator.get_previous_link())
+        pages = [page]
+        while paginator.get_next_link():
+            paginator, page = self.get_page(paginator.get_next_link())
+            pages.append(page)
+
+        expected = [party.pk for party in self.parties]
+        # By the invites count descending, then by the pk descending,
+        # the party without invites has a `NULL` count, which goes last.
+        expected = [expected[3], expected[1], expected[4], expected[0], expected[2]]
+        self.assertEqual(
+            [expected[:2], expected[2:4], expected[4:]],
+            [[party.pk for party in page] for page in pages],
+        )
+
+        paginator, page = self.get_page(paginator.get_previous_link())
+        self.assertEqual(expected[2:4], [party.pk for party in page])
+        self.assertIsNotNone(paginator.get_previous_link())
+        paginator, page = self.get_page(paginator.get_previous_link())
+        self.assertEqual(expected[:2], [party.pk for party in page])
+        self.assertIsNone(paginator.get_previous_link())
+
+    def test_deep_page_num_queries(self):
+        paginator, _ = self.get_page(fields="id,invites.id")
+        paginator, _ = self.get_page(paginator.get_next_link())
+        # The page itself and the invites of its rows.
+        with self.assertNumQueries(2):
+            _, page = self.get_page(paginator.get_next_link())
+            self.assertEqual([], list(page[0].invites.all()))
+
+    def test_ordering_filter(self):
+        class ViewSet(self.viewset_class):
+            filter_backends = [OrderingFilter]
+            ordering_fields = ["invites_count", "title"]
+
+        self.viewset_class = ViewSet
+        _, page = self.get_page(fields="id", ordering="invites_count,title")
+        # The party without invites has a `NULL` count, which goes last.
+        self.assertEqual(
+            [self.parties[0].pk, self.parties[4].pk], [party.pk for party in page]
+        )
+
+    def test_ordering_annotations(self):
+        for filter_backends, ordering_fields, annotated in (
+            ([], ["invites_count"], False),
+            ([OrderingFilter], ["title"], False),
+            ([OrderingFilter], ["invites_count"], True),
+        ):
+
+            class ViewSet(PartyViewSet):
+                pass
+
+            ViewSet.filter_backends = filter_backends
+            ViewSet.ordering_fields = ordering_fields
+            viewset = self.get_viewset(ViewSet, fields="id", ordering="-invites_count")
+            queryset = viewset.filter_queryset(viewset.get_queryset())
+            # Only the orderings, that the filter accepts, are annotated.
+            with self.subTest(filter_backends=filter_backends, fields=ordering_fields):
+                self.assertEqual(
+                    annotated, "invites_count" in queryset.query.annotations
+                )
+
+    def test_values_action(self):
+        class ViewSet(self.viewset_class):
+            dynamic_values_actions = {"list"}
+
+        def get_titles(page):
+            return [getattr(party, "title", None) or party["title"] for party in page]
+
+        pages = []
+        for viewset_class in (self.viewset_class, ViewSet):
+            self.viewset_class = viewset_class
+            # Neither the ordering fields nor the pk are requested.
+            paginator, page = self.get_page(fields="title")
+            titles = [get_titles(page)]
+            while paginator.get_next_link():
+                paginator, page = self.get_page(paginator.get_next_link())
+                titles.append(get_titles(page))
+            pages.append(titles)
+        self.assertIsInstance(page[0], dict)
+        self.assertEqual(3, len(pages[1]))
+        self.assertEqual(pages[0], pages[1])
+
+    def test_invalid_cursor(self):
+        for cursor in ("foo", "W10=", "eyJyIjowLCJwIjpbMV19"):
+            with self.subTest(cursor=cursor), self.assertRaises(NotFound):
+                self.get_page(cursor=cursor)
+
+    def test_forged_cursor(self):
+        for position in (["abc", 1], [{"x": 1}, 1], [[1, 2], 1], [1, "abc"]):
+            cursor = urlsafe_b64encode(
+                json.dumps({"r": 0, "p": position}).encode("ascii")
+            ).decode("ascii")
+            with self.subTest(position=position), self.assertRaises(NotFound):
+                self.get_page(cursor=cursor)
+        # The values are converted by the ordering fields.
+        position = ["3", str(self.parties[3].pk)]
+        cursor = urlsafe_b64encode(
+            json.dumps({"r": 0, "p": position}).encode("ascii")
+        ).decode("ascii")
+        _, page = self.get_page(cursor=cursor)
+        self.assertEqual(self.parties[1].pk, page[0].pk)
+
+    def test_cursor_keeps_query_params(self):
+        paginator, _ = self.get_page(fields="id")
+        query = parse.parse_qs(parse.urlparse(paginator.get_next_link()).query)
+        self.assertEqual(["id"], query["fields"])
+
+
+class CountQuerySetTestCase(TestCase):
+    def setUp(self):
+        class Pagination(DynamicPageNumberPagination):
+            page_size = 3
+
+        class ViewSet(PartyViewSet):
+            pagination_class = Pagination
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        for invites_count in (1, 3, 0, 2):
+            party = Party.objects.create(host=self.user)
+            for _ in range(invites_count):
+                Invite.objects.create(
+                    party=party, sender=self.user, recipient=self.user
+                )
+
+    def get_viewset(self, viewset_class, **query_params):
+        request = Request(APIRequestFactory().get("/parties/", query_params))
+        request.user = self.user
+        return viewset_class(request=request, action="list", format_kwarg=None)
+
+    def test_get_count_queryset(self):
+        viewset = self.get_viewset(
+            self.viewset_class, fields="id,host.name,invites.id,invites_count"
+        )
+        queryset = viewset.get_queryset()
+        count_queryset = viewset.get_count_queryset(queryset)
+        self.assertQuerysetsEqual(Party.objects.only("host", "id"), count_queryset)
+        self.assertIn("invites_count", queryset.query.annotations)
+
+    def test_annotation_filter(self):
+        viewset = self.get_viewset(self.viewset_class, fields="id,invites_count")
+        queryset = viewset.get_queryset().filter(invites_count__gt=1)
+        count_queryset = viewset.get_count_queryset(queryset)
+        self.assertEqual({}, count_queryset.query.annotations)
+        self.assertEqual(2, count_queryset.count())
+
+    def test_paginated_count(self):
+        viewset = self.get_viewset(
+            self.viewset_class, fields="id,host.name,invites_count"
+        )
+        with CaptureQueriesContext(connection) as queries:
+            page = viewset.paginate_queryset(viewset.get_queryset())
+        self.assertEqual(3, len(page))
+        self.assertEqual(4, viewset.paginator.page.paginator.count)
+        count_sql = queries.captured_queries[0]["sql"]
+        self.assertIn("COUNT", count_sql)
+        self.assertNotIn("JOIN", count_sql)
+        self.assertNotIn("test_app_invite", count_sql)
+
+    def test_limit_offset_count(self):
+        class ViewSet(PartyViewSet):
+            pagination_class = DynamicLimitOffsetPagination
+
+        viewset = self.get_viewset(ViewSet, fields="id,invites_count", limit=1)
+        with mock.patch.object(
+            ViewSet, "get_dynamic_count", autospec=True, return_value=4
+        ) as get_dynamic_count:
+            self.assertEqual(1, len(viewset.paginate_queryset(viewset.get_queryset())))
+        get_dynamic_count.assert_called_once()
+        self.assertEqual(4, viewset.paginator.count)
+
+    def test_count_cache(self):
+        class ViewSet(self.viewset_class):
+            dynamic_count_cache_timeout = 60
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        viewset = self.get_viewset(ViewSet, fields="id,invites_count")
+        self.assertEqual(4, viewset.get_dynamic_count(viewset.get_queryset()))
+        Party.objects.create(host=self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(4, viewset.get_dynamic_count(viewset.get_queryset()))
+        # Different filters are cached separately.
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                5, viewset.get_dynamic_count(Party.objects.filter(host=self.user))
+            )
+
+    def test_count_estimate(self):
+        class ViewSet(self.viewset_class):
+            dynamic_count_estimate_threshold = 0
+
+        viewset = self.get_viewset(ViewSet, fields="id")
+        # Estimates are only supported on PostgreSQL.
+        self.assertIsNone(estimate_count(Party.objects.all()))
+        self.assertEqual(4, viewset.get_dynamic_count(viewset.get_queryset()))
+        with mock.patch("drf_dynamics.mixins.estimate_count", return_value=1000):
+            self.assertEqual(1000, viewset.get_dynamic_count(viewset.get_queryset()))
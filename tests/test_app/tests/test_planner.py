@@ -0,0 +1,145 @@
+from unittest import mock
+
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin
+from drf_dynamics.planner import CostPlanner
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.specs import DynamicPrefetch, DynamicSelect
+
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..models import Answer, Invite, Party, Person
+from ..serializers import PartySerializer
+
+
+class CostPlannerTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+        self.callback = mock.Mock()
+        self.planner = CostPlanner(query_cost=10)
+
+        @dynamic_queryset(
+            prefetches=(
+                "invites.answer",
+                {"invites": DynamicPrefetch("invites", Invite.objects.for_user)},
+            ),
+            selects={"invites.sender": DynamicSelect("sender", cardinality=0.01)},
+            planner=self.planner,
+        )
+        class ViewSet(ListModelMixin, DynamicQuerySetMixin, GenericViewSet):
+            queryset = Party.objects.all()
+            serializer_class = PartySerializer
+            dynamic_instrumentation = True
+            dynamic_server_timing = True
+            dynamic_metrics_callbacks = (self.callback,)
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        for title in ("foo", "bar"):
+            party = Party.objects.create(title=title, host=self.user)
+            for _ in range(2):
+                invite = Invite.objects.create(
+                    party=party, sender=self.user, recipient=self.user
+                )
+                Answer.objects.create(invite=invite, text="baz")
+
+    def get_response(self, fields):
+        request = APIRequestFactory().get("/parties/", {"fields": fields})
+        force_authenticate(request, self.user)
+        return self.viewset_class.as_view({"get": "list"})(request)
+
+    def get_decisions(self):
+        return self.planner.get_decisions(
+            self.viewset_class,
+            Party,
+            self.viewset_class.dynamic_prefetches,
+            self.viewset_class.dynamic_annotations,
+            self.viewset_class.dynamic_selects,
+        )
+
+    def test_decisions(self):
+        # The sender is shared by the invites, so it's cheaper to prefetch,
+        # and the answer is a to-one relation, that is cheaper to join.
+        self.assertEqual(
+            (("invites.answer", "select"), ("invites.sender", "prefetch")),
+            self.get_decisions(),
+        )
+
+    def test_observed_rows(self):
+        self.planner.stats.observe(self.viewset_class, "invites", 2)
+        self.assertEqual((("invites.answer", "select"),), self.get_decisions())
+        self.planner.stats.observe(self.viewset_class, "invites", 1000)
+        self.planner.stats.observe(self.viewset_class, "invites.answer", 10)
+        self.assertEqual((("invites.sender", "prefetch"),), self.get_decisions())
+
+    def test_request(self):
+        with self.assertNumQueries(3):
+            response = self.get_response("id,invites.sender.name,invites.answer.text")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            ["foo"] * 4,
+            [
+                invite["sender"]["name"]
+                for party in response.data
+                for invite in party["invites"]
+            ],
+        )
+        self.assertEqual(
+            ["baz"] * 4,
+            [
+                invite["answer"]["text"]
+                for party in response.data
+                for invite in party["invites"]
+            ],
+        )
+
+        _, recorder = self.callback.call_args[0]
+        metrics = recorder.as_dict()
+        self.assertEqual("prefetch", metrics["invites.sender"]["strategy"])
+        self.assertEqual("select", metrics["invites.answer"]["strategy"])
+        self.assertEqual(1, metrics["invites.sender"]["rows"])
+        self.assertIn("db.invites.sender;dur=", response["Server-Timing"])
+        self.assertIn("strategy=prefetch", response["Server-Timing"])
+
+        # The observed rows are fed back to the planner.
+        self.assertEqual(2, self.planner.stats.get_rows(self.viewset_class, None))
+        self.assertEqual(4, self.planner.stats.get_rows(self.viewset_class, "invites"))
+
+    def test_pk_only(self):
+        # The sender's id is read from the foreign key, even if it's prefetched.
+        with self.assertNumQueries(2):
+            response = self.get_response("id,invites.sender.id")
+        self.assertEqual(
+            [{"id": self.user.id}] * 4,
+            [
+                invite["sender"]
+                for party in response.data
+                for invite in party["invites"]
+            ],
+        )
+
+    def test_plan_key(self):
+        viewset = self.viewset_class(
+            request=MockRequest(
+                query_params={"fields": "id,invites.sender.name"}, user=self.user
+            ),
+            action="list",
+        )
+        plan = viewset.get_dynamic_plan(viewset.queryset)
+        self.assertEqual(
+            {"invites": "prefetch", "invites.sender": "prefetch"},
+            plan.get_strategies(),
+        )
+        self.assertIs(plan, viewset.get_dynamic_plan(viewset.queryset))
+
+        self.planner.stats.observe(self.viewset_class, "invites", 2)
+        plan = viewset.get_dynamic_plan(viewset.queryset)
+        self.assertEqual(
+            {"invites": "prefetch", "invites.sender": "select"},
+            plan.get_strategies(),
+        )
+        self.assertEqual(2, plan_cache.misses)
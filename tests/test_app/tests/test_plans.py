@@ -0,0 +1,76 @@
+from drf_dynamics.cache import LRUCache
+from drf_dynamics.plans import QueryPlan, plan_cache
+from .helpers import MockRequest
+from .testcases import TestCase
+from ..models import Person
+from ..views import PartyViewSet
+
+
+class LRUCacheTestCase(TestCase):
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("foo", 1)
+        cache.set("bar", 2)
+        self.assertEqual(1, cache.get("foo"))
+        cache.set("baz", 3)
+        self.assertNotIn("bar", cache)
+        self.assertIn("foo", cache)
+        self.assertIn("baz", cache)
+        self.assertIsNone(cache.get("bar"))
+        self.assertEqual(
+            {"hits": 1, "misses": 1, "evictions": 1, "size": 2, "maxsize": 2},
+            cache.stats(),
+        )
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.set("foo", 1)
+        cache.get("foo")
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.stats()["hits"])
+
+
+class QueryPlanCacheTestCase(TestCase):
+    def setUp(self):
+        self.viewset_class = PartyViewSet
+        self.user = Person.objects.create()
+        plan_cache.clear()
+
+    def get_plan(self, fields, action="list"):
+        viewset = self.viewset_class(
+            request=MockRequest(query_params={"fields": fields}, user=self.user),
+            action=action,
+        )
+        viewset.get_queryset()
+        return viewset.get_dynamic_plan(viewset.queryset)
+
+    def test_plan_cached(self):
+        plan = self.get_plan("id,host.name")
+        self.assertIsInstance(plan, QueryPlan)
+        self.assertIs(plan, self.get_plan("id,host.name"))
+        self.assertEqual(1, plan_cache.misses)
+
+    def test_normalized_key(self):
+        plan = self.get_plan("id,host.name")
+        self.assertIs(plan, self.get_plan("HOST.name,id,id"))
+
+    def test_key_includes_action(self):
+        plan = self.get_plan("id,host.name")
+        self.assertIsNot(plan, self.get_plan("id,host.name", action="retrieve"))
+
+    def test_operations(self):
+        plan = self.get_plan("id,host.name,invites.sender.name")
+        self.assertEqual(
+            [
+                ("prefetch", "invites", None),
+                ("select", "host", None),
+                ("select", "invites.sender", "invites"),
+                ("only", None, None),
+                ("only", None, "invites"),
+            ],
+            [
+                (operation.tag, operation.path, operation.target)
+                for operation in plan.operations
+            ],
+        )
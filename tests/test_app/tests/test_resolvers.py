@@ -0,0 +1,73 @@
+from drf_dynamics.resolvers import BatchedField
+
+from .testcases import TestCase
+from ..models import Invite, Party, Person
+from ..serializers import InviteSerializer, PartySerializer
+
+calls = []
+
+
+def resolve_labels(keys, context):
+    calls.append(sorted(keys))
+    return {key: f"label {key}" for key in keys if key != context.get("missing")}
+
+
+class LabeledInviteSerializer(InviteSerializer):
+    representation_fields = {
+        **InviteSerializer.representation_fields,
+        "sender_label": BatchedField(resolve_labels, source="sender_id"),
+    }
+
+
+class LabeledPartySerializer(PartySerializer):
+    representation_fields = {
+        **PartySerializer.representation_fields,
+        "invites": LabeledInviteSerializer(many=True),
+        "host_label": BatchedField(resolve_labels, source="host_id"),
+    }
+
+
+class BatchedFieldTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.persons = [Person.objects.create(name=name) for name in ("foo", "bar")]
+        for host in self.persons:
+            party = Party.objects.create(host=host)
+            for sender in self.persons:
+                Invite.objects.create(party=party, sender=sender, recipient=host)
+
+    def test_single_batch(self):
+        parties = Party.objects.order_by("id")
+        data = LabeledPartySerializer(
+            parties,
+            many=True,
+            requested_fields={"host_label": {}, "invites": {"sender_label": {}}},
+        ).data
+        ids = [person.id for person in self.persons]
+        self.assertEqual([ids], calls)
+        self.assertEqual(
+            [
+                {
+                    "host_label": f"label {host_id}",
+                    "invites": [{"sender_label": f"label {id}"} for id in ids],
+                }
+                for host_id in ids
+            ],
+            data,
+        )
+
+    def test_not_requested(self):
+        LabeledPartySerializer(
+            Party.objects.all(), many=True, requested_fields={"id": {}}
+        ).data
+        self.assertEqual([], calls)
+
+    def test_single_instance(self):
+        party = Party.objects.first()
+        data = LabeledPartySerializer(
+            party,
+            requested_fields={"host_label": {}},
+            context={"missing": party.host_id},
+        ).data
+        self.assertEqual({"host_label": None}, data)
+        self.assertEqual([[party.host_id]], calls)
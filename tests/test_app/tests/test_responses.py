@@ -0,0 +1,160 @@
+from unittest import mock
+
+from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin, DynamicResponseCacheMixin
+from drf_dynamics.plans import plan_cache
+from drf_dynamics.responses import (
+    DjangoResponseCache,
+    LocalResponseCache,
+    get_queryset_models,
+    response_models_cache,
+)
+
+from drf_dynamics.specs import DynamicPrefetch
+
+from .test_limits import CountedPartySerializer
+from .testcases import TestCase
+from ..models import Invite, Party, Person
+from ..serializers import PartySerializer
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+        response_models_cache.clear()
+        self.response_cache = LocalResponseCache()
+
+        @dynamic_queryset(
+            prefetches="invites",
+            annotations="invites_count",
+            selects=("host", "invites.sender"),
+        )
+        class ViewSet(
+            DynamicResponseCacheMixin,
+            ListModelMixin,
+            RetrieveModelMixin,
+            DynamicQuerySetMixin,
+            GenericViewSet,
+        ):
+            queryset = Party.objects.order_by("id")
+            serializer_class = PartySerializer
+            response_cache = self.response_cache
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.guest = Person.objects.create(name="bar")
+        self.party = Party.objects.create(title="foo", host=self.user)
+        self.invite = Invite.objects.create(
+            party=self.party, sender=self.guest, recipient=self.user
+        )
+
+    def get_response(self, fields, user=None, action="list", **params):
+        request = APIRequestFactory().get("/parties/", {"fields": fields, **params})
+        force_authenticate(request, user or self.user)
+        view = self.viewset_class.as_view({"get": action})
+        kwargs = {"pk": self.party.id} if action == "retrieve" else {}
+        return view(request, **kwargs)
+
+    def test_hit(self):
+        fields = "id,invites_count,host.name,invites.sender.name"
+        data = self.get_response(fields).data
+        with self.assertNumQueries(0):
+            response = self.get_response(fields)
+        self.assertEqual(data, response.data)
+        self.get_response(fields, action="retrieve")
+        with self.assertNumQueries(0):
+            self.get_response(fields, action="retrieve")
+
+    def test_key(self):
+        self.get_response("id,title")
+        with self.assertNumQueries(1):
+            self.get_response("id,host.name")
+        with self.assertNumQueries(1):
+            self.get_response("id,title", user=self.guest)
+        with self.assertNumQueries(1):
+            self.get_response("id,title", ordering="title")
+        with self.assertNumQueries(0):
+            self.get_response("title,id", ordering="title")
+
+    def test_invalidation(self):
+        fields = "id,invites.sender.name"
+        self.get_response(fields)
+        # The save of a prefetched model invalidates the responses.
+        Person.objects.filter(id=self.guest.id).update(name="baz")
+        with self.assertNumQueries(0):
+            response = self.get_response(fields)
+        self.assertEqual("bar", response.data[0]["invites"][0]["sender"]["name"])
+        self.guest.name = "baz"
+        self.guest.save()
+        with self.assertNumQueries(2):
+            response = self.get_response(fields)
+        self.assertEqual("baz", response.data[0]["invites"][0]["sender"]["name"])
+        # The models, that aren't queried, don't.
+        self.get_response("id,title")
+        Invite.objects.create(party=self.party, sender=self.user, recipient=self.user)
+        with self.assertNumQueries(0):
+            self.get_response("id,title")
+
+    def test_version_stores(self):
+        labels = ["test_app.person"]
+        # The backends bump the versions before those serve any response.
+        local = LocalResponseCache()
+        shared = DjangoResponseCache(prefix="test")
+        (version,) = shared.get_versions(labels)
+        self.guest.save()
+        self.assertEqual((1,), local.get_versions(labels))
+        # The backends with the same store bump the versions once.
+        self.assertEqual(
+            (version + 1,), DjangoResponseCache(prefix="test").get_versions(labels)
+        )
+        self.assertEqual((version + 1,), shared.get_versions(labels))
+
+    def test_timeout(self):
+        self.response_cache.set("foo", "bar", 60)
+        self.assertEqual("bar", self.response_cache.get("foo"))
+        with mock.patch("time.monotonic", return_value=10**10):
+            self.assertIsNone(self.response_cache.get("foo"))
+        self.assertIsNone(self.response_cache.get("foo"))
+
+    def test_queryset_models(self):
+        # The annotation's subquery is queried along with the root table.
+        self.assertEqual(
+            ("test_app.invite", "test_app.party"),
+            get_queryset_models(Party.objects.with_invites_count(None)),
+        )
+        self.assertEqual(
+            ("test_app.invite", "test_app.party", "test_app.person"),
+            get_queryset_models(Party.objects.prefetch_related("invites__sender")),
+        )
+
+    def test_limited_prefetch_total(self):
+        @dynamic_queryset(
+            prefetches={
+                "invites": DynamicPrefetch(
+                    "invites", Invite.objects.all(), count_attr="invites_total"
+                )
+            },
+        )
+        class ViewSet(self.viewset_class):
+            serializer_class = CountedPartySerializer
+
+        self.viewset_class = ViewSet
+        fields = "id,invites[:1].id,invites_total"
+        self.assertEqual(
+            [
+                {
+                    "id": self.party.id,
+                    "invites": [{"id": self.invite.id}],
+                    "invites_total": 1,
+                }
+            ],
+            self.get_response(fields).data,
+        )
+        with self.assertNumQueries(0):
+            self.get_response(fields)
+        Invite.objects.create(party=self.party, sender=self.guest, recipient=self.user)
+        self.assertEqual(2, self.get_response(fields).data[0]["invites_total"])
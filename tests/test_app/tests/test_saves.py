@@ -0,0 +1,104 @@
+from rest_framework.mixins import CreateModelMixin, UpdateModelMixin
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.viewsets import GenericViewSet
+
+from drf_dynamics.budgets import QueryBudget
+from drf_dynamics.helpers import dynamic_queryset
+from drf_dynamics.mixins import DynamicQuerySetMixin
+from drf_dynamics.plans import plan_cache
+
+from .testcases import TestCase
+from ..models import Invite, Party, Person
+from ..serializers import PartySerializer
+
+
+class SavedPartySerializer(PartySerializer):
+    class Meta(PartySerializer.Meta):
+        read_only_fields = ("invites",)
+
+
+class RefetchTestCase(TestCase):
+    def setUp(self):
+        plan_cache.clear()
+
+        @dynamic_queryset(
+            prefetches="invites",
+            annotations="invites_count",
+            selects=("host", "invites.sender"),
+        )
+        class ViewSet(
+            DynamicQuerySetMixin, CreateModelMixin, UpdateModelMixin, GenericViewSet
+        ):
+            queryset = Party.objects.all()
+            serializer_class = SavedPartySerializer
+
+        self.viewset_class = ViewSet
+        self.user = Person.objects.create(name="foo")
+        self.party = Party.objects.create(title="foo", host=self.user)
+        Invite.objects.create(party=self.party, sender=self.user, recipient=self.user)
+
+    def get_response(self, action, data, fields, **kwargs):
+        method = "post" if action == "create" else "patch"
+        request = getattr(APIRequestFactory(), method)(
+            f"/parties/?fields={fields}", data, format="json"
+        )
+        force_authenticate(request, self.user)
+        return self.viewset_class.as_view({method: action})(request, **kwargs)
+
+    def test_create(self):
+        # The host's validation, the insert, and the party with its host
+        # and the annotation.
+        with self.assertNumQueries(3):
+            response = self.get_response(
+                "create",
+                {"title": "bar", "host": self.user.id},
+                "id,title,host.name,invites_count",
+            )
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(
+            {
+                "id": Party.objects.get(title="bar").id,
+                "title": "bar",
+                "host": {"name": "foo"},
+                "invites_count": None,
+            },
+            response.data,
+        )
+
+    def test_update(self):
+        fields = "title,invites_count,invites.sender.name"
+        with self.assertNumQueries(5):
+            response = self.get_response(
+                "partial_update", {"title": "bar"}, fields, pk=self.party.id
+            )
+        self.assertEqual(
+            {
+                "title": "bar",
+                "invites_count": 1,
+                "invites": [{"sender": {"name": "foo"}}],
+            },
+            response.data,
+        )
+
+    def test_values_action(self):
+        # The values plans don't render the instances, so those aren't re-read.
+        self.viewset_class.dynamic_values_actions = {"create"}
+        with self.assertNumQueries(2):
+            self.get_response("create", {"title": "bar", "host": self.user.id}, "id")
+
+    def test_budget(self):
+        # The over budget fields are rejected before the party is saved.
+        self.viewset_class.dynamic_query_budget = QueryBudget(max_cost=1)
+        data = {"title": "bar", "host": self.user.id}
+        response = self.get_response("create", data, "id,invites.sender.name")
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(Party.objects.filter(title="bar").exists())
+
+        # The degraded fields are rendered, without the lazy loads of the dropped ones.
+        self.viewset_class.dynamic_query_budget = QueryBudget(max_cost=1, degrade=True)
+        with self.assertNumQueries(3):
+            response = self.get_response(
+                "create", data, "title,host.name,invites.sender.name"
+            )
+        self.assertEqual({"title": "bar", "host": {"name": "foo"}}, response.data)
+        self.assertEqual("invites.sender.name", response["X-Pruned-Fields"])
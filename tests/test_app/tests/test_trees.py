@@ -0,0 +1,67 @@
+from drf_dynamics.trees import FieldTree
+from .testcases import TestCase
+
+
+class FieldTreeTestCase(TestCase):
+    def test_parse(self):
+        tree = FieldTree.parse("id,host.id,HOST.name,invites.answer.id, title")
+        self.assertEqual(
+            {
+                "id": {},
+                "title": {},
+                "host": {"id": {}, "name": {}},
+                "invites": {"answer": {"id": {}}},
+            },
+            tree,
+        )
+
+    def test_normalized(self):
+        tree = FieldTree.parse("id,host.name,host.id")
+        other = FieldTree.parse("host.id,id,,host.name,id")
+        self.assertEqual(tree, other)
+        self.assertEqual(hash(tree), hash(other))
+        self.assertEqual("host.id,host.name,id", str(tree))
+
+    def test_merge_parent_path(self):
+        self.assertEqual(
+            FieldTree.parse("host,host.name"), FieldTree.parse("host.name,host")
+        )
+
+    def test_immutable(self):
+        tree = FieldTree.parse("id")
+        with self.assertRaises(AttributeError):
+            tree.foo = "bar"
+        with self.assertRaises(TypeError):
+            tree["foo"] = FieldTree.empty
+
+    def test_lookup(self):
+        tree = FieldTree.parse("host.id,invites")
+        self.assertEqual({"id": {}}, tree.lookup("host"))
+        self.assertEqual({}, tree.lookup("host.id"))
+        self.assertEqual({}, tree.lookup(("invites", "answer", "id")))
+        self.assertIsNone(tree.lookup("host.name"))
+        self.assertIsNone(tree.lookup("title"))
+
+    def test_is_pk_only(self):
+        tree = FieldTree.parse("host.id,invites.id,invites.text")
+        self.assertTrue(tree["host"].is_pk_only())
+        self.assertFalse(tree["invites"].is_pk_only())
+        self.assertFalse(tree["host"].is_pk_only("pk"))
+
+    def test_limit(self):
+        tree = FieldTree.parse("id,invites[:5].id,invites[:2].sender.name")
+        self.assertEqual(5, tree["invites"].limit)
+        self.assertIsNone(tree["invites"]["sender"].limit)
+        self.assertEqual("id,invites[:5].id,invites[:5].sender.name", str(tree))
+        self.assertEqual(tree, FieldTree.parse(str(tree)))
+        self.assertNotEqual(tree, FieldTree.parse("id,invites.id,invites.sender.name"))
+        # A field requested without a limit as well isn't limited.
+        self.assertIsNone(FieldTree.parse("invites,invites[:5].id")["invites"].limit)
+        # The rest of the path after a malformed segment is ignored.
+        self.assertEqual("host.name", str(FieldTree.parse("invites[5].id,host.name")))
+        # The limits are capped.
+        self.assertEqual(
+            FieldTree.max_limit,
+            FieldTree.parse(f"invites[:{'9' * 5000}]")["invites"].limit,
+        )
+        self.assertEqual(7, FieldTree.parse("invites[:007]")["invites"].limit)